@@ -0,0 +1,74 @@
+"""Add PhotometryIngestJob table
+
+Revision ID: 4e1a7f0b2c6d
+Revises: c496222be5c6
+Create Date: 2020-12-14 10:21:37.418263
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '4e1a7f0b2c6d'
+down_revision = 'c496222be5c6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'photometryingestjobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('modified', sa.DateTime(), nullable=False),
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.Column(
+            'status',
+            sa.Enum(
+                'pending',
+                'running',
+                'complete',
+                'failed',
+                name='photometry_ingest_job_status',
+            ),
+            nullable=False,
+        ),
+        sa.Column('group_ids', postgresql.ARRAY(sa.Integer()), nullable=False),
+        sa.Column('upload_id', sa.String(), nullable=False),
+        sa.Column('spool_path', sa.String(), nullable=False),
+        sa.Column('claimed_by', sa.String(), nullable=True),
+        sa.Column('n_rows', sa.Integer(), nullable=True),
+        sa.Column('n_accepted', sa.Integer(), nullable=False),
+        sa.Column('n_duplicated', sa.Integer(), nullable=False),
+        sa.Column('n_rejected', sa.Integer(), nullable=False),
+        sa.Column('photometry_ids', postgresql.ARRAY(sa.Integer()), nullable=True),
+        sa.Column('errors', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        op.f('ix_photometryingestjobs_owner_id'),
+        'photometryingestjobs',
+        ['owner_id'],
+        unique=False,
+    )
+    op.create_index(
+        op.f('ix_photometryingestjobs_status'),
+        'photometryingestjobs',
+        ['status'],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index(
+        op.f('ix_photometryingestjobs_status'), table_name='photometryingestjobs'
+    )
+    op.drop_index(
+        op.f('ix_photometryingestjobs_owner_id'), table_name='photometryingestjobs'
+    )
+    op.drop_table('photometryingestjobs')
+    op.execute("DROP TYPE photometry_ingest_job_status")
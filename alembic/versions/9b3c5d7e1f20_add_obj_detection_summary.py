@@ -0,0 +1,146 @@
+"""Add detection summary columns to Obj
+
+Revision ID: 9b3c5d7e1f20
+Revises: 4e1a7f0b2c6d
+Create Date: 2020-12-16 14:02:11.905127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '9b3c5d7e1f20'
+down_revision = '4e1a7f0b2c6d'
+branch_labels = None
+depends_on = None
+
+CHUNK_SIZE = 10000
+
+
+def summarize_detections(obj_ids):
+    """Return an UPDATE statement setting the detection summaries of the
+    Objs with IDs `obj_ids` from their photometry. Objs without detections
+    are left untouched."""
+    objs = sa.table(
+        'objs',
+        sa.column('id', sa.String),
+        sa.column('first_detected_mjd', sa.Float),
+        sa.column('last_detected_mjd', sa.Float),
+        sa.column('num_detections', sa.Integer),
+        sa.column('peak_detection_flux', postgresql.JSONB),
+    )
+    photometry = sa.table(
+        'photometry',
+        sa.column('obj_id', sa.String),
+        sa.column('filter', sa.String),
+        sa.column('mjd', sa.Float),
+        sa.column('flux', sa.Float),
+        sa.column('fluxerr', sa.Float),
+    )
+    detections = (
+        sa.select(
+            [
+                photometry.c.obj_id,
+                sa.cast(photometry.c.filter, sa.String).label('filter'),
+                photometry.c.mjd,
+                photometry.c.flux,
+            ]
+        )
+        .where(photometry.c.obj_id.in_(obj_ids))
+        .where(photometry.c.flux / photometry.c.fluxerr > 5.0)
+        .alias('detections')
+    )
+    summaries = (
+        sa.select(
+            [
+                detections.c.obj_id,
+                sa.func.min(detections.c.mjd).label('first_detected_mjd'),
+                sa.func.max(detections.c.mjd).label('last_detected_mjd'),
+                sa.func.count().label('num_detections'),
+            ]
+        )
+        .group_by(detections.c.obj_id)
+        .alias('summaries')
+    )
+    band_peaks = (
+        sa.select(
+            [
+                detections.c.obj_id,
+                detections.c.filter,
+                sa.func.max(detections.c.flux).label('flux'),
+            ]
+        )
+        .group_by(detections.c.obj_id, detections.c.filter)
+        .alias('band_peaks')
+    )
+    peaks = (
+        sa.select(
+            [
+                band_peaks.c.obj_id,
+                sa.func.jsonb_object_agg(band_peaks.c.filter, band_peaks.c.flux).label(
+                    'peak_detection_flux'
+                ),
+            ]
+        )
+        .group_by(band_peaks.c.obj_id)
+        .alias('peaks')
+    )
+    return (
+        objs.update()
+        .where(objs.c.id == summaries.c.obj_id)
+        .where(objs.c.id == peaks.c.obj_id)
+        .values(
+            first_detected_mjd=summaries.c.first_detected_mjd,
+            last_detected_mjd=summaries.c.last_detected_mjd,
+            num_detections=summaries.c.num_detections,
+            peak_detection_flux=peaks.c.peak_detection_flux,
+        )
+    )
+
+
+def upgrade():
+    op.add_column('objs', sa.Column('first_detected_mjd', sa.Float(), nullable=True))
+    op.add_column('objs', sa.Column('last_detected_mjd', sa.Float(), nullable=True))
+    op.add_column(
+        'objs',
+        sa.Column('num_detections', sa.Integer(), server_default='0', nullable=False),
+    )
+    op.add_column(
+        'objs',
+        sa.Column(
+            'peak_detection_flux',
+            postgresql.JSONB(astext_type=sa.Text()),
+            nullable=True,
+        ),
+    )
+
+    # Summarize the photometry of existing objects in chunks, in order of ID
+    objs = sa.table('objs', sa.column('id', sa.String))
+    connection = op.get_bind()
+    last_id = None
+    while True:
+        q = sa.select([objs.c.id]).order_by(objs.c.id).limit(CHUNK_SIZE)
+        if last_id is not None:
+            q = q.where(objs.c.id > last_id)
+        obj_ids = [obj_id for obj_id, in connection.execute(q)]
+        if not obj_ids:
+            break
+        connection.execute(summarize_detections(obj_ids))
+        last_id = obj_ids[-1]
+
+    op.create_index(
+        'objs_last_detected_mjd_index',
+        'objs',
+        [sa.text('last_detected_mjd DESC NULLS LAST')],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index('objs_last_detected_mjd_index', table_name='objs')
+    op.drop_column('objs', 'peak_detection_flux')
+    op.drop_column('objs', 'num_detections')
+    op.drop_column('objs', 'last_detected_mjd')
+    op.drop_column('objs', 'first_detected_mjd')
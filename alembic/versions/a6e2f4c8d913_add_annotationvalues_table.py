@@ -0,0 +1,107 @@
+"""Add AnnotationValue table
+
+Revision ID: a6e2f4c8d913
+Revises: 9b3c5d7e1f20
+Create Date: 2020-12-17 11:48:52.130671
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6e2f4c8d913'
+down_revision = '9b3c5d7e1f20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'annotationvalues',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('modified', sa.DateTime(), nullable=False),
+        sa.Column('annotation_id', sa.Integer(), nullable=False),
+        sa.Column('obj_id', sa.String(), nullable=False),
+        sa.Column('origin', sa.String(), nullable=False),
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('numeric_value', sa.Float(), nullable=True),
+        sa.Column('bool_value', sa.Boolean(), nullable=True),
+        sa.Column('text_value', sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ['annotation_id'], ['annotations.id'], ondelete='CASCADE'
+        ),
+        sa.ForeignKeyConstraint(['obj_id'], ['objs.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        op.f('ix_annotationvalues_annotation_id'),
+        'annotationvalues',
+        ['annotation_id'],
+        unique=False,
+    )
+    op.create_index(
+        op.f('ix_annotationvalues_obj_id'),
+        'annotationvalues',
+        ['obj_id'],
+        unique=False,
+    )
+
+    # Index the values of the existing annotations, in the same way as
+    # skyportal.models.annotation_value_rows
+    op.execute(
+        """
+        INSERT INTO annotationvalues (
+            created_at, modified, annotation_id, obj_id, origin, key,
+            numeric_value, bool_value, text_value
+        )
+        SELECT
+            now() AT TIME ZONE 'UTC',
+            now() AT TIME ZONE 'UTC',
+            annotations.id,
+            annotations.obj_id,
+            annotations.origin,
+            items.key,
+            CASE WHEN jsonb_typeof(items.value) = 'number'
+                THEN (items.value #>> '{}')::float END,
+            CASE WHEN jsonb_typeof(items.value) = 'boolean'
+                THEN (items.value #>> '{}')::boolean END,
+            CASE WHEN length(items.value #>> '{}') <= 1024
+                THEN items.value #>> '{}' END
+        FROM annotations
+        CROSS JOIN LATERAL jsonb_each(annotations.data) AS items
+        WHERE jsonb_typeof(annotations.data) = 'object'
+        AND jsonb_typeof(items.value) != 'null'
+        """
+    )
+
+    op.create_index(
+        'annotation_values_numeric_index',
+        'annotationvalues',
+        ['origin', 'key', 'numeric_value'],
+        unique=False,
+    )
+    op.create_index(
+        'annotation_values_bool_index',
+        'annotationvalues',
+        ['origin', 'key', 'bool_value'],
+        unique=False,
+    )
+    op.create_index(
+        'annotation_values_text_index',
+        'annotationvalues',
+        ['origin', 'key', 'text_value'],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index('annotation_values_text_index', table_name='annotationvalues')
+    op.drop_index('annotation_values_bool_index', table_name='annotationvalues')
+    op.drop_index('annotation_values_numeric_index', table_name='annotationvalues')
+    op.drop_index(op.f('ix_annotationvalues_obj_id'), table_name='annotationvalues')
+    op.drop_index(
+        op.f('ix_annotationvalues_annotation_id'), table_name='annotationvalues'
+    )
+    op.drop_table('annotationvalues')
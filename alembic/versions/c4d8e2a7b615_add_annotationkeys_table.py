@@ -0,0 +1,65 @@
+"""Add AnnotationKey table
+
+Revision ID: c4d8e2a7b615
+Revises: a6e2f4c8d913
+Create Date: 2020-12-18 09:21:37.408112
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d8e2a7b615'
+down_revision = 'a6e2f4c8d913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'annotationkeys',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('modified', sa.DateTime(), nullable=False),
+        sa.Column('group_id', sa.Integer(), nullable=False),
+        sa.Column('origin', sa.String(), nullable=False),
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('type', sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(['group_id'], ['groups.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('group_id', 'origin', 'key', 'type'),
+    )
+    op.create_index(
+        op.f('ix_annotationkeys_group_id'),
+        'annotationkeys',
+        ['group_id'],
+        unique=False,
+    )
+
+    # Catalogue the keys of the existing annotations, in the same way as
+    # skyportal.models.index_annotation_values
+    op.execute(
+        """
+        INSERT INTO annotationkeys (
+            created_at, modified, group_id, origin, key, type
+        )
+        SELECT DISTINCT
+            now() AT TIME ZONE 'UTC',
+            now() AT TIME ZONE 'UTC',
+            group_annotations.group_id,
+            annotations.origin,
+            items.key,
+            jsonb_typeof(items.value)
+        FROM annotations
+        JOIN group_annotations
+            ON group_annotations.annotation_id = annotations.id
+        CROSS JOIN LATERAL jsonb_each(annotations.data) AS items
+        WHERE jsonb_typeof(annotations.data) = 'object'
+        """
+    )
+
+
+def downgrade():
+    op.drop_index(op.f('ix_annotationkeys_group_id'), table_name='annotationkeys')
+    op.drop_table('annotationkeys')
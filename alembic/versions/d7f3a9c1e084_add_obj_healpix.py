@@ -0,0 +1,123 @@
+"""Add HEALPix index to Obj
+
+Revision ID: d7f3a9c1e084
+Revises: c4d8e2a7b615
+Create Date: 2020-12-18 15:40:02.663194
+
+"""
+from alembic import op
+import numpy as np
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7f3a9c1e084'
+down_revision = 'c4d8e2a7b615'
+branch_labels = None
+depends_on = None
+
+CHUNK_SIZE = 10000
+
+# The pixelization of this revision, copied from skyportal.utils.healpix so
+# that the migration does not change along with the application
+HEALPIX_ORDER = 29
+
+
+def _spread_bits(x):
+    x = x.astype(np.uint64)
+    x = (x | (x << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    x = (x | (x << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    x = (x | (x << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    x = (x | (x << np.uint64(2))) & np.uint64(0x3333333333333333)
+    x = (x | (x << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return x
+
+
+def ang2pix(ra, dec, order=HEALPIX_ORDER):
+    """Return the NESTED HEALPix pixel numbers of order `order` of sky
+    positions given in degrees."""
+    ra, dec = np.broadcast_arrays(
+        np.asarray(ra, dtype=float), np.asarray(dec, dtype=float)
+    )
+    nside = 1 << order
+    z = np.sin(np.deg2rad(dec))
+    za = np.abs(z)
+    tt = np.mod(ra, 360.0) / 90.0  # in [0, 4)
+    tt = np.where(tt >= 4.0, 0.0, tt)
+
+    # Equatorial region
+    temp1 = nside * (0.5 + tt)
+    temp2 = nside * z * 0.75
+    jp = (temp1 - temp2).astype(np.int64)
+    jm = (temp1 + temp2).astype(np.int64)
+    ifp = jp >> order
+    ifm = jm >> order
+    face_eq = np.where(ifp == ifm, ifp | 4, np.where(ifp < ifm, ifp, ifm + 8))
+    ix_eq = jm & (nside - 1)
+    iy_eq = nside - (jp & (nside - 1)) - 1
+
+    # Polar caps
+    ntt = np.minimum(tt.astype(np.int64), 3)
+    tp = tt - ntt
+    tmp = nside * np.cos(np.deg2rad(dec)) * np.sqrt(3.0 / (1.0 + za))
+    jp_pol = np.minimum((tp * tmp).astype(np.int64), nside - 1)
+    jm_pol = np.minimum(((1.0 - tp) * tmp).astype(np.int64), nside - 1)
+    north = z >= 0
+    face_pol = np.where(north, ntt, ntt + 8)
+    ix_pol = np.where(north, nside - jm_pol - 1, jp_pol)
+    iy_pol = np.where(north, nside - jp_pol - 1, jm_pol)
+
+    equatorial = za <= 2.0 / 3.0
+    face = np.where(equatorial, face_eq, face_pol)
+    ix = np.where(equatorial, ix_eq, ix_pol)
+    iy = np.where(equatorial, iy_eq, iy_pol)
+
+    return (face.astype(np.int64) << (2 * order)) + (
+        _spread_bits(ix) | (_spread_bits(iy) << np.uint64(1))
+    ).astype(np.int64)
+
+
+def upgrade():
+    op.add_column('objs', sa.Column('healpix', sa.BigInteger(), nullable=True))
+
+    # Compute the pixel numbers of existing objects in chunks, in order of ID
+    objs = sa.table(
+        'objs',
+        sa.column('id', sa.String),
+        sa.column('ra', sa.Float),
+        sa.column('dec', sa.Float),
+        sa.column('healpix', sa.BigInteger),
+    )
+    connection = op.get_bind()
+    last_id = None
+    while True:
+        q = (
+            sa.select([objs.c.id, objs.c.ra, objs.c.dec])
+            .where(objs.c.ra.isnot(None))
+            .where(objs.c.dec.isnot(None))
+            .order_by(objs.c.id)
+            .limit(CHUNK_SIZE)
+        )
+        if last_id is not None:
+            q = q.where(objs.c.id > last_id)
+        rows = connection.execute(q).fetchall()
+        if not rows:
+            break
+        obj_ids, ras, decs = zip(*rows)
+        connection.execute(
+            objs.update()
+            .where(objs.c.id == sa.bindparam('obj_id'))
+            .values(healpix=sa.bindparam('pix')),
+            [
+                {'obj_id': obj_id, 'pix': int(pix)}
+                for obj_id, pix in zip(obj_ids, ang2pix(ras, decs))
+            ],
+        )
+        last_id = obj_ids[-1]
+
+    op.create_index(op.f('ix_objs_healpix'), 'objs', ['healpix'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_objs_healpix'), table_name='objs')
+    op.drop_column('objs', 'healpix')
@@ -0,0 +1,176 @@
+"""Add derived quantity columns to Obj
+
+Revision ID: e1b5c7d9f203
+Revises: d7f3a9c1e084
+Create Date: 2020-12-21 10:12:47.318520
+
+"""
+from alembic import op
+import numpy as np
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSONB
+from astropy import coordinates as ap_coord
+from astropy import units as u
+from astropy.cosmology import FlatLambdaCDM
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1b5c7d9f203'
+down_revision = 'd7f3a9c1e084'
+branch_labels = None
+depends_on = None
+
+CHUNK_SIZE = 10000
+
+# The quantities and formulas of this revision, copied from
+# skyportal.utils.derived_quantities so that the migration does not change
+# along with the application. Distances are computed in the default
+# cosmology (Planck18_arXiv_v2); the quantities of an object are recomputed
+# in the configured cosmology whenever it is saved.
+DERIVED_QUANTITIES = (
+    'gal_lon',
+    'gal_lat',
+    'luminosity_distance',
+    'dm',
+    'angular_diameter_distance',
+)
+COSMOLOGY = FlatLambdaCDM(
+    H0=67.66,
+    Om0=0.30966,
+    Tcmb0=2.7255,
+    Neff=3.046,
+    m_nu=u.Quantity([0.0, 0.0, 0.06], u.eV),
+    Ob0=0.04897,
+    name='Planck18_arXiv_v2',
+)
+HUBBLE_FLOW_MIN_REDSHIFT = 350 / 2.99e5
+
+
+def altdata_luminosity_distance(altdata):
+    """Return the luminosity distance in Mpc given in `altdata`, or None."""
+    if not altdata:
+        return None
+    try:
+        if altdata.get("dm") is not None:
+            return 10 ** (float(altdata.get("dm")) / 5.0) * 1e-5
+        if altdata.get("parallax") is not None:
+            if float(altdata.get("parallax")) > 0:
+                return 1e-6 / float(altdata.get("parallax"))
+        if altdata.get("dist_kpc") is not None:
+            return float(altdata.get("dist_kpc")) * 1e-3
+        if altdata.get("dist_Mpc") is not None:
+            return float(altdata.get("dist_Mpc"))
+        if altdata.get("dist_pc") is not None:
+            return float(altdata.get("dist_pc")) * 1e-6
+        if altdata.get("dist_cm") is not None:
+            return float(altdata.get("dist_cm")) / 3.085e18
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+def derived_quantities(ra, dec, redshift, altdata):
+    """Return the derived quantities of objects, as a list of dicts."""
+    n = len(altdata)
+    ra = np.array([np.nan if v is None else v for v in ra], dtype=float)
+    dec = np.array([np.nan if v is None else v for v in dec], dtype=float)
+    redshift = np.array([np.nan if v is None else v for v in redshift], dtype=float)
+
+    gal_lon = np.full(n, np.nan)
+    gal_lat = np.full(n, np.nan)
+    has_position = np.isfinite(ra) & np.isfinite(dec)
+    if has_position.any():
+        galactic = ap_coord.SkyCoord(
+            ra[has_position], dec[has_position], unit="deg"
+        ).galactic
+        gal_lon[has_position] = galactic.l.deg
+        gal_lat[has_position] = galactic.b.deg
+
+    d_l = np.array(
+        [altdata_luminosity_distance(a) for a in altdata], dtype=float
+    ).reshape(n)
+    in_hubble_flow = np.isfinite(redshift) & (redshift >= HUBBLE_FLOW_MIN_REDSHIFT)
+    from_redshift = np.isnan(d_l) & in_hubble_flow
+    if from_redshift.any():
+        d_l[from_redshift] = (
+            COSMOLOGY.luminosity_distance(redshift[from_redshift]).to(u.Mpc).value
+        )
+
+    has_distance = np.isfinite(d_l) & (d_l > 0)
+    dm = np.full(n, np.nan)
+    dm[has_distance] = 5.0 * np.log10(d_l[has_distance] * 1e5)
+    d_a = np.where(
+        in_hubble_flow, d_l / (1 + np.where(in_hubble_flow, redshift, 0)) ** 2, d_l,
+    )
+    d_a[~has_distance] = np.nan
+
+    columns = {
+        'gal_lon': gal_lon,
+        'gal_lat': gal_lat,
+        'luminosity_distance': d_l,
+        'dm': dm,
+        'angular_diameter_distance': d_a,
+    }
+    columns = {
+        key: [None if np.isnan(v) else v for v in values.tolist()]
+        for key, values in columns.items()
+    }
+    return [{key: columns[key][i] for key in DERIVED_QUANTITIES} for i in range(n)]
+
+
+def upgrade():
+    for column in DERIVED_QUANTITIES:
+        op.add_column('objs', sa.Column(column, sa.Float(), nullable=True))
+
+    # Compute the quantities of existing objects in chunks, in order of ID,
+    # with one vectorized computation per chunk
+    objs = sa.table(
+        'objs',
+        sa.column('id', sa.String),
+        sa.column('ra', sa.Float),
+        sa.column('dec', sa.Float),
+        sa.column('redshift', sa.Float),
+        sa.column('altdata', JSONB),
+        *[sa.column(column, sa.Float) for column in DERIVED_QUANTITIES],
+    )
+    connection = op.get_bind()
+    last_id = None
+    while True:
+        q = (
+            sa.select(
+                [objs.c.id, objs.c.ra, objs.c.dec, objs.c.redshift, objs.c.altdata]
+            )
+            .order_by(objs.c.id)
+            .limit(CHUNK_SIZE)
+        )
+        if last_id is not None:
+            q = q.where(objs.c.id > last_id)
+        rows = connection.execute(q).fetchall()
+        if not rows:
+            break
+        obj_ids, ras, decs, redshifts, altdata = zip(*rows)
+        quantities = derived_quantities(ras, decs, redshifts, altdata)
+        connection.execute(
+            objs.update()
+            .where(objs.c.id == sa.bindparam('obj_id'))
+            .values(
+                {column: sa.bindparam(f'new_{column}') for column in DERIVED_QUANTITIES}
+            ),
+            [
+                {
+                    'obj_id': obj_id,
+                    **{f'new_{column}': value for column, value in values.items()},
+                }
+                for obj_id, values in zip(obj_ids, quantities)
+            ],
+        )
+        last_id = obj_ids[-1]
+
+    for column in DERIVED_QUANTITIES:
+        op.create_index(op.f(f'ix_objs_{column}'), 'objs', [column], unique=False)
+
+
+def downgrade():
+    for column in DERIVED_QUANTITIES:
+        op.drop_index(op.f(f'ix_objs_{column}'), table_name='objs')
+        op.drop_column('objs', column)
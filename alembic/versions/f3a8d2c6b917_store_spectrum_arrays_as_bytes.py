@@ -0,0 +1,90 @@
+"""Store spectrum arrays as raw bytes
+
+Revision ID: f3a8d2c6b917
+Revises: e1b5c7d9f203
+Create Date: 2020-12-22 14:03:51.907215
+
+"""
+from alembic import op
+import numpy as np
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql as psql
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a8d2c6b917'
+down_revision = 'e1b5c7d9f203'
+branch_labels = None
+depends_on = None
+
+CHUNK_SIZE = 100
+
+COLUMNS = {'wavelengths': False, 'fluxes': False, 'errors': True}  # nullable
+
+
+def convert(old_type, new_type, encode):
+    """Copy the spectrum arrays into new columns of type `new_type`,
+    converting them with `encode`, in chunks of spectra in order of ID, then
+    replace the old columns with the new ones."""
+    for column in COLUMNS:
+        op.add_column('spectra', sa.Column(f'new_{column}', new_type, nullable=True))
+
+    spectra = sa.table(
+        'spectra',
+        sa.column('id', sa.Integer),
+        *[sa.column(column, old_type) for column in COLUMNS],
+        *[sa.column(f'new_{column}', new_type) for column in COLUMNS],
+    )
+    connection = op.get_bind()
+    last_id = None
+    while True:
+        q = (
+            sa.select([spectra.c.id, *[spectra.c[column] for column in COLUMNS]])
+            .order_by(spectra.c.id)
+            .limit(CHUNK_SIZE)
+        )
+        if last_id is not None:
+            q = q.where(spectra.c.id > last_id)
+        rows = connection.execute(q).fetchall()
+        if not rows:
+            break
+        connection.execute(
+            spectra.update()
+            .where(spectra.c.id == sa.bindparam('spectrum_id'))
+            .values(
+                {f'new_{column}': sa.bindparam(f'value_{column}') for column in COLUMNS}
+            ),
+            [
+                {
+                    'spectrum_id': row[0],
+                    **{
+                        f'value_{column}': None if value is None else encode(value)
+                        for column, value in zip(COLUMNS, row[1:])
+                    },
+                }
+                for row in rows
+            ],
+        )
+        last_id = rows[-1][0]
+
+    for column, nullable in COLUMNS.items():
+        op.drop_column('spectra', column)
+        op.alter_column(
+            'spectra', f'new_{column}', new_column_name=column, nullable=nullable
+        )
+
+
+def upgrade():
+    convert(
+        psql.ARRAY(sa.Float),
+        sa.LargeBinary(),
+        lambda value: np.asarray(value, dtype='<f8').tobytes(),
+    )
+
+
+def downgrade():
+    convert(
+        sa.LargeBinary(),
+        psql.ARRAY(sa.Float),
+        lambda value: np.frombuffer(value, dtype='<f8').tolist(),
+    )
@@ -1,37 +1,143 @@
 #!/usr/bin/env python
+"""Delete the candidates that were never saved as sources once they are older
+than `misc.days_to_keep_unsaved_candidates` days. Objects are purged in
+chunks, oldest first, with a commit per chunk, so that locks are held
+briefly and an interrupted run can be picked up again with --after.
+"""
 
+import argparse
 import datetime
-from skyportal.models import init_db, Candidate, Source, Obj, DBSession
+import os
+import time
+
+import sqlalchemy as sa
+from sqlalchemy import tuple_
+
+from skyportal.models import init_db, Candidate, Source, Obj, Thumbnail, DBSession
 from baselayer.app.env import load_env
 
 
-env, cfg = load_env()
-init_db(**cfg["database"])
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument(
+    '--chunk-size', type=int, default=500, help='Number of objects per chunk'
+)
+parser.add_argument(
+    '--time-budget',
+    type=float,
+    default=None,
+    help='Stop starting new chunks after this many seconds',
+)
+parser.add_argument(
+    '--after', default=None, help='Only purge objects created after this ISO timestamp',
+)
+parser.add_argument(
+    '--dry-run',
+    action='store_true',
+    help='Only count the objects that would be deleted',
+)
+
 
-try:
-    n_days = int(cfg["misc.days_to_keep_unsaved_candidates"])
-except ValueError:
-    raise ValueError(
-        "Invalid (non-integer) value provided for "
-        "days_to_keep_unsaved_candidates in config file."
+def purgeable_objs(cutoff_datetime):
+    """Return a query for the IDs and creation times of the unsaved
+    candidates created no later than `cutoff_datetime`."""
+    return (
+        DBSession()
+        .query(Obj.id, Obj.created_at)
+        .filter(sa.exists().where(Candidate.obj_id == Obj.id))
+        .filter(~sa.exists().where(Source.obj_id == Obj.id))
+        .filter(Obj.created_at <= cutoff_datetime)
     )
 
-if not 1 <= n_days <= 30:
-    raise ValueError(
-        "days_to_keep_unsaved_candidates must be an integer between 1 and 30"
-    )
 
-cutoff_datetime = datetime.datetime.now() - datetime.timedelta(days=n_days)
+def remove_files(file_uris):
+    n_removed = 0
+    for file_uri in file_uris:
+        try:
+            os.remove(file_uri)
+            n_removed += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Could not remove thumbnail {file_uri}: {e}")
+    return n_removed
 
-n_deleted = (
-    DBSession()
-    .query(Obj)
-    .filter(Obj.id.in_(DBSession.query(Candidate.obj_id)))
-    .filter(Obj.id.notin_(DBSession.query(Source.obj_id)))
-    .filter(Obj.created_at <= cutoff_datetime)
-    .delete(synchronize_session='fetch')
-)
 
-DBSession.commit()
+if __name__ == "__main__":
+    args, _ = parser.parse_known_args()
+
+    env, cfg = load_env()
+    init_db(**cfg["database"])
 
-print(f"Deleted {n_deleted} unsaved candidates.")
+    try:
+        n_days = int(cfg["misc.days_to_keep_unsaved_candidates"])
+    except ValueError:
+        raise ValueError(
+            "Invalid (non-integer) value provided for "
+            "days_to_keep_unsaved_candidates in config file."
+        )
+
+    if not 1 <= n_days <= 30:
+        raise ValueError(
+            "days_to_keep_unsaved_candidates must be an integer between 1 and 30"
+        )
+
+    cutoff_datetime = datetime.datetime.now() - datetime.timedelta(days=n_days)
+
+    if args.dry_run:
+        n_purgeable = purgeable_objs(cutoff_datetime).count()
+        print(f"{n_purgeable} unsaved candidates would be deleted.")
+        raise SystemExit
+
+    # Objects are visited in order of (created_at, id), and each chunk
+    # resumes after the last object of the previous one
+    last = None
+    if args.after is not None:
+        last = (datetime.datetime.fromisoformat(args.after), '')
+
+    n_deleted = 0
+    n_files = 0
+    start = time.time()
+    while args.time_budget is None or time.time() - start < args.time_budget:
+        q = purgeable_objs(cutoff_datetime)
+        if last is not None:
+            q = q.filter(tuple_(Obj.created_at, Obj.id) > last)
+        chunk = q.order_by(Obj.created_at, Obj.id).limit(args.chunk_size).all()
+        if not chunk:
+            break
+        last = tuple(chunk[-1])
+        obj_ids = [obj_id for obj_id, _ in chunk]
+
+        thumbnail_files = (
+            DBSession()
+            .query(Thumbnail.obj_id, Thumbnail.file_uri)
+            .filter(Thumbnail.obj_id.in_(obj_ids), Thumbnail.file_uri.isnot(None))
+            .all()
+        )
+
+        # Check again that the objects have not been saved in the meantime
+        objs = Obj.__table__
+        deleted_ids = {
+            obj_id
+            for obj_id, in DBSession().execute(
+                objs.delete()
+                .where(objs.c.id.in_(obj_ids))
+                .where(~sa.exists().where(Source.obj_id == objs.c.id))
+                .returning(objs.c.id)
+            )
+        }
+        DBSession().commit()
+
+        n_files += remove_files(
+            file_uri for obj_id, file_uri in thumbnail_files if obj_id in deleted_ids
+        )
+        n_deleted += len(deleted_ids)
+        print(
+            f"Deleted {n_deleted} unsaved candidates "
+            f"({n_deleted / (time.time() - start):.0f}/s), "
+            f"last created at: {last[0].isoformat()}"
+        )
+
+    print(
+        f"Deleted {n_deleted} unsaved candidates and {n_files} thumbnail files "
+        f"in {time.time() - start:.1f}s."
+    )
@@ -11,9 +11,11 @@ from skyportal.handlers.api import (
     AllocationHandler,
     AssignmentHandler,
     CandidateHandler,
+    BulkCandidateHandler,
     ClassificationHandler,
     CommentHandler,
     CommentAttachmentHandler,
+    CrossMatchHandler,
     AnnotationHandler,
     FilterHandler,
     FollowupRequestHandler,
@@ -31,6 +33,7 @@ from skyportal.handlers.api import (
     ObservingRunHandler,
     PhotometryHandler,
     BulkDeletePhotometryHandler,
+    PhotometryIngestJobHandler,
     ObjPhotometryHandler,
     ObjClassificationHandler,
     PhotometryRangeHandler,
@@ -47,6 +50,7 @@ from skyportal.handlers.api import (
     SpectrumASCIIFileHandler,
     SpectrumASCIIFileParser,
     SpectrumRangeHandler,
+    SpectrumDataHandler,
     ObjSpectraHandler,
     StreamHandler,
     StreamUserHandler,
@@ -59,6 +63,7 @@ from skyportal.handlers.api import (
 )
 from skyportal.handlers.api.internal import (
     PlotPhotometryHandler,
+    PlotLightCurveHandler,
     PlotSpectroscopyHandler,
     SourceViewsHandler,
     SourceCountHandler,
@@ -74,6 +79,7 @@ from skyportal.handlers.api.internal import (
     EphemerisHandler,
     StandardsHandler,
 )
+from skyportal.handlers.api.photometry import recover_photometry_ingest_jobs
 
 from . import models, model_util, openapi
 
@@ -85,6 +91,7 @@ skyportal_handlers = [
     (r'/api/acls', ACLHandler),
     (r'/api/allocation(/.*)?', AllocationHandler),
     (r'/api/assignment(/.*)?', AssignmentHandler),
+    (r'/api/candidates/bulk', BulkCandidateHandler),
     (r'/api/candidates(/.*)?', CandidateHandler),
     (r'/api/classification(/[0-9]+)?', ClassificationHandler),
     (r'/api/comment(/[0-9]+)?', CommentHandler),
@@ -94,6 +101,7 @@ skyportal_handlers = [
     # load PDF files.
     (r'/api/comment(/[0-9]+)/attachment.pdf', CommentAttachmentHandler),
     (r'/api/annotation(/[0-9]+)?', AnnotationHandler),
+    (r'/api/crossmatch', CrossMatchHandler),
     (r'/api/facility', FacilityMessageHandler),
     (r'/api/filters(/.*)?', FilterHandler),
     (r'/api/followup_request(/.*)?', FollowupRequestHandler),
@@ -110,6 +118,7 @@ skyportal_handlers = [
     (r'/api/photometry(/[0-9]+)?', PhotometryHandler),
     (r'/api/sharing', SharingHandler),
     (r'/api/photometry/bulk_delete/(.*)', BulkDeletePhotometryHandler),
+    (r'/api/photometry/jobs/([0-9]+)', PhotometryIngestJobHandler),
     (r'/api/photometry/range(/.*)?', PhotometryRangeHandler),
     (r'/api/roles', RoleHandler),
     (r'/api/sources(/[0-9A-Za-z-_]+)/photometry', ObjPhotometryHandler),
@@ -125,6 +134,7 @@ skyportal_handlers = [
     (r'/api/spectrum/parse/ascii', SpectrumASCIIFileParser),
     (r'/api/spectrum/ascii(/[0-9]+)?', SpectrumASCIIFileHandler),
     (r'/api/spectrum/range(/.*)?', SpectrumRangeHandler),
+    (r'/api/spectrum/data', SpectrumDataHandler),
     (r'/api/streams(/[0-9]+)/users(/.*)?', StreamUserHandler),
     (r'/api/streams(/[0-9]+)?', StreamHandler),
     (r'/api/sysinfo', SysInfoHandler),
@@ -141,6 +151,7 @@ skyportal_handlers = [
     (r'/api/internal/source_views(/.*)?', SourceViewsHandler),
     (r'/api/internal/source_counts(/.*)?', SourceCountHandler),
     (r'/api/internal/plot/photometry/(.*)', PlotPhotometryHandler),
+    (r'/api/internal/plot/lightcurve/(.*)', PlotLightCurveHandler),
     (r'/api/internal/plot/spectroscopy/(.*)', PlotSpectroscopyHandler),
     (r'/api/internal/instrument_forms', RoboticInstrumentsHandler),
     (r'/api/internal/standards', StandardsHandler),
@@ -238,6 +249,9 @@ def make_app(cfg, baselayer_handlers, baselayer_settings, process=None, env=None
     model_util.setup_permissions()
     app.cfg = cfg
 
+    # Pick up asynchronous photometry uploads interrupted by a restart
+    recover_photometry_ingest_jobs()
+
     admin_token = model_util.provision_token()
     with open('.tokens.yaml', 'w') as f:
         f.write(f'INITIAL_ADMIN: {admin_token.id}\n')
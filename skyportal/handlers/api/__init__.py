@@ -1,8 +1,9 @@
 from .acls import ACLHandler, UserACLHandler
 from .allocation import AllocationHandler
-from .candidate import CandidateHandler
+from .candidate import CandidateHandler, BulkCandidateHandler
 from .classification import ClassificationHandler, ObjClassificationHandler
 from .comment import CommentHandler, CommentAttachmentHandler
+from .crossmatch import CrossMatchHandler
 from .annotation import AnnotationHandler
 from .filter import FilterHandler
 from .followup_request import FollowupRequestHandler, AssignmentHandler
@@ -24,6 +25,7 @@ from .photometry import (
     PhotometryHandler,
     ObjPhotometryHandler,
     BulkDeletePhotometryHandler,
+    PhotometryIngestJobHandler,
     PhotometryRangeHandler,
 )
 from .public_group import PublicGroupHandler
@@ -42,6 +44,7 @@ from .spectrum import (
     SpectrumASCIIFileParser,
     SpectrumASCIIFileHandler,
     SpectrumRangeHandler,
+    SpectrumDataHandler,
 )
 from .stream import StreamHandler, StreamUserHandler
 from .sysinfo import SysInfoHandler
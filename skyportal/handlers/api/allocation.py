@@ -55,9 +55,7 @@ class AllocationHandler(BaseHandler):
             DBSession()
             .query(Allocation)
             .filter(
-                Allocation.group_id.in_(
-                    [g.id for g in self.current_user.accessible_groups]
-                )
+                Allocation.group_id.in_(list(self.current_user.accessible_group_ids))
             )
         )
 
@@ -111,13 +111,8 @@ class AnnotationHandler(BaseHandler):
         annotation_data = data.get("data")
 
         # Ensure user/token has access to parent source
-        user_accessible_group_ids = [g.id for g in self.current_user.accessible_groups]
-        user_accessible_filter_ids = [
-            filtr.id
-            for g in self.current_user.accessible_groups
-            for filtr in g.filters
-            if g.filters is not None
-        ]
+        user_accessible_group_ids = list(self.current_user.accessible_group_ids)
+        user_accessible_filter_ids = list(self.current_user.accessible_filter_ids)
 
         if not group_ids:
             group_ids = user_accessible_group_ids
@@ -232,7 +227,7 @@ class AnnotationHandler(BaseHandler):
                     "Invalid group_ids field. Specify at least one valid group ID."
                 )
             if not all(
-                [group in self.current_user.accessible_groups for group in groups]
+                [group.id in self.current_user.accessible_group_ids for group in groups]
             ):
                 return self.error(
                     "Cannot associate an annotation with groups you are not a member of."
@@ -1,14 +1,18 @@
+import base64
 import datetime
 from copy import copy
 import re
 import json
 import ast
+from collections import defaultdict
 
 import arrow
 
-from sqlalchemy.orm import joinedload
-from sqlalchemy.sql.expression import case, func
-from sqlalchemy.types import Float, Boolean
+import sqlalchemy as sa
+from sqlalchemy import and_, tuple_
+from sqlalchemy.dialects import postgresql as psql
+from sqlalchemy.orm import aliased, joinedload
+from sqlalchemy.sql.expression import func
 from marshmallow.exceptions import ValidationError
 
 from baselayer.app.access import auth_or_token, permissions
@@ -21,9 +25,15 @@ from ...models import (
     Source,
     Filter,
     Annotation,
+    AnnotationValue,
+    ANNOTATION_VALUE_MAX_TEXT_LENGTH,
     Group,
     Classification,
+    Thumbnail,
+    compute_derived_quantities,
 )
+from ...utils.derived_quantities import DERIVED_QUANTITIES
+from ...utils.healpix import ang2pix
 
 
 def update_redshift_history_if_relevant(request_data, obj, user):
@@ -67,7 +77,7 @@ class CandidateHandler(BaseHandler):
                 application/json:
                   schema: Error
         """
-        user_group_ids = [g.id for g in self.associated_user_object.accessible_groups]
+        user_group_ids = list(self.associated_user_object.accessible_group_ids)
         num_c = (
             DBSession()
             .query(Candidate)
@@ -130,6 +140,27 @@ class CandidateHandler(BaseHandler):
             description: |
               Used only in the case of paginating query results - if provided, this
               allows for avoiding a potentially expensive query.count() call.
+          - in: query
+            name: useCursor
+            nullable: true
+            schema:
+              type: boolean
+            description: |
+              Boolean indicating whether to paginate with a cursor rather than
+              with page numbers. Candidates are then returned by descending
+              time of their latest passing of the selected filters, and the
+              response contains a `nextCursor` value to fetch the following
+              page with, which is null on the last page. Fetching a deep page
+              costs the same as fetching the first one, but no total number of
+              matches is returned. Cannot be combined with sortByAnnotationOrigin.
+          - in: query
+            name: cursor
+            nullable: true
+            schema:
+              type: string
+            description: |
+              The `nextCursor` value returned with the previous page of cursor
+              paginated results. Implies useCursor.
           - in: query
             name: unsavedOnly
             nullable: true
@@ -265,12 +296,15 @@ class CandidateHandler(BaseHandler):
                                 type: integer
                               numPerPage:
                                 type: integer
+                              nextCursor:
+                                type: string
+                                nullable: true
             400:
               content:
                 application/json:
                   schema: Error
         """
-        user_accessible_group_ids = [g.id for g in self.current_user.accessible_groups]
+        user_accessible_group_ids = list(self.current_user.accessible_group_ids)
         include_photometry = self.get_query_argument("includePhotometry", False)
 
         if obj_id is not None:
@@ -292,9 +326,7 @@ class CandidateHandler(BaseHandler):
                 .join(Filter)
                 .filter(
                     Candidate.obj_id == obj_id,
-                    Filter.group_id.in_(
-                        [g.id for g in self.current_user.accessible_groups]
-                    ),
+                    Filter.group_id.in_(list(self.current_user.accessible_group_ids)),
                 )
                 .all()
             )
@@ -339,11 +371,6 @@ class CandidateHandler(BaseHandler):
                     self.current_user
                 )
             candidate_info["last_detected"] = c.last_detected
-            candidate_info["gal_lon"] = c.gal_lon_deg
-            candidate_info["gal_lat"] = c.gal_lat_deg
-            candidate_info["luminosity_distance"] = c.luminosity_distance
-            candidate_info["dm"] = c.dm
-            candidate_info["angular_diameter_distance"] = c.angular_diameter_distance
 
             return self.success(data=candidate_info)
 
@@ -359,13 +386,11 @@ class CandidateHandler(BaseHandler):
         annotation_filter_list = self.get_query_argument("annotationFilterList", None)
         classifications = self.get_query_argument("classifications", None)
         redshift_range_str = self.get_query_argument("redshiftRange", None)
-        user_accessible_group_ids = [g.id for g in self.current_user.accessible_groups]
-        user_accessible_filter_ids = [
-            filtr.id
-            for g in self.current_user.accessible_groups
-            for filtr in g.filters
-            if g.filters is not None
-        ]
+        cursor = self.get_query_argument("cursor", None)
+        use_cursor = self.get_query_argument("useCursor", False) in ["true", True]
+        use_cursor = use_cursor or cursor is not None
+        user_accessible_group_ids = list(self.current_user.accessible_group_ids)
+        user_accessible_filter_ids = list(self.current_user.accessible_filter_ids)
         if group_ids is not None:
             if isinstance(group_ids, str) and "," in group_ids:
                 group_ids = [int(g_id) for g_id in group_ids.split(",")]
@@ -421,8 +446,7 @@ class CandidateHandler(BaseHandler):
                     .filter(Candidate.filter_id.in_(filter_ids))
                 )
             )
-            .outerjoin(Annotation)
-        )  # Join in annotations info for sort/filter
+        )
         if classifications is not None:
             if isinstance(classifications, str) and "," in classifications:
                 classifications = [c.strip() for c in classifications.split(",")]
@@ -439,7 +463,7 @@ class CandidateHandler(BaseHandler):
             # Don't apply the order by just yet. Save it so we can pass it to
             # the LIMT/OFFSET helper function down the line once other query
             # params are set.
-            order_by = [Obj.last_detected.desc().nullslast(), Obj.id]
+            order_by = [Obj.last_detected_mjd.desc().nullslast(), Obj.id]
         if unsaved_only == "true":
             q = q.filter(
                 Obj.id.notin_(
@@ -486,12 +510,12 @@ class CandidateHandler(BaseHandler):
                     )
 
                 if "origin" not in new_filter:
-                    self.error(
+                    return self.error(
                         f"Invalid annotation filter list item {item}: \"origin\" is required."
                     )
 
                 if "key" not in new_filter:
-                    self.error(
+                    return self.error(
                         f"Invalid annotation filter list item {item}: \"key\" is required."
                     )
 
@@ -499,9 +523,11 @@ class CandidateHandler(BaseHandler):
                     value = new_filter["value"]
                     if isinstance(value, bool):
                         q = q.filter(
-                            Annotation.origin == new_filter["origin"],
-                            Annotation.data[new_filter["key"]].astext.cast(Boolean)
-                            == value,
+                            annotation_value_exists(
+                                new_filter["origin"],
+                                new_filter["key"],
+                                AnnotationValue.bool_value == value,
+                            )
                         )
                     else:
                         # Test if the value is a nested object
@@ -519,18 +545,38 @@ class CandidateHandler(BaseHandler):
                             # If not, this is just a string field and we don't
                             # need the string formatting above
                             pass
-                        q = q.filter(
-                            Annotation.origin == new_filter["origin"],
-                            Annotation.data[new_filter["key"]].astext == value,
-                        )
+                        if len(value) > ANNOTATION_VALUE_MAX_TEXT_LENGTH:
+                            # Values this long are not indexed
+                            q = q.filter(
+                                Obj.id.in_(
+                                    DBSession()
+                                    .query(Annotation.obj_id)
+                                    .filter(
+                                        Annotation.origin == new_filter["origin"],
+                                        Annotation.data[new_filter["key"]].astext
+                                        == value,
+                                    )
+                                )
+                            )
+                        else:
+                            q = q.filter(
+                                annotation_value_exists(
+                                    new_filter["origin"],
+                                    new_filter["key"],
+                                    AnnotationValue.text_value == value,
+                                )
+                            )
                 elif "min" in new_filter and "max" in new_filter:
                     try:
                         min_value = float(new_filter["min"])
                         max_value = float(new_filter["max"])
                         q = q.filter(
-                            Annotation.origin == new_filter["origin"],
-                            Annotation.data[new_filter["key"]].cast(Float) >= min_value,
-                            Annotation.data[new_filter["key"]].cast(Float) <= max_value,
+                            annotation_value_exists(
+                                new_filter["origin"],
+                                new_filter["key"],
+                                AnnotationValue.numeric_value >= min_value,
+                                AnnotationValue.numeric_value <= max_value,
+                            )
                         )
                     except ValueError:
                         return self.error(
@@ -544,101 +590,83 @@ class CandidateHandler(BaseHandler):
         if sort_by_origin is not None:
             sort_by_key = self.get_query_argument("sortByAnnotationKey", None)
             sort_by_order = self.get_query_argument("sortByAnnotationOrder", None)
-            # Define a custom sort order to have annotations from the correct
-            # origin first, all others afterwards
-            origin_sort_order = case(
-                value=Annotation.origin, whens={sort_by_origin: 1}, else_=None,
+            # Join in the values of the sorted on key, if any, from the
+            # annotations of the requested origin
+            sort_values = aliased(AnnotationValue)
+            q = q.outerjoin(
+                sort_values,
+                and_(
+                    sort_values.obj_id == Obj.id,
+                    sort_values.origin == sort_by_origin,
+                    sort_values.key == sort_by_key,
+                ),
             )
-            annotation_sort_criterion = (
-                Annotation.data[sort_by_key].desc().nullslast()
+            # Sort on whichever typed column is set, as the JSONB ordering
+            # of the values would
+            annotation_sort_criteria = [
+                column.desc().nullslast()
                 if sort_by_order == "desc"
-                else Annotation.data[sort_by_key].nullslast()
-            )
+                else column.nullslast()
+                for column in (
+                    sort_values.bool_value,
+                    sort_values.numeric_value,
+                    sort_values.text_value,
+                )
+            ]
             # Don't apply the order by just yet. Save it so we can pass it to
             # the LIMT/OFFSET helper function.
             order_by = [
-                origin_sort_order.nullslast(),
-                annotation_sort_criterion,
-                Obj.last_detected.desc().nullslast(),
+                *annotation_sort_criteria,
+                Obj.last_detected_mjd.desc().nullslast(),
                 Obj.id,
             ]
-        try:
-            query_results = grab_query_results(
-                q,
-                total_matches,
-                page,
-                n_per_page,
-                "candidates",
-                order_by=order_by,
-                include_photometry=include_photometry,
+        if use_cursor:
+            if sort_by_origin is not None:
+                return self.error(
+                    "Sorting by annotation is not supported with cursor pagination."
+                )
+
+            def candidate_scope(candidate):
+                scope = [candidate.filter_id.in_(filter_ids)]
+                if isinstance(start_date, datetime.datetime):
+                    scope.append(candidate.passed_at >= start_date)
+                if isinstance(end_date, datetime.datetime):
+                    scope.append(candidate.passed_at <= end_date)
+                return scope
+
+            # Key each Obj on its latest passing of the selected filters
+            q = q.filter(*candidate_scope(Candidate)).filter(
+                latest_row_per_obj(Candidate, "passed_at", candidate_scope)
             )
-        except ValueError as e:
-            if "Page number out of range" in str(e):
-                return self.error("Page number out of range.")
-            raise
-        matching_source_ids = (
-            DBSession()
-            .query(Source.obj_id)
-            .filter(Source.group_id.in_(user_accessible_group_ids))
-            .filter(Source.obj_id.in_([obj.id for obj in query_results["candidates"]]))
-            .all()
-        )
-        candidate_list = []
-        for obj in query_results["candidates"]:
-            with DBSession().no_autoflush:
-                obj.is_source = (obj.id,) in matching_source_ids
-                if obj.is_source:
-                    obj.saved_groups = (
-                        DBSession()
-                        .query(Group)
-                        .join(Source)
-                        .filter(Source.obj_id == obj.id)
-                        .filter(Source.active.is_(True))
-                        .filter(Group.id.in_(user_accessible_group_ids))
-                        .all()
-                    )
-                    obj.classifications = obj.get_classifications_readable_by(
-                        self.current_user
-                    )
-                obj.passing_group_ids = [
-                    f.group_id
-                    for f in (
-                        DBSession()
-                        .query(Filter)
-                        .filter(Filter.id.in_(user_accessible_filter_ids))
-                        .filter(
-                            Filter.id.in_(
-                                DBSession()
-                                .query(Candidate.filter_id)
-                                .filter(Candidate.obj_id == obj.id)
-                            )
-                        )
-                        .all()
-                    )
-                ]
-                candidate_list.append(obj.to_dict())
-                candidate_list[-1]["comments"] = sorted(
-                    [
-                        cmt.to_dict()
-                        for cmt in obj.get_comments_readable_by(self.current_user)
-                    ],
-                    key=lambda x: x["created_at"],
-                    reverse=True,
+            try:
+                query_results = grab_query_results_by_cursor(
+                    q,
+                    Candidate.passed_at,
+                    cursor,
+                    n_per_page,
+                    "candidates",
+                    include_photometry=include_photometry,
                 )
-                candidate_list[-1]["annotations"] = sorted(
-                    obj.get_annotations_readable_by(self.current_user),
-                    key=lambda x: x.origin,
+            except ValueError as e:
+                return self.error(str(e))
+        else:
+            try:
+                query_results = grab_query_results(
+                    q,
+                    total_matches,
+                    page,
+                    n_per_page,
+                    "candidates",
+                    order_by=order_by,
+                    include_photometry=include_photometry,
                 )
-                candidate_list[-1]["last_detected"] = obj.last_detected
-                candidate_list[-1]["gal_lat"] = obj.gal_lat_deg
-                candidate_list[-1]["gal_lon"] = obj.gal_lon_deg
-                candidate_list[-1]["luminosity_distance"] = obj.luminosity_distance
-                candidate_list[-1]["dm"] = obj.dm
-                candidate_list[-1][
-                    "angular_diameter_distance"
-                ] = obj.angular_diameter_distance
-
-        query_results["candidates"] = candidate_list
+            except ValueError as e:
+                if "Page number out of range" in str(e):
+                    return self.error("Page number out of range.")
+                raise
+        query_results["candidates"] = assemble_candidate_list(
+            query_results["candidates"], self.current_user
+        )
         return self.success(data=query_results)
 
     @permissions(["Upload data"])
@@ -712,12 +740,7 @@ class CandidateHandler(BaseHandler):
             filter_ids = data.pop("filter_ids")
         except KeyError:
             return self.error("Missing required filter_ids parameter.")
-        user_accessible_filter_ids = [
-            filtr.id
-            for g in self.current_user.accessible_groups
-            for filtr in g.filters
-            if g.filters is not None
-        ]
+        user_accessible_filter_ids = list(self.current_user.accessible_filter_ids)
         if not all([fid in user_accessible_filter_ids for fid in filter_ids]):
             return self.error(
                 "Insufficient permissions - you must only specify "
@@ -785,6 +808,368 @@ class CandidateHandler(BaseHandler):
         return self.success()
 
 
+class BulkCandidateHandler(BaseHandler):
+    @permissions(["Upload data"])
+    def post(self):
+        """
+        ---
+        description: |
+          Create candidates for many Objs at once. Objs are created, or
+          updated with the given fields if they already exist, and the
+          candidates and the thumbnails of new Objs are saved in a single
+          transaction. Invalid items are reported in the results and do not
+          prevent the others from being saved.
+        tags:
+          - candidates
+        requestBody:
+          content:
+            application/json:
+              schema:
+                type: object
+                properties:
+                  candidates:
+                    type: array
+                    items:
+                      allOf:
+                        - $ref: '#/components/schemas/Obj'
+                        - type: object
+                          properties:
+                            filter_ids:
+                              type: array
+                              items:
+                                type: integer
+                              description: List of associated filter IDs
+                            passing_alert_id:
+                              type: integer
+                              description: ID of associated filter that created candidate
+                              nullable: true
+                            passed_at:
+                              type: string
+                              description: Arrow-parseable datetime string indicating when passed filter.
+                          required:
+                            - filter_ids
+                            - passed_at
+                required:
+                  - candidates
+        responses:
+          200:
+            content:
+              application/json:
+                schema:
+                  allOf:
+                    - $ref: '#/components/schemas/Success'
+                    - type: object
+                      properties:
+                        data:
+                          type: object
+                          properties:
+                            results:
+                              type: array
+                              description: |
+                                One result per posted candidate, in order.
+                                Each has the `obj_id` and a `status` of
+                                "success" or "error". Successful results list
+                                the `ids` of the new candidates and whether
+                                the Obj was created (`obj_created`); failed
+                                ones give the error `message`. Candidates
+                                identical to existing ones (same Obj, filter
+                                and `passed_at`) are not duplicated.
+                              items:
+                                type: object
+          400:
+            content:
+              application/json:
+                schema: Error
+        """
+        data = self.get_json()
+        items = data.get("candidates")
+        if not isinstance(items, list) or not items:
+            return self.error("`candidates` must be a non-empty list.")
+
+        try:
+            requested_filter_ids = {
+                int(fid) for item in items for fid in item.get("filter_ids") or []
+            }
+        except (AttributeError, TypeError, ValueError):
+            return self.error("Invalid `filter_ids` parameter.")
+        if not requested_filter_ids <= self.current_user.accessible_filter_ids:
+            return self.error(
+                "Insufficient permissions - you must only specify "
+                "filters that you have access to."
+            )
+        existing_filter_ids = {
+            fid
+            for fid, in DBSession()
+            .query(Filter.id)
+            .filter(Filter.id.in_(requested_filter_ids))
+        }
+
+        item_obj_ids = [
+            item.get("id") if isinstance(item.get("id"), str) else None
+            for item in items
+        ]
+        existing_objs = {
+            existing.id: existing
+            for existing in DBSession()
+            .query(
+                Obj.id,
+                Obj.ra,
+                Obj.dec,
+                Obj.redshift,
+                Obj.altdata,
+                Obj.redshift_history,
+            )
+            .filter(Obj.id.in_({obj_id for obj_id in item_obj_ids if obj_id}))
+            .with_for_update()
+        }
+
+        schema = Obj.__schema__()
+        uploader_id = self.associated_user_object.id
+        now = datetime.datetime.utcnow()
+        results = [None] * len(items)
+        obj_rows = {}
+        derived_objs = {}
+        candidate_rows = []
+
+        for index, (item, obj_id) in enumerate(zip(items, item_obj_ids)):
+            item = dict(item)
+
+            def fail(message):
+                results[index] = {
+                    "obj_id": obj_id,
+                    "status": "error",
+                    "message": message,
+                }
+
+            if obj_id is None:
+                fail("Missing required parameter: `id`.")
+                continue
+            if obj_id in obj_rows:
+                fail("Each Obj may only be posted once per request.")
+                continue
+            if obj_id not in existing_objs and (
+                item.get("ra") is None or item.get("dec") is None
+            ):
+                fail("RA and Dec must not be null for a new Obj")
+                continue
+
+            passing_alert_id = item.pop("passing_alert_id", None)
+            passed_at = item.pop("passed_at", None)
+            if passed_at is None:
+                fail("Missing required parameter: `passed_at`.")
+                continue
+            try:
+                passed_at = arrow.get(passed_at).datetime.replace(tzinfo=None)
+            except (arrow.parser.ParserError, TypeError, ValueError):
+                fail("Invalid `passed_at` parameter.")
+                continue
+            filter_ids = {int(fid) for fid in item.pop("filter_ids", None) or []}
+            if not filter_ids & existing_filter_ids:
+                fail("At least one valid filter ID must be provided.")
+                continue
+
+            try:
+                obj = schema.load(item, transient=True)
+            except ValidationError as e:
+                fail(f"Invalid/missing parameters: {e.normalized_messages()}")
+                continue
+
+            row = {column: getattr(obj, column) for column in item}
+            row["modified"] = now
+            existing = existing_objs.get(obj_id)
+            if "ra" in item or "dec" in item:
+                ra = row.get("ra", existing and existing.ra)
+                dec = row.get("dec", existing and existing.dec)
+                row["healpix"] = None if ra is None or dec is None else ang2pix(ra, dec)
+            if "redshift" in item:
+                obj.redshift_history = existing and existing.redshift_history
+                update_redshift_history_if_relevant(
+                    item, obj, self.associated_user_object
+                )
+                row["redshift_history"] = obj.redshift_history
+            if item.keys() & {"ra", "dec", "redshift", "altdata", *DERIVED_QUANTITIES}:
+                for column in ("ra", "dec", "redshift", "altdata"):
+                    if column not in item:
+                        setattr(obj, column, existing and getattr(existing, column))
+                derived_objs[obj_id] = obj
+            obj_rows[obj_id] = row
+
+            results[index] = {"obj_id": obj_id, "status": "success", "ids": []}
+            candidate_rows.extend(
+                {
+                    "obj_id": obj_id,
+                    "filter_id": fid,
+                    "passing_alert_id": passing_alert_id,
+                    "passed_at": passed_at,
+                    "uploader_id": uploader_id,
+                    "created_at": now,
+                    "modified": now,
+                }
+                for fid in sorted(filter_ids & existing_filter_ids)
+            )
+
+        # The mapper events that maintain the derived columns are bypassed
+        for obj_id, derived in zip(
+            derived_objs, compute_derived_quantities(list(derived_objs.values()))
+        ):
+            obj_rows[obj_id].update(derived)
+
+        # Upsert the Objs, one statement per set of posted fields. `xmax` is
+        # zero for the rows that were inserted rather than updated.
+        objs = Obj.__table__
+        rows_by_columns = defaultdict(list)
+        for row in obj_rows.values():
+            rows_by_columns[tuple(sorted(row))].append(row)
+        created_obj_ids = set()
+        for columns, rows in rows_by_columns.items():
+            stmt = psql.insert(objs).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[objs.c.id],
+                set_={c: stmt.excluded[c] for c in columns if c != "id"},
+            ).returning(objs.c.id, sa.literal_column("xmax = 0", sa.Boolean))
+            created_obj_ids.update(
+                obj_id for obj_id, created in DBSession().execute(stmt) if created
+            )
+
+        candidate_ids = defaultdict(list)
+        if candidate_rows:
+            candidates = Candidate.__table__
+            stmt = (
+                psql.insert(candidates)
+                .values(candidate_rows)
+                .on_conflict_do_nothing(
+                    index_elements=[
+                        candidates.c.obj_id,
+                        candidates.c.filter_id,
+                        candidates.c.passed_at,
+                    ]
+                )
+                .returning(candidates.c.id, candidates.c.obj_id)
+            )
+            for candidate_id, obj_id in DBSession().execute(stmt):
+                candidate_ids[obj_id].append(candidate_id)
+
+        thumbnail_rows = []
+        for obj_id in created_obj_ids:
+            obj = Obj(ra=obj_rows[obj_id]["ra"], dec=obj_rows[obj_id]["dec"])
+            thumbnail_rows.extend(
+                {
+                    "obj_id": obj_id,
+                    "type": thumbnail_type,
+                    "public_url": url,
+                    "created_at": now,
+                    "modified": now,
+                }
+                for thumbnail_type, url in [
+                    ("sdss", obj.sdss_url),
+                    ("dr8", obj.desi_dr8_url),
+                ]
+            )
+        if thumbnail_rows:
+            DBSession().execute(Thumbnail.__table__.insert().values(thumbnail_rows))
+
+        DBSession().commit()
+
+        for result in results:
+            if result["status"] == "success":
+                result["ids"] = sorted(candidate_ids[result["obj_id"]])
+                result["obj_created"] = result["obj_id"] in created_obj_ids
+
+        return self.success(data={"results": results})
+
+
+def annotation_value_exists(origin, key, *criteria):
+    """Return a criterion matching the Objs with an annotation from `origin`
+    whose value for `key` satisfies `criteria`, which are expressed on the
+    columns of `skyportal.models.AnnotationValue`."""
+    return (
+        sa.exists()
+        .where(AnnotationValue.obj_id == Obj.id)
+        .where(AnnotationValue.origin == origin)
+        .where(AnnotationValue.key == key)
+        .where(and_(*criteria))
+    )
+
+
+def assemble_candidate_list(objs, user_or_token):
+    """Serialize a scanning page of candidates.
+
+    Which of the accessible filters each candidate passed, which accessible
+    groups have saved it, and its comments, annotations and classifications
+    are each loaded for the whole page with a single grouped query, rather
+    than with a few queries per candidate.
+
+    Parameters
+    ----------
+    objs : list of `skyportal.models.Obj`
+        The candidates to serialize, in output order.
+    user_or_token : `baselayer.app.models.User` or `baselayer.app.models.Token`
+        The requesting User or Token.
+
+    Returns
+    -------
+    candidate_list : list of dict
+    """
+    obj_ids = [obj.id for obj in objs]
+
+    source_obj_ids = set()
+    saved_groups = defaultdict(list)
+    for obj_id, active, group in (
+        DBSession()
+        .query(Source.obj_id, Source.active, Group)
+        .join(Group, Source.group_id == Group.id)
+        .filter(Source.obj_id.in_(obj_ids))
+        .filter(Source.group_id.in_(list(user_or_token.accessible_group_ids)))
+    ):
+        source_obj_ids.add(obj_id)
+        if active:
+            saved_groups[obj_id].append(group)
+
+    passing_group_ids = defaultdict(list)
+    for obj_id, _, group_id in (
+        DBSession()
+        .query(Candidate.obj_id, Filter.id, Filter.group_id)
+        .join(Filter, Candidate.filter_id == Filter.id)
+        .filter(Candidate.obj_id.in_(obj_ids))
+        .filter(Filter.id.in_(list(user_or_token.accessible_filter_ids)))
+        .distinct()
+    ):
+        passing_group_ids[obj_id].append(group_id)
+
+    def by_obj(items):
+        grouped = defaultdict(list)
+        for item in items:
+            grouped[item.obj_id].append(item)
+        return grouped
+
+    comments = by_obj(Obj.get_comments_readable_by(obj_ids, user_or_token))
+    annotations = by_obj(Obj.get_annotations_readable_by(obj_ids, user_or_token))
+    classifications = by_obj(
+        Obj.get_classifications_readable_by(obj_ids, user_or_token)
+    )
+
+    candidate_list = []
+    for obj in objs:
+        with DBSession().no_autoflush:
+            obj.is_source = obj.id in source_obj_ids
+            if obj.is_source:
+                obj.saved_groups = saved_groups[obj.id]
+                obj.classifications = classifications[obj.id]
+            obj.passing_group_ids = passing_group_ids[obj.id]
+            candidate_info = obj.to_dict()
+        candidate_info["comments"] = sorted(
+            [cmt.to_dict() for cmt in comments[obj.id]],
+            key=lambda x: x["created_at"],
+            reverse=True,
+        )
+        candidate_info["annotations"] = sorted(
+            annotations[obj.id], key=lambda x: x.origin,
+        )
+        candidate_info["last_detected"] = obj.last_detected
+        candidate_list.append(candidate_info)
+    return candidate_list
+
+
 def grab_query_results(
     q,
     total_matches,
@@ -871,13 +1256,112 @@ def grab_query_results(
     else:
         page_ids = ordered_ids.all()
 
-    items = []
+    info[items_name] = get_objs_in_order(
+        [item_id for item_id, in page_ids], include_photometry=include_photometry
+    )
+    return info
+
+
+def get_objs_in_order(obj_ids, include_photometry=False):
+    """Load the Objs with IDs `obj_ids` with a single query, and return them
+    in the order of `obj_ids`."""
     query_options = [joinedload(Obj.thumbnails)]
     if include_photometry:
         query_options.append(
             joinedload(Obj.photometry).joinedload(Photometry.instrument)
         )
-    for item_id in page_ids:
-        items.append(Obj.query.options(query_options).get(item_id))
-    info[items_name] = items
+    objs = {
+        obj.id: obj
+        for obj in Obj.query.options(query_options).filter(Obj.id.in_(obj_ids))
+    }
+    return [objs[obj_id] for obj_id in obj_ids]
+
+
+def encode_cursor(sort_value, obj_id):
+    """Return the opaque cursor pointing after the item with sort key
+    `sort_value` (a datetime) and `obj_id`."""
+    payload = json.dumps([sort_value.isoformat(), obj_id])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Return the (sort_value, obj_id) pair encoded in `cursor`."""
+    try:
+        sort_value, obj_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.datetime.fromisoformat(sort_value), str(obj_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor.")
+
+
+def latest_row_per_obj(model, column_name, scope):
+    """Return a criterion that only keeps, for each Obj, the row of `model`
+    with the latest `column_name` among its rows satisfying `scope`.
+
+    Parameters
+    ----------
+    model : `skyportal.models.Candidate` or `skyportal.models.Source`
+        A model with an `obj_id` column.
+    column_name : str
+        Name of the column of `model` to key on.
+    scope : callable
+        Function returning the list of criteria a row of `model` (or of
+        an alias thereof, passed as its only argument) must satisfy.
+    """
+    newer = aliased(model)
+    return ~(
+        sa.exists()
+        .where(newer.obj_id == model.obj_id)
+        .where(and_(*scope(newer)))
+        .where(
+            tuple_(getattr(newer, column_name), newer.id)
+            > tuple_(getattr(model, column_name), model.id)
+        )
+    )
+
+
+def grab_query_results_by_cursor(
+    q, sort_column, cursor, n_items_per_page, items_name, include_photometry=False,
+):
+    """Return a page of the Objs matched by `q`, by descending `sort_column`.
+
+    The page is selected with a keyset condition on (`sort_column`, Obj.id)
+    rather than with an OFFSET, so it is read from the index on
+    `sort_column` whatever its depth. `q` must match at most one value of
+    `sort_column` per Obj (see `latest_row_per_obj`).
+
+    Parameters
+    ----------
+    q : `sqlalchemy.orm.Query`
+        Query for the Objs, joined to the table of `sort_column`.
+    sort_column : `sqlalchemy.Column`
+        Indexed datetime column to sort on.
+    cursor : str or None
+        Cursor returned with the previous page, or None for the first page.
+    n_items_per_page : int
+        Maximum number of Objs to return.
+    items_name : str
+        Key under which to return the Objs.
+
+    Returns
+    -------
+    info : dict
+        The Objs under `items_name`, along with `numPerPage` and the
+        `nextCursor` to pass to fetch the next page (None on the last page).
+    """
+    keys = q.enable_eagerloads(False).with_entities(sort_column, Obj.id).distinct()
+    if cursor is not None:
+        keys = keys.filter(tuple_(sort_column, Obj.id) < tuple_(*decode_cursor(cursor)))
+    rows = (
+        keys.order_by(sort_column.desc(), Obj.id.desc())
+        .limit(n_items_per_page + 1)
+        .all()
+    )
+
+    info = {"numPerPage": n_items_per_page, "nextCursor": None}
+    if len(rows) > n_items_per_page:
+        rows = rows[:n_items_per_page]
+        info["nextCursor"] = encode_cursor(*rows[-1])
+    info[items_name] = get_objs_in_order(
+        [obj_id for _, obj_id in rows], include_photometry=include_photometry
+    )
     return info
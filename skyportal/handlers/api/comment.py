@@ -97,13 +97,8 @@ class CommentHandler(BaseHandler):
 
         # Ensure user/token has access to parent source
         _ = Source.get_obj_if_readable_by(obj_id, self.current_user)
-        user_accessible_group_ids = [g.id for g in self.current_user.accessible_groups]
-        user_accessible_filter_ids = [
-            filtr.id
-            for g in self.current_user.accessible_groups
-            for filtr in g.filters
-            if g.filters is not None
-        ]
+        user_accessible_group_ids = list(self.current_user.accessible_group_ids)
+        user_accessible_filter_ids = list(self.current_user.accessible_filter_ids)
         group_ids = [int(id) for id in data.pop("group_ids", user_accessible_group_ids)]
         group_ids = set(group_ids).intersection(user_accessible_group_ids)
         if not group_ids:
@@ -246,7 +241,7 @@ class CommentHandler(BaseHandler):
                     "Invalid group_ids field. Specify at least one valid group ID."
                 )
             if not all(
-                [group in self.current_user.accessible_groups for group in groups]
+                [group.id in self.current_user.accessible_group_ids for group in groups]
             ):
                 return self.error(
                     "Cannot associate comment with groups you are not a member of."
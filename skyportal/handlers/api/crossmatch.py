@@ -0,0 +1,175 @@
+import numpy as np
+import sqlalchemy as sa
+import healpix_alchemy as ha
+
+from baselayer.app.access import auth_or_token
+from ..base import BaseHandler
+from ...models import DBSession, Obj, Source, Candidate
+from ...utils.healpix import angular_distance, cone_ranges
+
+
+MAX_POSITIONS = 10000
+MAX_RADIUS = 1.0  # degrees
+
+
+class CrossMatchHandler(BaseHandler):
+    @auth_or_token
+    def post(self):
+        """
+        ---
+        description: |
+          Find the accessible objects (sources saved to one of the user's
+          groups, or candidates that passed one of the user's filters) within
+          a given radius of each of many positions, with a single query.
+        tags:
+          - sources
+          - candidates
+        requestBody:
+          content:
+            application/json:
+              schema:
+                type: object
+                properties:
+                  positions:
+                    type: array
+                    items:
+                      type: object
+                      properties:
+                        ra:
+                          type: number
+                          description: Right ascension, in degrees.
+                        dec:
+                          type: number
+                          description: Declination, in degrees.
+                        radius:
+                          type: number
+                          description: Match radius, in degrees (at most 1).
+                      required:
+                        - ra
+                        - dec
+                        - radius
+                required:
+                  - positions
+        responses:
+          200:
+            content:
+              application/json:
+                schema:
+                  allOf:
+                    - $ref: '#/components/schemas/Success'
+                    - type: object
+                      properties:
+                        data:
+                          type: object
+                          properties:
+                            matches:
+                              type: array
+                              description: |
+                                For each position, in order, the matching
+                                objects sorted by separation, each with its
+                                `id`, `ra`, `dec` and `separation` (in
+                                degrees).
+                              items:
+                                type: array
+                                items:
+                                  type: object
+          400:
+            content:
+              application/json:
+                schema: Error
+        """
+        data = self.get_json()
+        positions = data.get("positions")
+        if not isinstance(positions, list) or not positions:
+            return self.error("`positions` must be a non-empty list.")
+        if len(positions) > MAX_POSITIONS:
+            return self.error(f"At most {MAX_POSITIONS} positions may be given.")
+        try:
+            positions = np.array(
+                [[p["ra"], p["dec"], p["radius"]] for p in positions], dtype=float
+            )
+        except (KeyError, TypeError, ValueError):
+            return self.error(
+                "Each position must have numerical `ra`, `dec` and `radius` values."
+            )
+        ra, dec, radius = positions.T
+        if not (
+            np.isfinite(positions).all()
+            and (np.abs(dec) <= 90).all()
+            and ((radius > 0) & (radius <= MAX_RADIUS)).all()
+        ):
+            return self.error(
+                "Invalid position: `dec` must be within [-90, 90] and `radius` "
+                f"within (0, {MAX_RADIUS}] degrees."
+            )
+
+        # One row per HEALPix range covering each cone, carrying the cone
+        # itself for the exact distance check
+        columns = {"idx": [], "lo": [], "hi": [], "ra": [], "dec": [], "radius": []}
+        for i, (r, d, rad) in enumerate(positions.tolist()):
+            for lo, hi in cone_ranges(r, d, rad):
+                for key, value in zip(columns, (i, lo, hi, r, d, rad)):
+                    columns[key].append(value)
+        ranges = (
+            sa.text(
+                "SELECT * FROM unnest(CAST(:idx AS INTEGER[]), "
+                "CAST(:lo AS BIGINT[]), CAST(:hi AS BIGINT[]), "
+                "CAST(:ra AS FLOAT[]), CAST(:dec AS FLOAT[]), "
+                "CAST(:radius AS FLOAT[])) AS ranges(idx, lo, hi, ra, dec, radius)"
+            )
+            .bindparams(**columns)
+            .columns(
+                idx=sa.Integer,
+                lo=sa.BigInteger,
+                hi=sa.BigInteger,
+                ra=sa.Float,
+                dec=sa.Float,
+                radius=sa.Float,
+            )
+            .alias("ranges")
+        )
+
+        accessible = sa.or_(
+            sa.exists().where(
+                sa.and_(
+                    Source.obj_id == Obj.id,
+                    Source.active.is_(True),
+                    Source.group_id.in_(list(self.current_user.accessible_group_ids)),
+                )
+            ),
+            sa.exists().where(
+                sa.and_(
+                    Candidate.obj_id == Obj.id,
+                    Candidate.filter_id.in_(
+                        list(self.current_user.accessible_filter_ids)
+                    ),
+                )
+            ),
+        )
+        rows = (
+            DBSession()
+            .query(ranges.c.idx, Obj.id, Obj.ra, Obj.dec)
+            .join(Obj, Obj.healpix.between(ranges.c.lo, ranges.c.hi))
+            .filter(
+                Obj.within(ha.Point(ra=ranges.c.ra, dec=ranges.c.dec), ranges.c.radius)
+            )
+            .filter(accessible)
+            .all()
+        )
+
+        matches = [[] for _ in range(len(positions))]
+        if rows:
+            idx, obj_ids, obj_ra, obj_dec = map(np.array, zip(*rows))
+            separation = np.rad2deg(
+                angular_distance(ra[idx], dec[idx], obj_ra, obj_dec)
+            )
+            for i in np.lexsort((separation, idx)):
+                matches[idx[i]].append(
+                    {
+                        "id": obj_ids[i],
+                        "ra": float(obj_ra[i]),
+                        "dec": float(obj_dec[i]),
+                        "separation": float(separation[i]),
+                    }
+                )
+        return self.success(data={"matches": matches})
@@ -55,7 +55,7 @@ class FilterHandler(BaseHandler):
                     .filter(
                         Filter.id == filter_id,
                         Filter.group_id.in_(
-                            [g.id for g in self.current_user.accessible_groups]
+                            list(self.current_user.accessible_group_ids)
                         ),
                     )
                     .first()
@@ -71,9 +71,7 @@ class FilterHandler(BaseHandler):
         filters = (
             DBSession()
             .query(Filter)
-            .filter(
-                Filter.group_id.in_([g.id for g in self.current_user.accessible_groups])
-            )
+            .filter(Filter.group_id.in_(list(self.current_user.accessible_group_ids)))
             .all()
         )
         return self.success(data=filters)
@@ -180,9 +178,7 @@ class FilterHandler(BaseHandler):
                 .query(Filter)
                 .filter(
                     Filter.id == filter_id,
-                    Filter.group_id.in_(
-                        [g.id for g in self.current_user.accessible_groups]
-                    ),
+                    Filter.group_id.in_(list(self.current_user.accessible_group_ids)),
                 )
                 .first()
             )
@@ -235,9 +231,7 @@ class FilterHandler(BaseHandler):
                 .query(Filter)
                 .filter(
                     Filter.id == filter_id,
-                    Filter.group_id.in_(
-                        [g.id for g in self.current_user.accessible_groups]
-                    ),
+                    Filter.group_id.in_(list(self.current_user.accessible_group_ids)),
                 )
                 .first()
             )
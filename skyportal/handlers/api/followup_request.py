@@ -64,7 +64,7 @@ class AssignmentHandler(BaseHandler):
             assignments.join(Obj)
             .join(Source)
             .join(Group)
-            .filter(Group.id.in_([g.id for g in self.current_user.accessible_groups]))
+            .filter(Group.id.in_(list(self.current_user.accessible_group_ids)))
         )
 
         if assignment_id is not None:
@@ -304,7 +304,7 @@ class FollowupRequestHandler(BaseHandler):
             followup_requests.join(Obj)
             .join(Source)
             .join(Group)
-            .filter(Group.id.in_([g.id for g in self.current_user.accessible_groups]))
+            .filter(Group.id.in_(list(self.current_user.accessible_group_ids)))
         )
 
         if followup_request_id is not None:
@@ -373,9 +373,7 @@ class FollowupRequestHandler(BaseHandler):
         allocation = Allocation.query.get(data['allocation_id'])
         if allocation is None:
             return self.error('No such allocation.')
-        if allocation.group_id not in [
-            g.id for g in self.current_user.accessible_groups
-        ]:
+        if allocation.group_id not in self.current_user.accessible_group_ids:
             return self.error('User does not have access to this allocation.')
 
         instrument = allocation.instrument
@@ -132,7 +132,7 @@ class GroupHandler(BaseHandler):
                 not {"System admin", "Manage groups"}.intersection(
                     set(self.associated_user_object.permissions)
                 )
-            ) and group.id not in [g.id for g in self.current_user.accessible_groups]:
+            ) and group.id not in self.current_user.accessible_group_ids:
                 return self.error('Insufficient permissions.')
 
             # Do not include User.groups to avoid circular reference
@@ -172,7 +172,7 @@ class GroupHandler(BaseHandler):
             groups = Group.query.filter(Group.name == group_name).all()
             # Ensure access
             if not all(
-                [group in self.current_user.accessible_groups for group in groups]
+                [group.id in self.current_user.accessible_group_ids for group in groups]
             ):
                 return self.error("Insufficient permissions")
             return self.success(data=groups)
@@ -803,7 +803,7 @@ class ObjGroupsHandler(BaseHandler):
 
         source_info = s.to_dict()
 
-        user_accessible_group_ids = [g.id for g in self.current_user.accessible_groups]
+        user_accessible_group_ids = list(self.current_user.accessible_group_ids)
 
         query = (
             DBSession()
@@ -1,5 +1,6 @@
 from .plot import (
     PlotPhotometryHandler,
+    PlotLightCurveHandler,
     PlotSpectroscopyHandler,
     PlotAssignmentAirmassHandler,
     PlotObjTelAirmassHandler,
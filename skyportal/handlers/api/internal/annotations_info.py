@@ -1,86 +1,61 @@
+import time
+import threading
 from collections import defaultdict
-from sqlalchemy import func, literal
-from sqlalchemy.ext.compiler import compiles
-from sqlalchemy.sql import functions
-from sqlalchemy.sql.elements import ColumnClause
-from sqlalchemy.sql.selectable import FromClause
+
 from baselayer.app.access import auth_or_token
+from baselayer.app.env import load_env
 from ...base import BaseHandler
-from ....models import (
-    DBSession,
-    Obj,
-    Candidate,
-    Annotation,
-    GroupAnnotation,
-)
-
-
-# Helper classes/functions below provide a workaround for PostgreSQL functions
-# returning multiple columns, unsupported by SA
-# See https://stackoverflow.com/questions/33865038/joining-with-set-returning-function-srf-and-access-columns-in-sqlalchemy
-# for details
-class FunctionColumn(ColumnClause):
-    def __init__(self, function, name, type_=None):
-        self.function = self.table = function
-        self.name = self.key = name
-        self.type_ = type_
-        self.is_literal = False
-
-    @property
-    def _from_objects(self):
-        return []
-
-    def _make_proxy(
-        self, selectable, name=None, attach=True, name_is_truncatable=False, **kw
-    ):
-        if self.name == self.function.name:
-            name = selectable.name
-        else:
-            name = self.name
-
-        co = ColumnClause(name, self.type)
-        co.key = self.name
-        co._proxies = [self]
-        if selectable._is_clone_of is not None:
-            co._is_clone_of = selectable._is_clone_of.columns.get(co.key)
-        co.table = selectable
-        co.named_with_table = False
-        if attach:
-            selectable._columns[co.key] = co
-        return co
-
-
-@compiles(FunctionColumn)
-def _compile_function_column(element, compiler, **kw):
-    if kw.get('asfrom', False):
-        return "(%s).%s" % (
-            compiler.process(element.function, **kw),
-            compiler.preparer.quote(element.name),
-        )
-    else:
-        return element.name
-
-
-class ColumnFunction(functions.FunctionElement):
-    __visit_name__ = 'function'
-
-    @property
-    def columns(self):
-        return FromClause.columns.fget(self)
-
-    def _populate_column_collection(self):
-        for name in self.column_names:
-            self._columns[name] = FunctionColumn(self, name)
-
-
-class jsonb_each_func(ColumnFunction):
-    name = 'jsonb_each'
-    column_names = ['key', 'value']
-
-
-@compiles(jsonb_each_func)
-def _compile_jsonb_each_func(element, compiler, **kw):
-    return compiler.visit_function(element, **kw)
+from ....models import DBSession, AnnotationKey
+
+
+_, cfg = load_env()
+
+# The catalogue of annotation keys visible to each set of groups is cached for
+# this many seconds, so that keys added since take at most that long to appear
+# on the scanning page
+cache_ttl = cfg['misc'].get('annotations_info_cache_ttl', 60)
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def get_annotation_keys(group_ids):
+    """Return the annotation origins, keys and value types visible to the
+    given groups, as a dict mapping each origin to a list of {key: type}
+    objects."""
+    group_ids = frozenset(group_ids)
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _cache.get(group_ids)
+    if cached is not None and now - cached[0] < cache_ttl:
+        return cached[1]
+
+    rows = (
+        DBSession()
+        .query(AnnotationKey.origin, AnnotationKey.key, AnnotationKey.type)
+        .filter(AnnotationKey.group_id.in_(group_ids))
+        .distinct()
+        .order_by(AnnotationKey.origin, AnnotationKey.key, AnnotationKey.type)
+        .all()
+    )
+
+    # Restructure query results so that records are grouped by origin in a
+    # nice, nested dictionary. A key holding values of different types keeps
+    # the first of them.
+    grouped = defaultdict(list)
+    keys_seen = defaultdict(set)
+    for origin, key, type in rows:
+        if key not in keys_seen[origin]:
+            grouped[origin].append({key: type})
+        keys_seen[origin].add(key)
+    grouped = dict(grouped)
+
+    with _cache_lock:
+        for expired in [k for k, v in _cache.items() if now - v[0] >= cache_ttl]:
+            del _cache[expired]
+        _cache[group_ids] = (now, grouped)
+
+    return grouped
 
 
 class AnnotationsInfoHandler(BaseHandler):
@@ -104,51 +79,11 @@ class AnnotationsInfoHandler(BaseHandler):
                                 An object in which each key is an annotation origin, and
                                 the values are arrays of { key: value_type } objects
         """
-        user_accessible_group_ids = [g.id for g in self.current_user.accessible_groups]
-        user_accessible_filter_ids = [
-            filtr.id
-            for g in self.current_user.accessible_groups
-            for filtr in g.filters
-            if g.filters is not None
-        ]
-
-        # This query gets the origin/keys present in the accessible annotaions
-        # for an Obj, as well as the data type for the values for each key.
-        # This information is used to generate the front-end form for selecting
-        # filters to apply on the auto-annotations column on the scanning page.
-        # For example, if given that an annotation field is numeric we should
-        # have min/max fields on the form.
-        annotations = jsonb_each_func(
-            Annotation.data
-        )  # Get each key/value tuple in annotations
-        q = (
-            DBSession()
-            .query(Annotation.origin)
-            .add_columns(
-                annotations.c.key, func.jsonb_typeof(annotations.c.value).label("type")
-            )
-            .outerjoin(annotations, literal(True))
-            .join(Obj)
-            .filter(
-                Obj.id.in_(
-                    DBSession()
-                    .query(Candidate.obj_id)
-                    .filter(Candidate.filter_id.in_(user_accessible_filter_ids))
-                )
-            )
-            .join(GroupAnnotation)
-            .filter(GroupAnnotation.group_id.in_(user_accessible_group_ids))
-        )
-
-        # Restructure query results so that records are grouped by origin in a
-        # nice, nested dictionary
-        results = q.all()
-        grouped = defaultdict(list)
-        keys_seen = defaultdict(set)
-        for annotation in results:
-            if annotation.key not in keys_seen[annotation.origin]:
-                grouped[annotation.origin].append({annotation.key: annotation.type})
-
-            keys_seen[annotation.origin].add(annotation.key)
-
+        # The origin/keys present in the accessible annotations, as well as
+        # the data type for the values for each key, are used to generate the
+        # front-end form for selecting filters to apply on the
+        # auto-annotations column on the scanning page. For example, if given
+        # that an annotation field is numeric we should have min/max fields
+        # on the form.
+        grouped = get_annotation_keys(self.current_user.accessible_group_ids)
         return self.success(data=grouped)
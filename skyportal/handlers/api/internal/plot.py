@@ -1,4 +1,8 @@
+import json
+
 from baselayer.app.access import auth_or_token
+from baselayer.app.env import load_env
+from baselayer.app.json_util import to_json
 from ...base import BaseHandler
 from .... import plot
 from ....models import ClassicalAssignment, Source, Telescope
@@ -6,33 +10,121 @@ from ....models import ClassicalAssignment, Source, Telescope
 import numpy as np
 from astropy import time as ap_time
 import pandas as pd
+import pyarrow
+import pyarrow.ipc
+
+
+_, cfg = load_env()
+
+
+def parse_max_points(value):
+    """Parse the maximum number of points to plot per label, beyond which
+    photometry is binned; 0 disables binning."""
+    max_points = int(value)
+    if max_points < 0:
+        raise ValueError(f'Negative maximum number of points: {max_points}')
+    return max_points
 
 
 class PlotPhotometryHandler(BaseHandler):
     @auth_or_token
     def get(self, obj_id):
-        height = self.get_query_argument("height", 300)
-        width = self.get_query_argument("width", 600)
-        json = plot.photometry_plot(
-            obj_id, self.current_user, height=int(height), width=int(width),
+        height = int(self.get_query_argument("height", 300))
+        width = int(self.get_query_argument("width", 600))
+        try:
+            max_points = parse_max_points(
+                self.get_query_argument(
+                    "maxPoints", cfg['misc'].get('plot_max_points_per_label', 2000)
+                )
+            )
+        except ValueError:
+            return self.error('Invalid maxPoints: must be a non-negative integer.')
+        key = plot.plot_cache_key(
+            'photometry', obj_id, self.current_user, width, height, max_points
+        )
+        cached = plot.plot_cache[key]
+        if cached is not None:
+            bokeh_json = json.loads(cached)
+        else:
+            bokeh_json = plot.photometry_plot(
+                obj_id,
+                self.current_user,
+                height=height,
+                width=width,
+                max_points=max_points,
+            )
+            plot.plot_cache[key] = to_json(bokeh_json)
+        self.success(data={'bokehJSON': bokeh_json, 'url': self.request.uri})
+
+
+class PlotLightCurveHandler(BaseHandler):
+    @auth_or_token
+    def get(self, obj_id):
+        """Return the photometry of an object as compact columns, for
+        rendering on the client, either as JSON or, with `format=arrow`, as
+        an Arrow IPC stream whose schema metadata holds the lookup tables."""
+        try:
+            max_points = parse_max_points(
+                self.get_query_argument(
+                    "maxPoints", cfg['misc'].get('plot_max_points_per_label', 2000)
+                )
+            )
+        except ValueError:
+            return self.error('Invalid maxPoints: must be a non-negative integer.')
+        output_format = self.get_query_argument("format", "json")
+        if output_format not in ["json", "arrow"]:
+            return self.error('Invalid format: must be one of "json" or "arrow".')
+
+        columns, tables = plot.photometry_light_curve(
+            obj_id, self.current_user, max_points=max_points
         )
-        self.success(data={'bokehJSON': json, 'url': self.request.uri})
+        metadata = {
+            'obj_id': obj_id,
+            'zp': plot.PHOT_ZP,
+            'magsys': 'ab',
+            'detect_thresh': plot.DETECT_THRESH,
+            **tables,
+        }
+
+        if output_format == "arrow":
+            table = pyarrow.table(columns).replace_schema_metadata(
+                {'skyportal': to_json(metadata)}
+            )
+            sink = pyarrow.BufferOutputStream()
+            with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            self.set_status(200)
+            self.set_header('Content-Type', 'application/vnd.apache.arrow.stream')
+            self.write(sink.getvalue().to_pybytes())
+            return
+
+        # JSON has no NaN, so missing values are sent as null
+        columns = {
+            key: np.where(np.isnan(values), None, values).tolist()
+            if values.dtype.kind == 'f'
+            else values.tolist()
+            for key, values in columns.items()
+        }
+        return self.success(data={**metadata, 'columns': columns})
 
 
 class PlotSpectroscopyHandler(BaseHandler):
     @auth_or_token
     def get(self, obj_id):
-        height = self.get_query_argument("height", 300)
-        width = self.get_query_argument("width", 600)
+        height = int(self.get_query_argument("height", 300))
+        width = int(self.get_query_argument("width", 600))
         spec_id = self.get_query_argument("spectrumID", None)
-        json = plot.spectroscopy_plot(
-            obj_id,
-            self.associated_user_object,
-            spec_id,
-            height=int(height),
-            width=int(width),
-        )
-        self.success(data={'bokehJSON': json, 'url': self.request.uri})
+        user = self.associated_user_object
+        key = plot.plot_cache_key('spectroscopy', obj_id, user, width, height, spec_id)
+        cached = plot.plot_cache[key]
+        if cached is not None:
+            bokeh_json = json.loads(cached)
+        else:
+            bokeh_json = plot.spectroscopy_plot(
+                obj_id, user, spec_id, height=height, width=width,
+            )
+            plot.plot_cache[key] = to_json(bokeh_json)
+        self.success(data={'bokehJSON': bokeh_json, 'url': self.request.uri})
 
 
 class AirmassHandler(BaseHandler):
@@ -25,9 +25,7 @@ class RecentSourcesHandler(BaseHandler):
                     DBSession()
                     .query(Source.obj_id)
                     .filter(
-                        Source.group_id.in_(
-                            [g.id for g in current_user.accessible_groups]
-                        )
+                        Source.group_id.in_(list(current_user.accessible_group_ids))
                     )
                     .filter(Source.active.is_(True))
                 )
@@ -22,9 +22,7 @@ class SourceCountHandler(BaseHandler):
 
         q = (
             DBSession.query(func.count(Source.obj_id).label('count'))
-            .filter(
-                Source.group_id.in_([g.id for g in self.current_user.accessible_groups])
-            )
+            .filter(Source.group_id.in_(list(self.current_user.accessible_group_ids)))
             .filter(Source.created_at >= cutoff_day)
         )
         result = q.first()[0]
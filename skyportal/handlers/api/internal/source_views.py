@@ -29,9 +29,7 @@ class SourceViewsHandler(BaseHandler):
             .filter(
                 SourceView.obj_id.in_(
                     DBSession.query(Source.obj_id).filter(
-                        Source.group_id.in_(
-                            [g.id for g in current_user.accessible_groups]
-                        )
+                        Source.group_id.in_(list(current_user.accessible_group_ids))
                     )
                 )
             )
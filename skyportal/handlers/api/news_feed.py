@@ -60,7 +60,7 @@ class NewsFeedHandler(BaseHandler):
                     .query(Source.obj_id)
                     .filter(
                         Source.group_id.in_(
-                            [g.id for g in self.current_user.accessible_groups]
+                            list(self.current_user.accessible_group_ids)
                         )
                     )
                 )
@@ -1,24 +1,34 @@
+import io
+import os
+import json
 import uuid
-import math
+import socket
+from collections import defaultdict
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import tornado.iostream
 
 from astropy.time import Time
-from astropy.table import Table
 from marshmallow.exceptions import ValidationError
 import numpy as np
 import pandas as pd
+import pyarrow
+import pyarrow.parquet
 import sncosmo
-from sncosmo.photdata import PhotometricData
 
 import sqlalchemy as sa
-from sqlalchemy.ext.compiler import compiles
-from sqlalchemy.sql.expression import FromClause
 from sqlalchemy.sql import column
 from sqlalchemy.orm import joinedload
 from sqlalchemy import and_
 
 from baselayer.app.access import permissions, auth_or_token
 from baselayer.app.env import load_env
+from baselayer.app.json_util import to_json
+from baselayer.log import make_log
 from ..base import BaseHandler
+from ...plot import plot_cache
 from ...models import (
     DBSession,
     Group,
@@ -27,6 +37,8 @@ from ...models import (
     Obj,
     PHOT_ZP,
     GroupPhotometry,
+    PhotometryIngestJob,
+    refresh_detection_summaries,
 )
 
 from ...schema import (
@@ -37,9 +49,13 @@ from ...schema import (
     PhotometryRangeQuery,
 )
 from ...enum_types import ALLOWED_MAGSYSTEMS
+from ...utils.zeropoints import get_zeropoint_offset, get_zeropoint_offsets
 
 
 _, cfg = load_env()
+log = make_log('photometry_ingest')
+
+_ingest_executor = None
 
 
 def nan_to_none(value):
@@ -54,6 +70,66 @@ def allscalar(d):
     return all(np.isscalar(v) or v is None for v in d.values())
 
 
+def _copy_value(value):
+    """Render a single value in the postgres COPY text format."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, (dict, list)):
+        value = to_json(value)
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+def copy_rows(table, rows):
+    """Bulk insert rows into a table using the postgres `COPY ... FROM STDIN`
+    protocol. The COPY is issued on the connection bound to the current
+    DBSession, so it participates in the enclosing transaction.
+
+    Unlike `table.insert()`, COPY does not apply python-side column defaults,
+    so any column with a default that is not present in `rows` is evaluated
+    once and applied to every row.
+
+    Parameters
+    ----------
+    table : `sqlalchemy.Table`
+        The table to insert into.
+    rows : list of dict
+        The rows to insert. All rows must have the same keys.
+    """
+    if len(rows) == 0:
+        return
+
+    columns = list(rows[0].keys())
+    defaults = {}
+    for col in table.columns:
+        if col.name in columns or col.default is None or col.default.is_sequence:
+            continue
+        if col.default.is_callable:
+            defaults[col.name] = col.default.arg(None)
+        elif col.default.is_clause_element:
+            defaults[col.name] = (
+                DBSession().execute(sa.select([col.default.arg])).scalar()
+            )
+        else:
+            defaults[col.name] = col.default.arg
+
+    default_values = [_copy_value(value) for value in defaults.values()]
+    buffer = io.StringIO()
+    for row in rows:
+        values = [_copy_value(row[key]) for key in columns] + default_values
+        buffer.write('\t'.join(values) + '\n')
+    buffer.seek(0)
+
+    column_list = ', '.join(f'"{c}"' for c in columns + list(defaults))
+    cursor = DBSession().connection().connection.cursor()
+    cursor.copy_expert(f'COPY {table.name} ({column_list}) FROM STDIN', buffer)
+
+
 def serialize(phot, outsys, format):
 
     return_value = {
@@ -73,17 +149,11 @@ def serialize(phot, outsys, format):
 
     filter = phot.filter
 
-    magsys_db = sncosmo.get_magsystem('ab')
     outsys = sncosmo.get_magsystem(outsys)
 
-    relzp_out = 2.5 * np.log10(outsys.zpbandflux(filter))
-
-    # note: these are not the actual zeropoints for magnitudes in the db or
-    # packet, just ones that can be used to derive corrections when
-    # compared to relzp_out
-
-    relzp_db = 2.5 * np.log10(magsys_db.zpbandflux(filter))
-    db_correction = relzp_out - relzp_db
+    # the database stores fluxes in the AB system, so the correction from
+    # the database to the new magnitude system is just its offset from AB
+    db_correction = get_zeropoint_offset(outsys.name, filter)
 
     # this is the zeropoint for fluxes in the database that is tied
     # to the new magnitude system
@@ -94,9 +164,9 @@ def serialize(phot, outsys, format):
             phot.original_user_data is not None
             and 'limiting_mag' in phot.original_user_data
         ):
-            magsys_packet = sncosmo.get_magsystem(phot.original_user_data['magsys'])
-            relzp_packet = 2.5 * np.log10(magsys_packet.zpbandflux(filter))
-            packet_correction = relzp_out - relzp_packet
+            packet_correction = db_correction - get_zeropoint_offset(
+                phot.original_user_data['magsys'], filter
+            )
             maglimit = phot.original_user_data['limiting_mag']
             maglimit_out = maglimit + packet_correction
         else:
@@ -132,436 +202,1105 @@ def serialize(phot, outsys, format):
     return return_value
 
 
-class PhotometryHandler(BaseHandler):
-    def standardize_photometry_data(self):
+PHOTOMETRY_EXPORT_COLUMNS = {
+    'mag': [
+        'id',
+        'obj_id',
+        'mjd',
+        'filter',
+        'mag',
+        'magerr',
+        'limiting_mag',
+        'magsys',
+        'instrument_id',
+        'instrument_name',
+        'ra',
+        'dec',
+        'ra_unc',
+        'dec_unc',
+        'origin',
+        'groups',
+    ],
+    'flux': [
+        'id',
+        'obj_id',
+        'mjd',
+        'filter',
+        'flux',
+        'fluxerr',
+        'zp',
+        'magsys',
+        'instrument_id',
+        'instrument_name',
+        'ra',
+        'dec',
+        'ra_unc',
+        'dec_unc',
+        'origin',
+        'groups',
+    ],
+}
+
+
+PHOTOMETRY_EXPORT_TYPES = {
+    'id': pyarrow.int64(),
+    'obj_id': pyarrow.string(),
+    'mjd': pyarrow.float64(),
+    'filter': pyarrow.string(),
+    'mag': pyarrow.float64(),
+    'magerr': pyarrow.float64(),
+    'limiting_mag': pyarrow.float64(),
+    'flux': pyarrow.float64(),
+    'fluxerr': pyarrow.float64(),
+    'zp': pyarrow.float64(),
+    'magsys': pyarrow.string(),
+    'instrument_id': pyarrow.int64(),
+    'instrument_name': pyarrow.string(),
+    'ra': pyarrow.float64(),
+    'dec': pyarrow.float64(),
+    'ra_unc': pyarrow.float64(),
+    'dec_unc': pyarrow.float64(),
+    'origin': pyarrow.string(),
+    'groups': pyarrow.list_(pyarrow.int64()),
+}
+
+
+class ParquetStream(io.RawIOBase):
+    """Write-only file that holds what is written to it until it is
+    drained, so that a Parquet file can be sent as its row groups are
+    written, while the writer still sees the absolute file positions it
+    needs for the footer."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        """Return and forget the bytes written since the last call."""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def serialize_photometry(photometry_query, outsys, format):
+    """Serialize all the Photometry selected by a query at once.
+
+    The output is the same as calling `serialize` on each point, but the
+    needed columns (including the instrument name and the Groups) are
+    fetched with a few bulk queries instead of one ORM object per point,
+    and the magnitude system corrections are computed with NumPy, once per
+    (filter, magsys) combination.
+
+    Parameters
+    ----------
+    photometry_query: `sqlalchemy.orm.Query`
+        Query selecting the Photometry to serialize.
+    outsys: str
+        The magnitude system of the output.
+    format: str
+        The output format, either 'mag' or 'flux'.
+
+    Returns
+    -------
+    output: list of dict
+        The serialized photometry, ordered by MJD and then ID.
+    """
+
+    if format not in ['mag', 'flux']:
+        raise ValueError(
+            'Invalid output format specified. Must be one of '
+            f"['flux', 'mag'], got '{format}'."
+        )
+    outsys = sncosmo.get_magsystem(outsys).name
+
+    # selecting through the IDs keeps any ordering or limit of the original
+    # query without having to join onto it
+    photometry_ids = photometry_query.with_entities(Photometry.id)
+    rows = (
+        DBSession()
+        .query(
+            Photometry.id,
+            Photometry.obj_id,
+            Photometry.ra,
+            Photometry.dec,
+            Photometry.filter,
+            Photometry.mjd,
+            Photometry.instrument_id,
+            Instrument.name.label('instrument_name'),
+            Photometry.ra_unc,
+            Photometry.dec_unc,
+            Photometry.origin,
+            Photometry.flux,
+            Photometry.fluxerr,
+            Photometry.original_user_data['limiting_mag'].astext.label(
+                'packet_limiting_mag'
+            ),
+            Photometry.original_user_data['magsys'].astext.label('packet_magsys'),
+        )
+        .join(Instrument, Instrument.id == Photometry.instrument_id)
+        .filter(Photometry.id.in_(photometry_ids))
+        .order_by(Photometry.mjd, Photometry.id)
+        .all()
+    )
+    if len(rows) == 0:
+        return []
+
+    group_pairs = (
+        DBSession()
+        .query(GroupPhotometry.photometry_id, GroupPhotometry.group_id)
+        .filter(GroupPhotometry.photometry_id.in_(photometry_ids))
+        .all()
+    )
+    groups = {
+        group.id: group
+        for group in Group.query.filter(
+            Group.id.in_({group_id for _, group_id in group_pairs})
+        )
+    }
+    phot_groups = defaultdict(list)
+    for photometry_id, group_id in group_pairs:
+        phot_groups[photometry_id].append(groups[group_id])
 
-        data = self.get_json()
+    filters = np.array([row.filter for row in rows], dtype=object)
+    flux = np.array([row.flux for row in rows], dtype=float)
+    fluxerr = np.array([row.fluxerr for row in rows], dtype=float)
 
-        if not isinstance(data, dict):
-            raise ValidationError(
-                'Top level JSON must be an instance of `dict`, got ' f'{type(data)}.'
+    # the database stores fluxes in the AB system, so the correction from
+    # the database to the new magnitude system is just its offset from AB
+    db_correction = get_zeropoint_offsets(outsys, filters)
+
+    # this is the zeropoint for fluxes in the database that is tied
+    # to the new magnitude system
+    corrected_db_zp = PHOT_ZP + db_correction
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if format == 'mag':
+            detected = flux > 0
+            mag = np.where(
+                detected, -2.5 * np.log10(flux) + PHOT_ZP + db_correction, np.nan
             )
+            magerr = np.where(
+                detected & (fluxerr > 0), (2.5 / np.log(10)) * (fluxerr / flux), np.nan
+            )
+            limiting_mag = -2.5 * np.log10(5 * fluxerr) + corrected_db_zp
+
+            # limiting magnitudes given in the uploaded packet are converted
+            # from the packet's magnitude system rather than recomputed
+            packet_limiting_mag = np.array(
+                pd.to_numeric(
+                    [row.packet_limiting_mag for row in rows], errors='coerce'
+                ),
+                dtype=float,
+            )
+            packet = ~np.isnan(packet_limiting_mag)
+            if packet.any():
+                packet_magsys = np.array(
+                    [row.packet_magsys for row in rows], dtype=object
+                )
+                limiting_mag[packet] = (
+                    packet_limiting_mag[packet]
+                    + db_correction[packet]
+                    - get_zeropoint_offsets(packet_magsys[packet], filters[packet])
+                )
+
+    def nan_to_none_list(array):
+        return np.where(np.isnan(array), None, array).tolist()
+
+    if format == 'mag':
+        formatted = {
+            'mag': nan_to_none_list(mag),
+            'magerr': nan_to_none_list(magerr),
+            'limiting_mag': limiting_mag.tolist(),
+        }
+    else:
+        formatted = {
+            'flux': nan_to_none_list(flux),
+            'zp': corrected_db_zp.tolist(),
+            'fluxerr': [row.fluxerr for row in rows],
+        }
+
+    output = []
+    for i, row in enumerate(rows):
+        return_value = {
+            'obj_id': row.obj_id,
+            'ra': row.ra,
+            'dec': row.dec,
+            'filter': row.filter,
+            'mjd': row.mjd,
+            'instrument_id': row.instrument_id,
+            'instrument_name': row.instrument_name,
+            'ra_unc': row.ra_unc,
+            'dec_unc': row.dec_unc,
+            'origin': row.origin,
+            'id': row.id,
+            'groups': phot_groups[row.id],
+            'magsys': outsys,
+        }
+        for key, values in formatted.items():
+            return_value[key] = values[i]
+        output.append(return_value)
+
+    return output
+
+
+def standardize_photometry_data(data):
+    """Validate photometry posted in either flux or magnitude space and
+    convert it to a DataFrame with fluxes standardized to microjanskies
+    in the AB system.
+
+    Parameters
+    ----------
+    data: dict
+        The photometry JSON passed to the API.
+
+    Returns
+    -------
+    df: `pandas.DataFrame`
+        The standardized photometry, with the extra columns
+        'standardized_flux' and 'standardized_fluxerr'.
+    instrument_cache: dict
+        Instruments referenced by the photometry, keyed by ID.
+    """
+
+    if not isinstance(data, dict):
+        raise ValidationError(
+            'Top level JSON must be an instance of `dict`, got ' f'{type(data)}.'
+        )
 
-        if "altdata" in data and not data["altdata"]:
-            del data["altdata"]
+    if "altdata" in data and not data["altdata"]:
+        del data["altdata"]
 
-        # quick validation - just to make sure things have the right fields
+    # quick validation - just to make sure things have the right fields
+    try:
+        data = PhotMagFlexible.load(data)
+    except ValidationError as e1:
         try:
-            data = PhotMagFlexible.load(data)
-        except ValidationError as e1:
-            try:
-                data = PhotFluxFlexible.load(data)
-            except ValidationError as e2:
-                raise ValidationError(
-                    'Invalid input format: Tried to parse data '
-                    f'in mag space, got: '
-                    f'"{e1.normalized_messages()}." Tried '
-                    f'to parse data in flux space, got:'
-                    f' "{e2.normalized_messages()}."'
-                )
-            else:
-                kind = 'flux'
+            data = PhotFluxFlexible.load(data)
+        except ValidationError as e2:
+            raise ValidationError(
+                'Invalid input format: Tried to parse data '
+                f'in mag space, got: '
+                f'"{e1.normalized_messages()}." Tried '
+                f'to parse data in flux space, got:'
+                f' "{e2.normalized_messages()}."'
+            )
         else:
-            kind = 'mag'
+            kind = 'flux'
+    else:
+        kind = 'mag'
 
-        # not used here
-        _ = data.pop('group_ids', None)
+    # not used here
+    _ = data.pop('group_ids', None)
 
-        if allscalar(data):
-            data = [data]
+    if allscalar(data):
+        data = [data]
 
-        try:
-            df = pd.DataFrame(data)
-        except ValueError as e:
-            if "altdata" in data and "Mixing dicts with non-Series" in str(e):
-                try:
-                    data["altdata"] = [
-                        {key: value[i] for key, value in data["altdata"].items()}
-                        for i in range(
-                            len(data["altdata"][list(data["altdata"].keys())[-1]])
-                        )
-                    ]
-                    df = pd.DataFrame(data)
-                except ValueError:
-                    raise ValidationError(
-                        'Unable to coerce passed JSON to a series of packets. '
-                        f'Error was: "{e}"'
+    try:
+        df = pd.DataFrame(data)
+    except ValueError as e:
+        if "altdata" in data and "Mixing dicts with non-Series" in str(e):
+            try:
+                data["altdata"] = [
+                    {key: value[i] for key, value in data["altdata"].items()}
+                    for i in range(
+                        len(data["altdata"][list(data["altdata"].keys())[-1]])
                     )
-            else:
+                ]
+                df = pd.DataFrame(data)
+            except ValueError:
                 raise ValidationError(
                     'Unable to coerce passed JSON to a series of packets. '
                     f'Error was: "{e}"'
                 )
+        else:
+            raise ValidationError(
+                'Unable to coerce passed JSON to a series of packets. '
+                f'Error was: "{e}"'
+            )
+
+    # `to_numeric` coerces numbers written as strings to numeric types
+    #  (int, float)
+
+    #  errors='ignore' means if something is actually an alphanumeric
+    #  string, just leave it alone and dont error out
 
-        # `to_numeric` coerces numbers written as strings to numeric types
-        #  (int, float)
+    #  apply is used to apply it to each column
+    # (https://stackoverflow.com/questions/34844711/convert-entire-pandas
+    # -dataframe-to-integers-in-pandas-0-17-0/34844867
+    df = df.apply(pd.to_numeric, errors='ignore')
 
-        #  errors='ignore' means if something is actually an alphanumeric
-        #  string, just leave it alone and dont error out
+    # set origin to '' where it is None.
+    df.loc[df['origin'].isna(), 'origin'] = ''
 
-        #  apply is used to apply it to each column
-        # (https://stackoverflow.com/questions/34844711/convert-entire-pandas
-        # -dataframe-to-integers-in-pandas-0-17-0/34844867
-        df = df.apply(pd.to_numeric, errors='ignore')
+    if kind == 'mag':
+        # ensure that neither or both mag and magerr are null
+        magnull = df['mag'].isna()
+        magerrnull = df['magerr'].isna()
+        magdet = ~magnull
 
-        # set origin to '' where it is None.
-        df.loc[df['origin'].isna(), 'origin'] = ''
+        # https://en.wikipedia.org/wiki/Bitwise_operation#XOR
+        bad = magerrnull ^ magnull  # bitwise exclusive or -- returns true
+        #  if A and not B or B and not A
 
-        if kind == 'mag':
-            # ensure that neither or both mag and magerr are null
-            magnull = df['mag'].isna()
-            magerrnull = df['magerr'].isna()
-            magdet = ~magnull
+        # coerce to numpy array
+        bad = bad.values
 
-            # https://en.wikipedia.org/wiki/Bitwise_operation#XOR
-            bad = magerrnull ^ magnull  # bitwise exclusive or -- returns true
-            #  if A and not B or B and not A
+        if any(bad):
+            # find the first offending packet
+            first_offender = np.argwhere(bad)[0, 0]
+            packet = df.iloc[first_offender].to_dict()
 
-            # coerce to numpy array
-            bad = bad.values
+            # coerce nans to nones
+            for key in packet:
+                if key != 'standardized_flux':
+                    packet[key] = nan_to_none(packet[key])
 
-            if any(bad):
-                # find the first offending packet
-                first_offender = np.argwhere(bad)[0, 0]
+            raise ValidationError(
+                f'Error parsing packet "{packet}": mag '
+                f'and magerr must both be null, or both be '
+                f'not null.'
+            )
+
+        for field in ['mag', 'magerr', 'limiting_mag']:
+            infinite = np.isinf(df[field].values)
+            if any(infinite):
+                first_offender = np.argwhere(infinite)[0, 0]
                 packet = df.iloc[first_offender].to_dict()
 
                 # coerce nans to nones
                 for key in packet:
-                    if key != 'standardized_flux':
-                        packet[key] = nan_to_none(packet[key])
+                    packet[key] = nan_to_none(packet[key])
 
                 raise ValidationError(
-                    f'Error parsing packet "{packet}": mag '
-                    f'and magerr must both be null, or both be '
-                    f'not null.'
+                    f'Error parsing packet "{packet}": '
+                    f'field {field} must be finite.'
                 )
 
-            for field in ['mag', 'magerr', 'limiting_mag']:
-                infinite = np.isinf(df[field].values)
-                if any(infinite):
-                    first_offender = np.argwhere(infinite)[0, 0]
-                    packet = df.iloc[first_offender].to_dict()
-
-                    # coerce nans to nones
-                    for key in packet:
-                        packet[key] = nan_to_none(packet[key])
+        # ensure nothing is null for the required fields
+        for field in PhotMagFlexible.required_keys:
+            missing = df[field].isna()
+            if any(missing):
+                first_offender = np.argwhere(missing)[0, 0]
+                packet = df.iloc[first_offender].to_dict()
 
-                    raise ValidationError(
-                        f'Error parsing packet "{packet}": '
-                        f'field {field} must be finite.'
-                    )
+                # coerce nans to nones
+                for key in packet:
+                    packet[key] = nan_to_none(packet[key])
 
-            # ensure nothing is null for the required fields
-            for field in PhotMagFlexible.required_keys:
-                missing = df[field].isna()
-                if any(missing):
-                    first_offender = np.argwhere(missing)[0, 0]
-                    packet = df.iloc[first_offender].to_dict()
+                raise ValidationError(
+                    f'Error parsing packet "{packet}": '
+                    f'missing required field {field}.'
+                )
 
-                    # coerce nans to nones
-                    for key in packet:
-                        packet[key] = nan_to_none(packet[key])
+        # convert the mags to fluxes
+        # detections
+        detflux = 10 ** (-0.4 * (df[magdet]['mag'] - PHOT_ZP))
+        detfluxerr = df[magdet]['magerr'] / (2.5 / np.log(10)) * detflux
 
-                    raise ValidationError(
-                        f'Error parsing packet "{packet}": '
-                        f'missing required field {field}.'
-                    )
+        # non-detections
+        limmag_flux = 10 ** (-0.4 * (df[magnull]['limiting_mag'] - PHOT_ZP))
+        ndetfluxerr = limmag_flux / df[magnull]['limiting_mag_nsigma']
 
-            # convert the mags to fluxes
-            # detections
-            detflux = 10 ** (-0.4 * (df[magdet]['mag'] - PHOT_ZP))
-            detfluxerr = df[magdet]['magerr'] / (2.5 / np.log(10)) * detflux
+        # initialize flux to be none
+        zp = np.full(len(df), PHOT_ZP)
+        flux = np.full(len(df), np.nan)
+        fluxerr = np.full(len(df), np.nan)
+        flux[magdet.values] = detflux
+        fluxerr[magdet.values] = detfluxerr
+        fluxerr[magnull.values] = ndetfluxerr
 
-            # non-detections
-            limmag_flux = 10 ** (-0.4 * (df[magnull]['limiting_mag'] - PHOT_ZP))
-            ndetfluxerr = limmag_flux / df[magnull]['limiting_mag_nsigma']
+    else:
+        for field in PhotFluxFlexible.required_keys:
+            missing = df[field].isna().values
+            if any(missing):
+                first_offender = np.argwhere(missing)[0, 0]
+                packet = df.iloc[first_offender].to_dict()
 
-            # initialize flux to be none
-            phot_table = Table.from_pandas(df[['mjd', 'magsys', 'filter']])
+                for key in packet:
+                    packet[key] = nan_to_none(packet[key])
 
-            phot_table['zp'] = PHOT_ZP
-            phot_table['flux'] = np.nan
-            phot_table['fluxerr'] = np.nan
-            phot_table['flux'][magdet] = detflux
-            phot_table['fluxerr'][magdet] = detfluxerr
-            phot_table['fluxerr'][magnull] = ndetfluxerr
+                raise ValidationError(
+                    f'Error parsing packet "{packet}": '
+                    f'missing required field {field}.'
+                )
 
-        else:
-            for field in PhotFluxFlexible.required_keys:
-                missing = df[field].isna().values
-                if any(missing):
-                    first_offender = np.argwhere(missing)[0, 0]
-                    packet = df.iloc[first_offender].to_dict()
+        for field in ['flux', 'fluxerr']:
+            infinite = np.isinf(df[field].values)
+            if any(infinite):
+                first_offender = np.argwhere(infinite)[0, 0]
+                packet = df.iloc[first_offender].to_dict()
 
-                    for key in packet:
-                        packet[key] = nan_to_none(packet[key])
+                # coerce nans to nones
+                for key in packet:
+                    packet[key] = nan_to_none(packet[key])
 
-                    raise ValidationError(
-                        f'Error parsing packet "{packet}": '
-                        f'missing required field {field}.'
-                    )
+                raise ValidationError(
+                    f'Error parsing packet "{packet}": '
+                    f'field {field} must be finite.'
+                )
 
-            for field in ['flux', 'fluxerr']:
-                infinite = np.isinf(df[field].values)
-                if any(infinite):
-                    first_offender = np.argwhere(infinite)[0, 0]
-                    packet = df.iloc[first_offender].to_dict()
+        zp = df['zp'].values.astype(float)
+        flux = df['flux'].fillna(np.nan).values.astype(float)
+        fluxerr = df['fluxerr'].fillna(np.nan).values.astype(float)
+
+    # convert to microjanskies, AB for DB storage as a vectorized operation
+    offset = get_zeropoint_offsets(df['magsys'].values, df['filter'].values)
+    factor = 10 ** (0.4 * (PHOT_ZP - zp + offset))
+
+    df['standardized_flux'] = flux * factor
+    df['standardized_fluxerr'] = fluxerr * factor
+
+    instrument_cache = {}
+    for iid in df['instrument_id'].unique():
+        instrument = Instrument.query.get(int(iid))
+        if not instrument:
+            raise ValidationError(f'Invalid instrument ID: {iid}')
+        instrument_cache[iid] = instrument
+
+    for oid in df['obj_id'].unique():
+        obj = Obj.query.get(oid)
+        if not obj:
+            raise ValidationError(f'Invalid object ID: {oid}')
+
+    return df, instrument_cache
+
+
+def get_values_table_and_condition(df):
+    """Return a table expression containing the indexed columns of a
+    photometry dataframe returned by `standardize_photometry_data`.
+    Also returns the join condition for cross-matching that table
+    against the Photometry table using the deduplication index.
+
+    Small batches are shipped to postgres as one typed array per column
+    and expanded server-side with `unnest`. Batches with at least
+    `photometry.copy_threshold` rows are loaded with COPY into a
+    temporary table that is dropped at the end of the transaction.
+    Either way, postgres does not have to parse a literal tuple per row.
+
+    Parameters
+    ----------
+    df: `pandas.DataFrame`
+        Dataframe with the columns 'obj_id', 'instrument_id', 'origin',
+        'mjd', 'standardized_fluxerr', 'standardized_flux'.
+
+    Returns
+    -------
+    values_table: `sqlalchemy.sql.expression.FromClause`
+        The table representation of the photometry DataFrame.
+
+    condition: `sqlalchemy.sql.elements.AsBoolean`
+       The join condition for cross matching the table representation of
+       `df` against the Photometry table using the deduplication index.
+    """
+
+    keys = pd.DataFrame(
+        {
+            'pdidx': df.index.values.astype(int),
+            'obj_id': df['obj_id'].astype(str).values,
+            'instrument_id': df['instrument_id'].astype(int).values,
+            'origin': df['origin'].astype(str).values,
+            'mjd': df['mjd'].astype(float).values,
+            'fluxerr': df['standardized_fluxerr'].astype(float).values,
+            'flux': df['standardized_flux'].astype(float).values,
+        }
+    )
+
+    value_types = {
+        'pdidx': (sa.Integer, 'INTEGER'),
+        'obj_id': (sa.String, 'CHARACTER VARYING'),
+        'instrument_id': (sa.Integer, 'INTEGER'),
+        'origin': (sa.String, 'CHARACTER VARYING'),
+        'mjd': (sa.Float, 'DOUBLE PRECISION'),
+        'fluxerr': (sa.Float, 'DOUBLE PRECISION'),
+        'flux': (sa.Float, 'DOUBLE PRECISION'),
+    }
 
-                    # coerce nans to nones
-                    for key in packet:
-                        packet[key] = nan_to_none(packet[key])
+    if len(keys) >= cfg['photometry.copy_threshold']:
+        values_table = sa.Table(
+            f'photometry_dedup_{uuid.uuid4().hex}',
+            sa.MetaData(),
+            *[sa.Column(name, satype) for name, (satype, _) in value_types.items()],
+            prefixes=['TEMPORARY'],
+            postgresql_on_commit='DROP',
+        )
+        values_table.create(bind=DBSession().connection())
+
+        # none of the key columns can be null, only NaN
+        buffer = io.StringIO()
+        keys.to_csv(buffer, header=False, index=False, na_rep='NaN')
+        buffer.seek(0)
+        cursor = DBSession().connection().connection.cursor()
+        cursor.copy_expert(
+            f'COPY {values_table.name} FROM STDIN '
+            f'WITH (FORMAT csv, FORCE_NOT_NULL (obj_id, origin))',
+            buffer,
+        )
+        DBSession().execute(f'ANALYZE {values_table.name}')
+    else:
+        arrays = ', '.join(
+            f'CAST(:{name} AS {pgtype}[])' for name, (_, pgtype) in value_types.items()
+        )
+        values_table = (
+            sa.text(
+                f'SELECT * FROM unnest({arrays}) '
+                f'AS values_table ({", ".join(value_types)})'
+            )
+            .bindparams(**{name: keys[name].tolist() for name in value_types})
+            .columns(
+                *[column(name, satype) for name, (satype, _) in value_types.items()]
+            )
+            .alias('values_table')
+        )
 
-                    raise ValidationError(
-                        f'Error parsing packet "{packet}": '
-                        f'field {field} must be finite.'
-                    )
+    # make sure no duplicate data are posted using the index
+    condition = and_(
+        Photometry.obj_id == values_table.c.obj_id,
+        Photometry.instrument_id == values_table.c.instrument_id,
+        Photometry.origin == values_table.c.origin,
+        Photometry.mjd == values_table.c.mjd,
+        Photometry.fluxerr == values_table.c.fluxerr,
+        Photometry.flux == values_table.c.flux,
+    )
+
+    return values_table, condition
+
+
+def insert_new_photometry_data(
+    df, instrument_cache, group_ids, owner_id, validate=True, upload_id=None
+):
+    """Insert standardized photometry into the database and share it with
+    the given groups. The caller is responsible for locking (see
+    `lock_photometry`) and committing.
+
+    Parameters
+    ----------
+    df: `pandas.DataFrame`
+        Standardized photometry returned by `standardize_photometry_data`.
+    instrument_cache: dict
+        Instruments keyed by ID, returned by `standardize_photometry_data`.
+    group_ids: list of int
+        IDs of the groups to share the photometry with.
+    owner_id: int
+        ID of the User uploading the photometry.
+    validate: bool, optional
+        Raise a ValidationError if any of the photometry already exists.
+    upload_id: str, optional
+        Upload ID to assign to the new photometry. A new one is generated
+        if not provided.
+
+    Returns
+    -------
+    ids: list of int
+        IDs of the new photometry, in the order of `df`.
+    upload_id: str
+        Upload ID assigned to the new photometry.
+    """
+
+    # check for existing photometry and error if any is found
+
+    if validate:
+        values_table, condition = get_values_table_and_condition(df)
 
-            phot_table = Table.from_pandas(df[['mjd', 'magsys', 'filter', 'zp']])
-            phot_table['flux'] = df['flux'].fillna(np.nan)
-            phot_table['fluxerr'] = df['fluxerr'].fillna(np.nan)
-
-        # convert to microjanskies, AB for DB storage as a vectorized operation
-        pdata = PhotometricData(phot_table)
-        standardized = pdata.normalized(zp=PHOT_ZP, zpsys='ab')
-
-        df['standardized_flux'] = standardized.flux
-        df['standardized_fluxerr'] = standardized.fluxerr
-
-        instrument_cache = {}
-        for iid in df['instrument_id'].unique():
-            instrument = Instrument.query.get(int(iid))
-            if not instrument:
-                raise ValidationError(f'Invalid instrument ID: {iid}')
-            instrument_cache[iid] = instrument
-
-        for oid in df['obj_id'].unique():
-            obj = Obj.query.get(oid)
-            if not obj:
-                raise ValidationError(f'Invalid object ID: {oid}')
-
-        return df, instrument_cache
-
-    def get_values_table_and_condition(self, df):
-        """Return a postgres VALUES representation of the indexed columns of
-        a photometry dataframe returned by `standardize_photometry_data`.
-        Also returns the join condition for cross-matching the VALUES
-        representation of `df` against the Photometry table using the
-        deduplication index.
-
-        Parameters
-        ----------
-        df: `pandas.DataFrame`
-            Dataframe with the columns 'obj_id', 'instrument_id', 'origin',
-            'mjd', 'standardized_fluxerr', 'standardized_flux'.
-
-        Returns
-        -------
-        values_table: `sqlalchemy.sql.expression.FromClause`
-            The VALUES representation of the photometry DataFrame.
-
-        condition: `sqlalchemy.sql.elements.AsBoolean`
-           The join condition for cross matching the VALUES representation of
-           `df` against the Photometry table using the deduplication index.
-        """
+        duplicated_photometry = (
+            DBSession()
+            .query(Photometry)
+            .join(values_table, condition)
+            .options(joinedload(Photometry.groups))
+        )
 
-        # https://github.com/sqlalchemy/sqlalchemy/wiki/PGValues
-        class _photometry_values(FromClause):
-            """Render a postgres VALUES statement (in-memory constant table)."""
-
-            named_with_column = True
-
-            def __init__(self, columns, *args, **kw):
-                self._column_args = columns
-                self.list = args
-                self.alias_name = self.name = kw.pop("alias_name", None)
-
-            def _populate_column_collection(self):
-                for c in self._column_args:
-                    c._make_proxy(self)  # noqa
-
-            @property
-            def _from_objects(self):
-                return [self]
-
-        # https://github.com/sqlalchemy/sqlalchemy/wiki/PGValues
-        @compiles(_photometry_values)
-        def _compile_photometry_values(element, compiler, asfrom=False, **kw):
-            columns = element.columns
-
-            value_types = {
-                'pdidx': 'INTEGER',
-                'obj_id': 'CHARACTER VARYING',
-                'instrument_id': 'INTEGER',
-                'origin': 'CHARACTER VARYING',
-                'mjd': 'DOUBLE PRECISION',
-                'fluxerr': 'DOUBLE PRECISION',
-                'flux': 'DOUBLE PRECISION',
-            }
+        dict_rep = [d.to_dict() for d in duplicated_photometry]
 
-            def coerced_value(elem, column):
-                literal_value = compiler.render_literal_value(elem, column.type)
-                cast_value = value_types[column.name]
-                return f'{literal_value}::{cast_value}'
-
-            v = "VALUES %s" % ", ".join(
-                "(%s)"
-                % ", ".join(
-                    coerced_value(elem, column)
-                    if not (isinstance(elem, float) and math.isnan(elem))
-                    else "'NaN'::numeric"
-                    for elem, column in zip(tup, columns)
-                )
-                for tup in element.list
+        if len(dict_rep) > 0:
+            raise ValidationError(
+                'The following photometry already exists '
+                f'in the database: {dict_rep}.'
             )
-            if asfrom:
-                if element.alias_name:
-                    v = "(%s) AS %s (%s)" % (
-                        v,
-                        element.alias_name,
-                        (", ".join(c.name for c in element.columns)),
-                    )
-                else:
-                    v = "(%s)" % v
-            return v
-
-        values_table = _photometry_values(
-            (
-                column("pdidx", sa.Integer),
-                column("obj_id", sa.String),
-                column("instrument_id", sa.Integer),
-                column("origin", sa.String),
-                column("mjd", sa.Float),
-                column("fluxerr", sa.Float),
-                column("flux", sa.Float),
-            ),
-            *[
-                (
-                    idx,
-                    row["obj_id"],
-                    row["instrument_id"],
-                    row["origin"],
-                    float(row["mjd"]),
-                    float(row["standardized_fluxerr"]),
-                    float(row["standardized_flux"]),
-                )
-                for idx, row in df.iterrows()
-            ],
-            alias_name="values_table",
-        )
 
-        # make sure no duplicate data are posted using the index
-        condition = and_(
-            Photometry.obj_id == values_table.c.obj_id,
-            Photometry.instrument_id == values_table.c.instrument_id,
-            Photometry.origin == values_table.c.origin,
-            Photometry.mjd == values_table.c.mjd,
-            Photometry.fluxerr == values_table.c.fluxerr,
-            Photometry.flux == values_table.c.flux,
-        )
+    # pre-fetch the photometry PKs. these are not guaranteed to be
+    # gapless (e.g., 1, 2, 3, 4, 5, ...) but they are guaranteed
+    # to be unique in the table and thus can be used to "reserve"
+    # PK slots for uninserted rows
 
-        return values_table, condition
+    pkq = f"SELECT nextval('photometry_id_seq') FROM " f"generate_series(1, {len(df)})"
 
-    def insert_new_photometry_data(
-        self, df, instrument_cache, group_ids, validate=True
-    ):
-        # check for existing photometry and error if any is found
+    proxy = DBSession().execute(pkq)
 
-        if validate:
-            values_table, condition = self.get_values_table_and_condition(df)
+    # cache this as list for response
+    ids = [i[0] for i in proxy]
+    df['id'] = ids
 
-            duplicated_photometry = (
-                DBSession()
-                .query(Photometry)
-                .join(values_table, condition)
-                .options(joinedload(Photometry.groups))
+    update_detection_summaries(df)
+    # The rows are written through Core, which bypasses the mapper events
+    # that drop the plots of modified objects from memory
+    for obj_id in df['obj_id'].unique():
+        plot_cache.invalidate(obj_id)
+
+    df = df.where(pd.notnull(df), None)
+    df.loc[df['standardized_flux'].isna(), 'standardized_flux'] = np.nan
+
+    rows = df.to_dict('records')
+    if upload_id is None:
+        upload_id = str(uuid.uuid4())
+
+    params = []
+    for packet in rows:
+        if packet["filter"] not in instrument_cache[packet['instrument_id']].filters:
+            instrument = instrument_cache[packet['instrument_id']]
+            raise ValidationError(
+                f"Instrument {instrument.name} has no filter " f"{packet['filter']}."
             )
 
-            dict_rep = [d.to_dict() for d in duplicated_photometry]
+        flux = packet.pop('standardized_flux')
+        fluxerr = packet.pop('standardized_fluxerr')
+
+        # reduce the DB size by ~2x
+        keys = ['limiting_mag', 'magsys', 'limiting_mag_nsigma']
+        original_user_data = {key: packet[key] for key in keys if key in packet}
+        if original_user_data == {}:
+            original_user_data = None
+
+        phot = dict(
+            id=packet['id'],
+            original_user_data=original_user_data,
+            upload_id=upload_id,
+            flux=flux,
+            fluxerr=fluxerr,
+            obj_id=packet['obj_id'],
+            altdata=packet['altdata'],
+            instrument_id=packet['instrument_id'],
+            ra_unc=packet['ra_unc'],
+            dec_unc=packet['dec_unc'],
+            mjd=packet['mjd'],
+            filter=packet['filter'],
+            ra=packet['ra'],
+            dec=packet['dec'],
+            origin=packet["origin"],
+            owner_id=owner_id,
+        )
 
-            if len(dict_rep) > 0:
-                raise ValidationError(
-                    'The following photometry already exists '
-                    f'in the database: {dict_rep}.'
-                )
+        params.append(phot)
 
-        # pre-fetch the photometry PKs. these are not guaranteed to be
-        # gapless (e.g., 1, 2, 3, 4, 5, ...) but they are guaranteed
-        # to be unique in the table and thus can be used to "reserve"
-        # PK slots for uninserted rows
+    group_params = []
+    for id in ids:
+        for group_id in group_ids:
+            group_params.append({'photometr_id': id, 'group_id': group_id})
 
-        pkq = (
-            f"SELECT nextval('photometry_id_seq') FROM "
-            f"generate_series(1, {len(df)})"
+    #  actually do the insert. large batches are streamed in with COPY,
+    #  which avoids the per-row overhead of executemany
+    if len(params) >= cfg['photometry.copy_threshold']:
+        copy_rows(Photometry.__table__, params)
+        copy_rows(GroupPhotometry.__table__, group_params)
+    else:
+        DBSession().execute(Photometry.__table__.insert(), params)
+        DBSession().execute(GroupPhotometry.__table__.insert(), group_params)
+
+    return ids, upload_id
+
+
+def update_detection_summaries(df):
+    """Fold the detections (points with a S/N above 5) among new photometry
+    into the detection summaries of their Objs, without rescanning the
+    photometry already in the database. The caller is responsible for
+    committing.
+
+    Parameters
+    ----------
+    df: `pandas.DataFrame`
+        Standardized photometry returned by `standardize_photometry_data`.
+    """
+    flux = df['standardized_flux'].astype(float)
+    fluxerr = df['standardized_fluxerr'].astype(float)
+    detections = df[(fluxerr > 0) & (flux / fluxerr > 5.0)].assign(flux=flux)
+    if len(detections) == 0:
+        return
+
+    by_obj = detections.groupby('obj_id')
+    first = by_obj['mjd'].min()
+    last = by_obj['mjd'].max()
+    count = by_obj.size()
+    peaks = detections.groupby(['obj_id', 'filter'])['flux'].max()
+
+    summaries = (
+        DBSession()
+        .query(
+            Obj.id,
+            Obj.first_detected_mjd,
+            Obj.last_detected_mjd,
+            Obj.num_detections,
+            Obj.peak_detection_flux,
+        )
+        .filter(Obj.id.in_(list(count.index)))
+        .order_by(Obj.id)
+        .with_for_update()
+    )
+    params = []
+    for obj_id, first_mjd, last_mjd, num_detections, peak_flux in summaries:
+        peak_flux = dict(peak_flux or {})
+        for band, band_peak in peaks[obj_id].items():
+            peak_flux[band] = max(float(band_peak), peak_flux.get(band, -np.inf))
+        params.append(
+            {
+                'obj_id': obj_id,
+                'first_detected_mjd': float(
+                    min(first[obj_id], first_mjd)
+                    if first_mjd is not None
+                    else first[obj_id]
+                ),
+                'last_detected_mjd': float(
+                    max(last[obj_id], last_mjd)
+                    if last_mjd is not None
+                    else last[obj_id]
+                ),
+                'num_detections': (num_detections or 0) + int(count[obj_id]),
+                'peak_detection_flux': peak_flux,
+            }
         )
 
-        proxy = DBSession().execute(pkq)
+    objs = Obj.__table__
+    DBSession().execute(
+        objs.update().where(objs.c.id == sa.bindparam('obj_id')), params
+    )
+
+
+def lock_photometry(obj_ids):
+    """Serialize concurrent photometry uploads for the duration of the
+    current transaction.
+
+    With `photometry.lock_mode` set to "object", a transaction-level
+    advisory lock is taken for each uploaded obj_id. Because obj_id is
+    part of the deduplication index, two uploads can only collide if
+    they share an object, so uploads for different objects proceed in
+    parallel. The locks are acquired in a fixed order to avoid
+    deadlocks between uploads spanning several objects. With
+    `photometry.lock_mode` set to "table", the whole photometry table is
+    locked in SHARE ROW EXCLUSIVE mode, which is self-exclusive so that
+    only one upload can hold it at a time.
+
+    Parameters
+    ----------
+    obj_ids: iterable of str
+        IDs of the objects that photometry is being uploaded for.
+    """
+
+    lock_mode = cfg['photometry.lock_mode']
+    if lock_mode == 'table':
+        DBSession().execute(
+            f'LOCK TABLE {Photometry.__tablename__} IN SHARE ROW EXCLUSIVE MODE'
+        )
+    elif lock_mode == 'object':
+        DBSession().execute(
+            sa.text(
+                "SELECT pg_advisory_xact_lock("
+                "hashtext(:namespace), hashtext(sorted.obj_id)) "
+                "FROM (SELECT obj_id FROM unnest(CAST(:obj_ids AS VARCHAR[])) "
+                "AS obj_id ORDER BY obj_id) AS sorted"
+            ).bindparams(
+                namespace=Photometry.__tablename__,
+                obj_ids=sorted({str(obj_id) for obj_id in obj_ids}),
+            )
+        ).fetchall()
+    else:
+        raise ValueError(
+            'Invalid photometry.lock_mode, must be one of '
+            f"['object', 'table'], got '{lock_mode}'."
+        )
 
-        # cache this as list for response
-        ids = [i[0] for i in proxy]
-        df['id'] = ids
 
-        df = df.where(pd.notnull(df), None)
-        df.loc[df['standardized_flux'].isna(), 'standardized_flux'] = np.nan
+def upsert_photometry_data(df, instrument_cache, group_ids, owner_id, upload_id=None):
+    """Insert standardized photometry into the database, resolving
+    duplicates. Photometry that already exists is not inserted again, but
+    is shared with any of `group_ids` it was not already shared with.
+    The caller is responsible for committing, which releases the locks
+    taken by `lock_photometry`.
+
+    Parameters
+    ----------
+    df: `pandas.DataFrame`
+        Standardized photometry returned by `standardize_photometry_data`.
+    instrument_cache: dict
+        Instruments keyed by ID, returned by `standardize_photometry_data`.
+    group_ids: list of int
+        IDs of the groups to share the photometry with.
+    owner_id: int
+        ID of the User uploading the photometry.
+    upload_id: str, optional
+        Upload ID to assign to the new photometry.
+
+    Returns
+    -------
+    ids: list of int
+        IDs of the new or existing photometry, in the order of `df`.
+    n_duplicated: int
+        The number of rows of `df` that already existed in the database.
+    """
+
+    values_table, condition = get_values_table_and_condition(df)
+
+    # This lock ensures that no photometry for the uploaded objects is
+    # inserted between when the query for duplicate photometry is first
+    # executed and when the insert statement with the new photometry is
+    # performed.
+    lock_photometry(df['obj_id'])
+
+    new_photometry_query = (
+        DBSession()
+        .query(values_table.c.pdidx)
+        .outerjoin(Photometry, condition)
+        .filter(Photometry.id.is_(None))
+    )
+
+    new_photometry_df_idxs = [g[0] for g in new_photometry_query]
+
+    id_map = {}
+
+    duplicated_photometry = (
+        DBSession()
+        .query(values_table.c.pdidx, Photometry)
+        .join(Photometry, condition)
+        .options(joinedload(Photometry.groups))
+    )
+
+    for df_index, duplicate in duplicated_photometry:
+        id_map[df_index] = duplicate.id
+        duplicate_group_ids = set([g.id for g in duplicate.groups])
+
+        # posting to new groups?
+        if len(set(group_ids) - duplicate_group_ids) > 0:
+            # select old + new groups
+            group_ids_update = set(group_ids).union(duplicate_group_ids)
+            groups = (
+                DBSession().query(Group).filter(Group.id.in_(group_ids_update)).all()
+            )
+            # update the corresponding photometry entry in the db
+            duplicate.groups = groups
+
+    # now safely drop the duplicates:
+    new_photometry = df.loc[new_photometry_df_idxs]
+
+    if len(new_photometry) > 0:
+        ids, upload_id = insert_new_photometry_data(
+            new_photometry,
+            instrument_cache,
+            group_ids,
+            owner_id,
+            validate=False,
+            upload_id=upload_id,
+        )
 
-        rows = df.to_dict('records')
-        upload_id = str(uuid.uuid4())
+        for df_index, id in zip(new_photometry.index, ids):
+            id_map[df_index] = id
 
-        params = []
-        for packet in rows:
-            if (
-                packet["filter"]
-                not in instrument_cache[packet['instrument_id']].filters
-            ):
-                instrument = instrument_cache[packet['instrument_id']]
-                raise ValidationError(
-                    f"Instrument {instrument.name} has no filter "
-                    f"{packet['filter']}."
-                )
+    # get ids in the correct order
+    ids = [id_map[pdidx] for pdidx in df.index]
+    return ids, len(df) - len(new_photometry)
 
-            flux = packet.pop('standardized_flux')
-            fluxerr = packet.pop('standardized_fluxerr')
-
-            # reduce the DB size by ~2x
-            keys = ['limiting_mag', 'magsys', 'limiting_mag_nsigma']
-            original_user_data = {key: packet[key] for key in keys if key in packet}
-            if original_user_data == {}:
-                original_user_data = None
-
-            phot = dict(
-                id=packet['id'],
-                original_user_data=original_user_data,
-                upload_id=upload_id,
-                flux=flux,
-                fluxerr=fluxerr,
-                obj_id=packet['obj_id'],
-                altdata=packet['altdata'],
-                instrument_id=packet['instrument_id'],
-                ra_unc=packet['ra_unc'],
-                dec_unc=packet['dec_unc'],
-                mjd=packet['mjd'],
-                filter=packet['filter'],
-                ra=packet['ra'],
-                dec=packet['dec'],
-                origin=packet["origin"],
-                owner_id=self.associated_user_object.id,
+
+def get_ingest_executor():
+    """Return the pool of worker threads that ingest asynchronous uploads."""
+    global _ingest_executor
+    if _ingest_executor is None:
+        _ingest_executor = ThreadPoolExecutor(
+            max_workers=cfg['photometry.async_workers'],
+            thread_name_prefix='photometry_ingest',
+        )
+    return _ingest_executor
+
+
+def ingest_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def spool_photometry_payload(body):
+    """Durably write an uploaded photometry payload to the spool directory.
+
+    Parameters
+    ----------
+    body: bytes
+        The JSON request body.
+
+    Returns
+    -------
+    path: str
+        Absolute path of the spooled payload.
+    """
+    spool_dir = Path(cfg['photometry.spool_dir'])
+    spool_dir.mkdir(parents=True, exist_ok=True)
+    path = spool_dir / f'{uuid.uuid4().hex}.json'
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(body)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return str(path.absolute())
+
+
+def run_photometry_ingest_job(job_id):
+    """Ingest the spooled payload of a pending PhotometryIngestJob.
+
+    The job is claimed atomically, so that a job submitted to several
+    workers is only processed once. The payload is standardized as a
+    whole, then inserted in transactions of at most
+    `photometry.async_batch_size` points with the duplicate resolution of
+    PhotometryHandler.PUT. A batch that fails validation is rolled back and
+    counted as rejected without affecting the other batches. Because
+    duplicates are resolved, a job interrupted part-way can safely be
+    run again from the start.
+
+    Parameters
+    ----------
+    job_id: int
+        ID of the PhotometryIngestJob to run.
+    """
+    session = DBSession()
+    try:
+        claimed = (
+            session.query(PhotometryIngestJob)
+            .filter(
+                PhotometryIngestJob.id == job_id,
+                PhotometryIngestJob.status == 'pending',
+            )
+            .update(
+                {
+                    'status': 'running',
+                    'claimed_by': ingest_worker_id(),
+                    'n_accepted': 0,
+                    'n_duplicated': 0,
+                    'n_rejected': 0,
+                    'errors': None,
+                },
+                synchronize_session=False,
             )
+        )
+        session.commit()
+        if not claimed:
+            return
 
-            params.append(phot)
+        job = session.query(PhotometryIngestJob).get(job_id)
+        with open(job.spool_path) as f:
+            data = json.load(f)
 
-        #  actually do the insert
-        query = Photometry.__table__.insert()
-        DBSession().execute(query, params)
+        try:
+            df, instrument_cache = standardize_photometry_data(data)
+        except ValidationError as e:
+            session.rollback()
+            job.status = 'failed'
+            job.errors = [e.args[0]]
+            job.completed_at = datetime.utcnow()
+            session.commit()
+            os.remove(job.spool_path)
+            return
+
+        job.n_rows = len(df)
+        session.commit()
+
+        ids = []
+        batch_size = cfg['photometry.async_batch_size']
+        for start in range(0, len(df), batch_size):
+            stop = min(start + batch_size, len(df))
+            batch = df.iloc[start:stop]
+            try:
+                batch_ids, n_duplicated = upsert_photometry_data(
+                    batch,
+                    instrument_cache,
+                    job.group_ids,
+                    job.owner_id,
+                    upload_id=job.upload_id,
+                )
+            except ValidationError as e:
+                session.rollback()
+                job.n_rejected += len(batch)
+                job.errors = (job.errors or []) + [e.args[0]]
+                ids.extend([None] * len(batch))
+            else:
+                job.n_accepted += len(batch) - n_duplicated
+                job.n_duplicated += n_duplicated
+                ids.extend(batch_ids)
+            session.commit()
+
+        job.photometry_ids = ids
+        job.status = 'complete'
+        job.completed_at = datetime.utcnow()
+        session.commit()
+        os.remove(job.spool_path)
+    except Exception as e:
+        session.rollback()
+        log(f'Photometry ingest job {job_id} failed: {e}')
+        session.query(PhotometryIngestJob).filter(
+            PhotometryIngestJob.id == job_id
+        ).update(
+            {
+                'status': 'failed',
+                'errors': [str(e)],
+                'completed_at': datetime.utcnow(),
+            },
+            synchronize_session=False,
+        )
+        session.commit()
+        # Failed jobs are not recovered, so their payload is not needed
+        spool_path = (
+            session.query(PhotometryIngestJob.spool_path)
+            .filter(PhotometryIngestJob.id == job_id)
+            .scalar()
+        )
+        if spool_path is not None and os.path.exists(spool_path):
+            os.remove(spool_path)
+    finally:
+        DBSession.remove()
 
-        groupquery = GroupPhotometry.__table__.insert()
-        params = []
 
-        for id in ids:
-            for group_id in group_ids:
-                params.append({'photometr_id': id, 'group_id': group_id})
+def recover_photometry_ingest_jobs():
+    """Resubmit asynchronous photometry uploads spooled on this machine that
+    have not finished. Jobs still pending are resubmitted, as are running
+    jobs whose worker process no longer exists. Called on app startup."""
+
+    def worker_is_alive(claimed_by):
+        host, pid = claimed_by.rsplit(':', 1)
+        if host != socket.gethostname():
+            return True
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    jobs = (
+        DBSession()
+        .query(PhotometryIngestJob)
+        .filter(PhotometryIngestJob.status.in_(['pending', 'running']))
+        .all()
+    )
+    job_ids = []
+    for job in jobs:
+        if not os.path.exists(job.spool_path):
+            continue
+        if job.status == 'running':
+            if job.claimed_by is not None and worker_is_alive(job.claimed_by):
+                continue
+            job.status = 'pending'
+        job_ids.append(job.id)
+    DBSession().commit()
+
+    for job_id in job_ids:
+        log(f'Resubmitting photometry ingest job {job_id}')
+        get_ingest_executor().submit(run_photometry_ingest_job, job_id)
 
-        DBSession().execute(groupquery, params)
-        return ids, upload_id
 
+class PhotometryHandler(BaseHandler):
     def get_group_ids(self):
         data = self.get_json()
         group_ids = data.pop("group_ids", [])
@@ -595,6 +1334,19 @@ class PhotometryHandler(BaseHandler):
         group_ids = list(set(group_ids))
         return group_ids
 
+    def submit_ingest_job(self, group_ids):
+        """Spool the request body and queue it for asynchronous ingestion.
+        Returns the response to send to the client."""
+        job = PhotometryIngestJob(
+            owner_id=self.associated_user_object.id,
+            group_ids=group_ids,
+            spool_path=spool_photometry_payload(self.request.body),
+        )
+        DBSession().add(job)
+        DBSession().commit()
+        get_ingest_executor().submit(run_photometry_ingest_job, job.id)
+        return self.success(data={'job_id': job.id, 'upload_id': job.upload_id})
+
     @permissions(['Upload data'])
     def post(self):
         """
@@ -602,6 +1354,17 @@ class PhotometryHandler(BaseHandler):
         description: Upload photometry
         tags:
           - photometry
+        parameters:
+          - in: query
+            name: async
+            nullable: true
+            schema:
+              type: boolean
+            description: |
+              Queue the upload for background ingestion instead of inserting it
+              within the request. Queued uploads resolve duplicates as in PUT.
+              The response then contains a `job_id`, whose progress can be
+              followed at /api/photometry/jobs/{job_id}.
         requestBody:
           content:
             application/json:
@@ -632,6 +1395,12 @@ class PhotometryHandler(BaseHandler):
                                 Upload ID associated with all photometry points
                                 added in request. Can be used to later delete all
                                 points in a single request.
+                            job_id:
+                              type: integer
+                              description: |
+                                ID of the queued ingestion job. Only returned
+                                for asynchronous uploads, in which case `ids`
+                                is omitted.
         """
 
         try:
@@ -639,23 +1408,23 @@ class PhotometryHandler(BaseHandler):
         except ValidationError as e:
             return self.error(e.args[0])
 
+        async_ = self.get_query_argument('async', False) in ['true', True]
+        if async_:
+            return self.submit_ingest_job(group_ids)
+
         try:
-            df, instrument_cache = self.standardize_photometry_data()
+            df, instrument_cache = standardize_photometry_data(self.get_json())
         except ValidationError as e:
             return self.error(e.args[0])
 
-        # This lock ensures that the Photometry table data are not modified in any way
-        # between when the query for duplicate photometry is first executed and
-        # when the insert statement with the new photometry is performed.
-        # From the psql docs: This mode protects a table against concurrent
-        # data changes, and is self-exclusive so that only one session can
-        # hold it at a time.
-        DBSession().execute(
-            f'LOCK TABLE {Photometry.__tablename__} IN SHARE ROW EXCLUSIVE MODE'
-        )
+        # This lock ensures that no photometry for the uploaded objects is
+        # inserted between when the query for duplicate photometry is first
+        # executed and when the insert statement with the new photometry is
+        # performed.
+        lock_photometry(df['obj_id'])
         try:
-            ids, upload_id = self.insert_new_photometry_data(
-                df, instrument_cache, group_ids
+            ids, upload_id = insert_new_photometry_data(
+                df, instrument_cache, group_ids, self.associated_user_object.id
             )
         except ValidationError as e:
             return self.error(e.args[0])
@@ -670,6 +1439,17 @@ class PhotometryHandler(BaseHandler):
         description: Update and/or upload photometry, resolving potential duplicates
         tags:
           - photometry
+        parameters:
+          - in: query
+            name: async
+            nullable: true
+            schema:
+              type: boolean
+            description: |
+              Queue the upload for background ingestion instead of inserting it
+              within the request. Queued uploads resolve duplicates as in PUT.
+              The response then contains a `job_id`, whose progress can be
+              followed at /api/photometry/jobs/{job_id}.
         requestBody:
           content:
             application/json:
@@ -700,6 +1480,12 @@ class PhotometryHandler(BaseHandler):
                                 Upload ID associated with all photometry points
                                 added in request. Can be used to later delete all
                                 points in a single request.
+                            job_id:
+                              type: integer
+                              description: |
+                                ID of the queued ingestion job. Only returned
+                                for asynchronous uploads, in which case `ids`
+                                is omitted.
         """
 
         try:
@@ -707,77 +1493,23 @@ class PhotometryHandler(BaseHandler):
         except ValidationError as e:
             return self.error(e.args[0])
 
+        async_ = self.get_query_argument('async', False) in ['true', True]
+        if async_:
+            return self.submit_ingest_job(group_ids)
+
         try:
-            df, instrument_cache = self.standardize_photometry_data()
+            df, instrument_cache = standardize_photometry_data(self.get_json())
         except ValidationError as e:
             return self.error(e.args[0])
 
-        values_table, condition = self.get_values_table_and_condition(df)
-
-        # This lock ensures that the Photometry table data are not modified
-        # in any way between when the query for duplicate photometry is first
-        # executed and when the insert statement with the new photometry is
-        # performed. From the psql docs: This mode protects a table against
-        # concurrent data changes, and is self-exclusive so that only one
-        # session can hold it at a time.
-        DBSession().execute(
-            f'LOCK TABLE {Photometry.__tablename__} IN SHARE ROW EXCLUSIVE MODE'
-        )
-
-        new_photometry_query = (
-            DBSession()
-            .query(values_table.c.pdidx)
-            .outerjoin(Photometry, condition)
-            .filter(Photometry.id.is_(None))
-        )
-
-        new_photometry_df_idxs = [g[0] for g in new_photometry_query]
-
-        id_map = {}
-
-        duplicated_photometry = (
-            DBSession()
-            .query(values_table.c.pdidx, Photometry)
-            .join(Photometry, condition)
-            .options(joinedload(Photometry.groups))
-        )
-
-        for df_index, duplicate in duplicated_photometry:
-            id_map[df_index] = duplicate.id
-            duplicate_group_ids = set([g.id for g in duplicate.groups])
-
-            # posting to new groups?
-            if len(set(group_ids) - duplicate_group_ids) > 0:
-                # select old + new groups
-                group_ids_update = set(group_ids).union(duplicate_group_ids)
-                groups = (
-                    DBSession()
-                    .query(Group)
-                    .filter(Group.id.in_(group_ids_update))
-                    .all()
-                )
-                # update the corresponding photometry entry in the db
-                duplicate.groups = groups
-
-        # now safely drop the duplicates:
-        new_photometry = df.loc[new_photometry_df_idxs]
-
-        if len(new_photometry) > 0:
-            try:
-                ids, _ = self.insert_new_photometry_data(
-                    new_photometry, instrument_cache, group_ids, validate=False
-                )
-            except ValidationError as e:
-                return self.error(e.args[0])
-
-            for (df_index, _), id in zip(new_photometry.iterrows(), ids):
-                id_map[df_index] = id
+        try:
+            ids, _ = upsert_photometry_data(
+                df, instrument_cache, group_ids, self.associated_user_object.id
+            )
+        except ValidationError as e:
+            return self.error(e.args[0])
 
-        # release the lock
         DBSession().commit()
-
-        # get ids in the correct order
-        ids = [id_map[pdidx] for pdidx, _ in df.iterrows()]
         return self.success(data={'ids': ids})
 
     @auth_or_token
@@ -850,7 +1582,10 @@ class PhotometryHandler(BaseHandler):
 
         phot.original_user_data = data
         phot.id = photometry_id
+        old_obj_id = photometry.obj_id
         DBSession().merge(phot)
+        DBSession().flush()
+        refresh_detection_summaries({old_obj_id, photometry.obj_id})
 
         # Update groups, if relevant
         if group_ids is not None:
@@ -860,7 +1595,7 @@ class PhotometryHandler(BaseHandler):
                     "Invalid group_ids field. " "Specify at least one valid group ID."
                 )
             if not all(
-                [group in self.current_user.accessible_groups for group in groups]
+                [group.id in self.current_user.accessible_group_ids for group in groups]
             ):
                 return self.error(
                     "Cannot upload photometry to groups you " "are not a member of."
@@ -902,6 +1637,7 @@ class PhotometryHandler(BaseHandler):
         DBSession().query(Photometry).filter(
             Photometry.id == int(photometry_id)
         ).delete()
+        refresh_detection_summaries([photometry.obj_id])
         DBSession().commit()
 
         return self.success()
@@ -913,12 +1649,10 @@ class ObjPhotometryHandler(BaseHandler):
         obj = Obj.query.get(obj_id)
         if obj is None:
             return self.error('Invalid object id.')
-        photometry = Obj.get_photometry_readable_by_user(obj_id, self.current_user)
+        photometry = Obj.query_photometry_readable_by_user(obj_id, self.current_user)
         format = self.get_query_argument('format', 'mag')
         outsys = self.get_query_argument('magsys', 'ab')
-        return self.success(
-            data=[serialize(phot, outsys, format) for phot in photometry]
-        )
+        return self.success(data=serialize_photometry(photometry, outsys, format))
 
 
 class BulkDeletePhotometryHandler(BaseHandler):
@@ -949,20 +1683,114 @@ class BulkDeletePhotometryHandler(BaseHandler):
         phot_id = Photometry.query.filter(Photometry.upload_id == upload_id).first().id
         _ = Photometry.get_if_readable_by(phot_id, self.current_user)
 
+        obj_ids = [
+            obj_id
+            for obj_id, in DBSession()
+            .query(Photometry.obj_id)
+            .filter(Photometry.upload_id == upload_id)
+            .distinct()
+        ]
         n_deleted = (
             DBSession()
             .query(Photometry)
             .filter(Photometry.upload_id == upload_id)
             .delete()
         )
+        refresh_detection_summaries(obj_ids)
         DBSession().commit()
 
         return self.success(f"Deleted {n_deleted} photometry points.")
 
 
+class PhotometryIngestJobHandler(BaseHandler):
+    @auth_or_token
+    def get(self, job_id):
+        """
+        ---
+        description: Retrieve the status of an asynchronous photometry upload
+        tags:
+          - photometry
+        parameters:
+          - in: path
+            name: job_id
+            required: true
+            schema:
+              type: integer
+        responses:
+          200:
+            content:
+              application/json:
+                schema:
+                  allOf:
+                    - $ref: '#/components/schemas/Success'
+                    - type: object
+                      properties:
+                        data:
+                          type: object
+                          properties:
+                            id:
+                              type: integer
+                            status:
+                              type: string
+                              enum: [pending, running, complete, failed]
+                            n_rows:
+                              type: integer
+                              description: |
+                                Number of photometry points in the upload,
+                                once it has been standardized.
+                            n_accepted:
+                              type: integer
+                              description: Number of points inserted or updated
+                            n_duplicated:
+                              type: integer
+                              description: Number of points that already existed
+                            n_rejected:
+                              type: integer
+                              description: Number of points that failed validation
+                            photometry_ids:
+                              type: array
+                              items:
+                                type: integer
+                                nullable: true
+                              description: |
+                                Photometry IDs, in the order of the upload,
+                                once the job is complete. Rejected points
+                                have a null ID.
+                            upload_id:
+                              type: string
+                            errors:
+                              type: array
+                              items:
+                                type: string
+          400:
+            content:
+              application/json:
+                schema: Error
+        """
+        job = PhotometryIngestJob.query.get(job_id)
+        if job is None or not job.is_readable_by(self.current_user):
+            return self.error('Invalid photometry ingest job ID')
+
+        return self.success(
+            data={
+                'id': job.id,
+                'status': job.status,
+                'n_rows': job.n_rows,
+                'n_accepted': job.n_accepted,
+                'n_duplicated': job.n_duplicated,
+                'n_rejected': job.n_rejected,
+                'photometry_ids': job.photometry_ids,
+                'upload_id': job.upload_id,
+                'errors': job.errors,
+                'created_at': job.created_at,
+                'completed_at': job.completed_at,
+            }
+        )
+
+
 class PhotometryRangeHandler(BaseHandler):
     @auth_or_token
-    def get(self):
+    async def get(self):
         """Docstring appears below as an f-string."""
 
         json = self.get_json()
@@ -981,17 +1809,42 @@ class PhotometryRangeHandler(BaseHandler):
         if format not in ['mag', 'flux']:
             return self.error('Invalid output format.')
 
+        export = self.get_query_argument('export', None)
+        if export not in [None, 'ndjson', 'csv', 'parquet']:
+            return self.error('Invalid export format.')
+
+        num_per_page = self.get_query_argument('numPerPage', None)
+        after_mjd = self.get_query_argument('afterMjd', None)
+        after_id = self.get_query_argument('afterId', None)
+        try:
+            if num_per_page is not None:
+                num_per_page = int(num_per_page)
+                if num_per_page < 1:
+                    raise ValueError
+            if after_mjd is not None:
+                after_mjd = float(after_mjd)
+            if after_id is not None:
+                after_id = int(after_id)
+        except ValueError:
+            return self.error(
+                'numPerPage and afterId must be positive integers, '
+                'and afterMjd a number.'
+            )
+        if (after_mjd is None) != (after_id is None):
+            return self.error('afterMjd and afterId must be given together.')
+
         instrument_ids = standardized['instrument_ids']
         min_date = standardized['min_date']
         max_date = standardized['max_date']
 
-        gids = [g.id for g in self.current_user.accessible_groups]
+        gids = list(self.current_user.accessible_group_ids)
 
-        query = (
-            DBSession()
-            .query(Photometry)
-            .join(GroupPhotometry)
-            .filter(GroupPhotometry.group_id.in_(gids))
+        query = Photometry.query.filter(
+            Photometry.id.in_(
+                DBSession()
+                .query(GroupPhotometry.photometry_id)
+                .filter(GroupPhotometry.group_id.in_(gids))
+            )
         )
 
         if instrument_ids is not None:
@@ -1002,9 +1855,95 @@ class PhotometryRangeHandler(BaseHandler):
         if max_date is not None:
             mjd = Time(max_date, format='datetime').mjd
             query = query.filter(Photometry.mjd <= mjd)
+        query = query.order_by(Photometry.mjd, Photometry.id)
+
+        def page(after_mjd, after_id, limit):
+            # keyset pagination on (mjd, id); the plain mjd bound lets
+            # postgres range scan the mjd index instead of using OFFSET
+            page_query = query
+            if after_mjd is not None:
+                page_query = page_query.filter(
+                    Photometry.mjd >= after_mjd,
+                    sa.tuple_(Photometry.mjd, Photometry.id)
+                    > sa.tuple_(after_mjd, after_id),
+                )
+            if limit is not None:
+                page_query = page_query.limit(limit)
+            return serialize_photometry(page_query, magsys, format)
+
+        if export is None:
+            return self.success(data=page(after_mjd, after_id, num_per_page))
+
+        # stream the export in pages, so that neither the query results nor
+        # the response body have to fit in memory at once
+        self.set_status(200)
+        if export == 'ndjson':
+            self.set_header('Content-Type', 'application/x-ndjson')
+        elif export == 'csv':
+            self.set_header('Content-Type', 'text/csv; charset=utf-8')
+            self.set_header(
+                'Content-Disposition', 'attachment; filename=photometry.csv'
+            )
+        else:
+            self.set_header('Content-Type', 'application/octet-stream')
+            self.set_header(
+                'Content-Disposition', 'attachment; filename=photometry.parquet'
+            )
+            # each page is written as a row group
+            schema = pyarrow.schema(
+                [
+                    (name, PHOTOMETRY_EXPORT_TYPES[name])
+                    for name in PHOTOMETRY_EXPORT_COLUMNS[format]
+                ]
+            )
+            stream = ParquetStream()
+            writer = pyarrow.parquet.ParquetWriter(stream, schema)
+
+        chunk_size = cfg['photometry.export_chunk_size']
+        remaining = num_per_page
+        first = True
+        while remaining is None or remaining > 0:
+            limit = chunk_size if remaining is None else min(chunk_size, remaining)
+            output = page(after_mjd, after_id, limit)
+            if len(output) == 0 and not first:
+                break
+
+            if export == 'ndjson':
+                chunk = ''.join(to_json(point) + '\n' for point in output)
+            elif export == 'csv':
+                df = pd.DataFrame(output, columns=PHOTOMETRY_EXPORT_COLUMNS[format])
+                df['groups'] = [
+                    to_json([g.id for g in groups]) for groups in df['groups']
+                ]
+                chunk = df.to_csv(index=False, header=first)
+            else:
+                df = pd.DataFrame(output, columns=PHOTOMETRY_EXPORT_COLUMNS[format])
+                df['groups'] = [[g.id for g in groups] for groups in df['groups']]
+                writer.write_table(
+                    pyarrow.Table.from_pandas(df, schema=schema, preserve_index=False)
+                )
+                chunk = stream.drain()
 
-        output = [serialize(p, magsys, format) for p in query]
-        return self.success(data=output)
+            try:
+                self.write(chunk)
+                await self.flush()
+            except tornado.iostream.StreamClosedError:
+                # the client has closed the connection
+                return
+
+            first = False
+            if len(output) < limit:
+                break
+            if remaining is not None:
+                remaining -= len(output)
+            after_mjd, after_id = output[-1]['mjd'], output[-1]['id']
+
+        if export == 'parquet':
+            writer.close()
+            try:
+                self.write(stream.drain())
+            except tornado.iostream.StreamClosedError:
+                return
 
 
 PhotometryHandler.get.__doc__ = f"""
@@ -1126,6 +2065,43 @@ PhotometryRangeHandler.get.__doc__ = f"""
             schema:
               type: string
               enum: {list(ALLOWED_MAGSYSTEMS)}
+          - in: query
+            name: export
+            required: false
+            description: >-
+              Return the photometry as a file rather than a JSON response.
+              "ndjson" and "csv" are streamed in chunks, with one point per
+              line; "parquet" is streamed with one row group per chunk.
+              In the CSV and Parquet exports, `groups` holds group IDs.
+            schema:
+              type: string
+              enum:
+                - ndjson
+                - csv
+                - parquet
+          - in: query
+            name: numPerPage
+            required: false
+            description: >-
+              Maximum number of points to return. Points are ordered by
+              MJD, then ID.
+            schema:
+              type: integer
+          - in: query
+            name: afterMjd
+            required: false
+            description: >-
+              Only return points after the point with this MJD and the ID
+              given by `afterId`. Pass the MJD and ID of the last point
+              received to fetch the next page of a large query.
+            schema:
+              type: number
+          - in: query
+            name: afterId
+            required: false
+            description: ID of the point given by `afterMjd`.
+            schema:
+              type: integer
         requestBody:
           content:
             application/json:
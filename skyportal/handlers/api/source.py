@@ -7,13 +7,13 @@ from tornado.ioloop import IOLoop
 import io
 import math
 from dateutil.parser import isoparse
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, defer
 from sqlalchemy import func, or_, tuple_
 import arrow
 from marshmallow import Schema, fields
 from marshmallow.exceptions import ValidationError
 import functools
-import healpix_alchemy as ha
+from collections import defaultdict
 from baselayer.app.access import permissions, auth_or_token
 from baselayer.app.env import load_env
 from ..base import BaseHandler
@@ -23,6 +23,8 @@ from ...models import (
     Instrument,
     Obj,
     Source,
+    Spectrum,
+    Comment,
     Token,
     Group,
     FollowupRequest,
@@ -40,12 +42,28 @@ from ...utils import (
     get_finding_chart,
     _calculate_best_position_for_offset_stars,
 )
-from .candidate import grab_query_results, update_redshift_history_if_relevant
-from .photometry import serialize
+from .candidate import (
+    grab_query_results,
+    grab_query_results_by_cursor,
+    latest_row_per_obj,
+    update_redshift_history_if_relevant,
+)
+from .photometry import serialize_photometry
+from ...utils.derived_quantities import DERIVED_QUANTITIES
 
 
 SOURCES_PER_PAGE = 100
 
+# Derived quantities that sources can be filtered on, with the min<Name> and
+# max<Name> query arguments
+DERIVED_QUANTITY_FILTERS = {
+    "GalLon": Obj.gal_lon,
+    "GalLat": Obj.gal_lat,
+    "LuminosityDistance": Obj.luminosity_distance,
+    "DM": Obj.dm,
+    "AngularDiameterDistance": Obj.angular_diameter_distance,
+}
+
 _, cfg = load_env()
 
 
@@ -61,6 +79,140 @@ def apply_active_or_requested_filtering(query, include_requested, requested_only
     return query
 
 
+def get_source_groups(obj_ids, group_ids, include_requested, requested_only):
+    """Return the Groups, among `group_ids`, that each of `obj_ids` is saved
+    to, along with the save information of the corresponding Source rows.
+    Everything is fetched with a single query.
+
+    Returns
+    -------
+    groups : dict
+        Lists of serialized Groups, keyed by obj_id.
+    """
+    query = (
+        DBSession()
+        .query(Source, Group)
+        .join(Group, Group.id == Source.group_id)
+        .filter(Source.obj_id.in_(obj_ids), Source.group_id.in_(group_ids))
+        .options(joinedload(Source.saved_by))
+    )
+    query = apply_active_or_requested_filtering(
+        query, include_requested, requested_only
+    )
+
+    groups = defaultdict(list)
+    for source, group in query:
+        group_info = group.to_dict()
+        group_info["active"] = source.active
+        group_info["requested"] = source.requested
+        group_info["saved_at"] = source.saved_at
+        group_info["saved_by"] = (
+            source.saved_by.to_dict() if source.saved_by is not None else None
+        )
+        groups[source.obj_id].append(group_info)
+    return groups
+
+
+def assemble_source_list(
+    objs,
+    user_or_token,
+    include_comments=False,
+    include_photometry=False,
+    include_spectrum_exists=False,
+    include_requested=False,
+    requested_only=False,
+):
+    """Serialize a page of sources, loading their per-source relations
+    (groups, comments, annotations, classifications, photometry, last
+    detection and spectrum existence) with a fixed number of set-based
+    queries keyed by obj_id, rather than a few queries per source.
+
+    Parameters
+    ----------
+    objs : list of `skyportal.models.Obj`
+        The sources to serialize, in output order.
+    user_or_token : `baselayer.app.models.User` or `baselayer.app.models.Token`
+        The requesting User or Token.
+
+    Returns
+    -------
+    source_list : list of dict
+    """
+    obj_ids = [obj.id for obj in objs]
+    accessible_group_ids = list(user_or_token.accessible_group_ids)
+
+    def by_obj(items):
+        grouped = defaultdict(list)
+        for item in items:
+            grouped[item.obj_id].append(item)
+        return grouped
+
+    comments = {}
+    if include_comments:
+        comments = by_obj(
+            Obj.get_comments_readable_by(
+                obj_ids, user_or_token, options=[defer(Comment.attachment_bytes)]
+            )
+        )
+    annotations = by_obj(Obj.get_annotations_readable_by(obj_ids, user_or_token))
+    classifications = by_obj(
+        Obj.get_classifications_readable_by(obj_ids, user_or_token)
+    )
+
+    photometry = defaultdict(list)
+    if include_photometry:
+        for point in serialize_photometry(
+            Obj.query_photometry_readable_by_user(obj_ids, user_or_token), 'ab', 'flux',
+        ):
+            photometry[point["obj_id"]].append(point)
+
+    spectrum_obj_ids = set()
+    if include_spectrum_exists:
+        spectrum_obj_ids = {
+            obj_id
+            for obj_id, in DBSession()
+            .query(Obj.id)
+            .filter(
+                Obj.id.in_(obj_ids),
+                Obj.spectra.any(
+                    Spectrum.groups.any(Group.id.in_(accessible_group_ids))
+                ),
+            )
+        }
+
+    groups = get_source_groups(
+        obj_ids, accessible_group_ids, include_requested, requested_only
+    )
+
+    source_list = []
+    for obj in objs:
+        source_info = obj.to_dict()
+        if include_comments:
+            obj_comments = comments.get(obj.id, [])
+            source_info["comments"] = sorted(
+                [
+                    {k: v for k, v in c.to_dict().items() if k != "attachment_bytes"}
+                    for c in obj_comments
+                ],
+                key=lambda x: x["created_at"],
+                reverse=True,
+            )
+        source_info["classifications"] = classifications.get(obj.id, [])
+        source_info["annotations"] = sorted(
+            annotations.get(obj.id, []), key=lambda x: x.origin
+        )
+
+        source_info["last_detected"] = obj.last_detected
+        if include_photometry:
+            source_info["photometry"] = photometry[obj.id]
+        if include_spectrum_exists:
+            source_info["spectrum_exists"] = obj.id in spectrum_obj_ids
+        source_info["groups"] = groups[obj.id]
+        source_list.append(source_info)
+
+    return source_list
+
+
 def add_ps1_thumbnail_and_push_ws_msg(obj, request_handler):
     try:
         obj.add_ps1_thumbnail()
@@ -96,7 +248,7 @@ class SourceHandler(BaseHandler):
                 application/json:
                   schema: Error
         """
-        user_group_ids = [g.id for g in self.associated_user_object.accessible_groups]
+        user_group_ids = list(self.associated_user_object.accessible_group_ids)
         num_s = (
             DBSession()
             .query(Source)
@@ -195,6 +347,27 @@ class SourceHandler(BaseHandler):
             description: |
               Used only in the case of paginating query results - if provided, this
               allows for avoiding a potentially expensive query.count() call.
+          - in: query
+            name: useCursor
+            nullable: true
+            schema:
+              type: boolean
+            description: |
+              Boolean indicating whether to paginate with a cursor rather than
+              with page numbers. Sources are then returned by descending time
+              of their latest save to the selected groups, and the response
+              contains a `nextCursor` value to fetch the following page with,
+              which is null on the last page. Fetching a deep page costs the
+              same as fetching the first one, but no total number of matches
+              is returned. Cannot be combined with sortBy or saveSummary.
+          - in: query
+            name: cursor
+            nullable: true
+            schema:
+              type: string
+            description: |
+              The `nextCursor` value returned with the previous page of cursor
+              paginated results. Implies useCursor.
           - in: query
             name: startDate
             nullable: true
@@ -288,7 +461,8 @@ class SourceHandler(BaseHandler):
             schema:
               type: string
             description: |
-              The field to sort by. Currently allowed options are ["id", "ra", "dec", "redshift", "saved_at"]
+              The field to sort by. Currently allowed options are ["id", "ra", "dec", "redshift", "saved_at",
+              "gal_lon", "gal_lat", "luminosity_distance", "dm", "angular_diameter_distance"]
           - in: query
             name: sortOrder
             nullable: true
@@ -323,6 +497,86 @@ class SourceHandler(BaseHandler):
             description: |
               Comma-separated string of "taxonomy: classification" pair(s) to filter for sources matching
               that/those classification(s), i.e. "Sitewide Taxonomy: Type II, Sitewide Taxonomy: AGN"
+          - in: query
+            name: minGalLon
+            nullable: true
+            schema:
+              type: number
+            description: |
+              Only return sources with a galactic longitude of at least this
+              many degrees. Sources for which it is unknown are excluded.
+          - in: query
+            name: maxGalLon
+            nullable: true
+            schema:
+              type: number
+            description: |
+              Only return sources with a galactic longitude of at most this
+              many degrees. Sources for which it is unknown are excluded.
+          - in: query
+            name: minGalLat
+            nullable: true
+            schema:
+              type: number
+            description: |
+              Only return sources with a galactic latitude of at least this
+              many degrees. Sources for which it is unknown are excluded.
+          - in: query
+            name: maxGalLat
+            nullable: true
+            schema:
+              type: number
+            description: |
+              Only return sources with a galactic latitude of at most this
+              many degrees. Sources for which it is unknown are excluded.
+          - in: query
+            name: minLuminosityDistance
+            nullable: true
+            schema:
+              type: number
+            description: |
+              Only return sources with a luminosity distance of at least this
+              many Mpc. Sources for which it is unknown are excluded.
+          - in: query
+            name: maxLuminosityDistance
+            nullable: true
+            schema:
+              type: number
+            description: |
+              Only return sources with a luminosity distance of at most this
+              many Mpc. Sources for which it is unknown are excluded.
+          - in: query
+            name: minDM
+            nullable: true
+            schema:
+              type: number
+            description: |
+              Only return sources with a distance modulus of at least this
+              many magnitudes. Sources for which it is unknown are excluded.
+          - in: query
+            name: maxDM
+            nullable: true
+            schema:
+              type: number
+            description: |
+              Only return sources with a distance modulus of at most this
+              many magnitudes. Sources for which it is unknown are excluded.
+          - in: query
+            name: minAngularDiameterDistance
+            nullable: true
+            schema:
+              type: number
+            description: |
+              Only return sources with an angular diameter distance of at least this
+              many Mpc. Sources for which it is unknown are excluded.
+          - in: query
+            name: maxAngularDiameterDistance
+            nullable: true
+            schema:
+              type: number
+            description: |
+              Only return sources with an angular diameter distance of at most this
+              many Mpc. Sources for which it is unknown are excluded.
           responses:
             200:
               content:
@@ -345,12 +599,18 @@ class SourceHandler(BaseHandler):
                                 type: integer
                               numPerPage:
                                 type: integer
+                              nextCursor:
+                                type: string
+                                nullable: true
             400:
               content:
                 application/json:
                   schema: Error
         """
         page_number = self.get_query_argument('pageNumber', None)
+        cursor = self.get_query_argument('cursor', None)
+        use_cursor = self.get_query_argument('useCursor', False) in ['true', True]
+        use_cursor = use_cursor or cursor is not None
         num_per_page = min(
             int(self.get_query_argument("numPerPage", SOURCES_PER_PAGE)), 100
         )
@@ -423,7 +683,7 @@ class SourceHandler(BaseHandler):
                     f'Invalid group ids field ({group_ids}; Could not parse all elements to integers'
                 )
 
-        user_accessible_group_ids = [g.id for g in self.current_user.accessible_groups]
+        user_accessible_group_ids = list(self.current_user.accessible_group_ids)
 
         simbad_class = self.get_query_argument('simbadClass', None)
         has_tns_name = self.get_query_argument('hasTNSname', None)
@@ -487,64 +747,33 @@ class SourceHandler(BaseHandler):
                 self.current_user
             )
             source_info["last_detected"] = s.last_detected
-            source_info["gal_lat"] = s.gal_lat_deg
-            source_info["gal_lon"] = s.gal_lon_deg
-            source_info["luminosity_distance"] = s.luminosity_distance
-            source_info["dm"] = s.dm
-            source_info["angular_diameter_distance"] = s.angular_diameter_distance
 
             source_info["followup_requests"] = [
                 f for f in s.followup_requests if f.status != 'deleted'
             ]
             if include_photometry:
-                photometry = Obj.get_photometry_readable_by_user(
+                photometry = Obj.query_photometry_readable_by_user(
                     obj_id, self.current_user
                 )
-                source_info["photometry"] = [
-                    serialize(phot, 'ab', 'flux') for phot in photometry
-                ]
+                source_info["photometry"] = serialize_photometry(
+                    photometry, 'ab', 'flux'
+                )
             if include_spectrum_exists:
                 source_info["spectrum_exists"] = (
-                    len(Obj.get_spectra_readable_by(obj_id, self.current_user)) > 0
-                )
-            query = (
-                DBSession()
-                .query(Group)
-                .join(Source)
-                .filter(
-                    Source.obj_id == source_info["id"],
-                    Group.id.in_(user_accessible_group_ids),
-                )
-            )
-            query = apply_active_or_requested_filtering(
-                query, include_requested, requested_only
-            )
-            source_info["groups"] = [g.to_dict() for g in query.all()]
-            for group in source_info["groups"]:
-                source_table_row = Source.query.filter(
-                    Source.obj_id == s.id, Source.group_id == group["id"]
-                ).first()
-                group["active"] = source_table_row.active
-                group["requested"] = source_table_row.requested
-                group["saved_at"] = source_table_row.saved_at
-                group["saved_by"] = (
-                    source_table_row.saved_by.to_dict()
-                    if source_table_row.saved_by is not None
-                    else None
-                )
-
-            # add the date(s) this source was saved to each of these groups
-            for i, g in enumerate(source_info["groups"]):
-                saved_at = (
                     DBSession()
-                    .query(Source.saved_at)
-                    .filter(
-                        Source.obj_id == source_info["id"], Source.group_id == g["id"]
+                    .query(
+                        Spectrum.query.filter(
+                            Spectrum.obj_id == obj_id,
+                            Spectrum.groups.any(
+                                Group.id.in_(user_accessible_group_ids)
+                            ),
+                        ).exists()
                     )
-                    .first()
-                    .saved_at
+                    .scalar()
                 )
-                source_info["groups"][i]['saved_at'] = saved_at
+            source_info["groups"] = get_source_groups(
+                [obj_id], user_accessible_group_ids, include_requested, requested_only
+            )[obj_id]
 
             return self.success(data=source_info)
 
@@ -591,14 +820,19 @@ class SourceHandler(BaseHandler):
                 return self.error(
                     "Invalid values for ra, dec or radius - could not convert to float"
                 )
-            other = ha.Point(ra=ra, dec=dec)
-            q = q.filter(Obj.within(other, radius))
+            q = q.filter(Obj.within_cone(ra, dec, radius))
+        # Filter on the indexed MJD column rather than on its conversion to
+        # a timestamp (see the Obj.last_detected hybrid property)
         if start_date:
-            start_date = arrow.get(start_date.strip()).datetime
-            q = q.filter(Obj.last_detected >= start_date)
+            start_date = arrow.get(start_date.strip())
+            q = q.filter(
+                Obj.last_detected_mjd >= start_date.float_timestamp / 86400.0 + 40_587
+            )
         if end_date:
-            end_date = arrow.get(end_date.strip()).datetime
-            q = q.filter(Obj.last_detected <= end_date)
+            end_date = arrow.get(end_date.strip())
+            q = q.filter(
+                Obj.last_detected_mjd <= end_date.float_timestamp / 86400.0 + 40_587
+            )
         if saved_before:
             q = q.filter(Source.saved_at <= saved_before)
         if saved_after:
@@ -610,6 +844,16 @@ class SourceHandler(BaseHandler):
             )
         if has_tns_name in ['true', True]:
             q = q.filter(Obj.altdata['tns']['name'].isnot(None))
+        for name, column in DERIVED_QUANTITY_FILTERS.items():
+            for bound, op in (("min", column.__ge__), ("max", column.__le__)):
+                value = self.get_query_argument(f"{bound}{name}", None)
+                if value is None:
+                    continue
+                try:
+                    value = float(value)
+                except ValueError:
+                    return self.error(f"Invalid value for {bound}{name}: {value}")
+                q = q.filter(op(value))
         if classifications is not None:
             if isinstance(classifications, str) and "," in classifications:
                 classifications = [c.strip() for c in classifications.split(",")]
@@ -663,6 +907,13 @@ class SourceHandler(BaseHandler):
                     if sort_order == "asc"
                     else [Obj.redshift.desc().nullslast()]
                 )
+            elif sort_by in DERIVED_QUANTITIES:
+                column = getattr(Obj, sort_by)
+                order_by = (
+                    [column.nullslast()]
+                    if sort_order == "asc"
+                    else [column.desc().nullslast()]
+                )
             elif sort_by == "saved_at":
                 order_by = (
                     [Source.saved_at]
@@ -676,20 +927,48 @@ class SourceHandler(BaseHandler):
                     else [Classification.classification.desc().nullslast()]
                 )
 
-        if page_number:
+        if use_cursor:
+            if save_summary or sort_by is not None:
+                return self.error(
+                    "sortBy and saveSummary are not supported with cursor pagination."
+                )
+            scope_group_ids = (
+                group_ids if group_ids is not None else user_accessible_group_ids
+            )
+
+            def source_scope(source):
+                scope = [source.group_id.in_(scope_group_ids)]
+                if include_requested:
+                    scope.append(
+                        or_(source.requested.is_(True), source.active.is_(True))
+                    )
+                elif not requested_only:
+                    scope.append(source.active.is_(True))
+                if requested_only:
+                    scope.append(source.active.is_(False))
+                    scope.append(source.requested.is_(True))
+                if saved_before:
+                    scope.append(source.saved_at <= saved_before)
+                if saved_after:
+                    scope.append(source.saved_at >= saved_after)
+                return scope
+
+            # Key each Obj on its latest save to the selected groups
+            q = q.filter(latest_row_per_obj(Source, "saved_at", source_scope))
+            try:
+                query_results = grab_query_results_by_cursor(
+                    q, Source.saved_at, cursor, num_per_page, "sources"
+                )
+            except ValueError as e:
+                return self.error(str(e))
+        elif page_number:
             try:
                 page = int(page_number)
             except ValueError:
                 return self.error("Invalid page number value.")
             try:
                 query_results = grab_query_results(
-                    q,
-                    total_matches,
-                    page,
-                    num_per_page,
-                    "sources",
-                    order_by=order_by,
-                    include_photometry=include_photometry,
+                    q, total_matches, page, num_per_page, "sources", order_by=order_by,
                 )
             except ValueError as e:
                 if "Page number out of range" in str(e):
@@ -699,100 +978,19 @@ class SourceHandler(BaseHandler):
             query_results = {"sources": q.all()}
         else:
             query_results = grab_query_results(
-                q,
-                total_matches,
-                None,
-                None,
-                "sources",
-                order_by=order_by,
-                include_photometry=include_photometry,
+                q, total_matches, None, None, "sources", order_by=order_by,
             )
 
         if not save_summary:
-            source_list = []
-            for source in query_results["sources"]:
-                source_list.append(source.to_dict())
-                if include_comments:
-                    source_list[-1]["comments"] = sorted(
-                        [
-                            {
-                                k: v
-                                for k, v in c.to_dict().items()
-                                if k != "attachment_bytes"
-                            }
-                            for c in source.get_comments_readable_by(self.current_user)
-                        ],
-                        key=lambda x: x["created_at"],
-                        reverse=True,
-                    )
-                source_list[-1][
-                    "classifications"
-                ] = source.get_classifications_readable_by(self.current_user)
-                source_list[-1]["annotations"] = sorted(
-                    source.get_annotations_readable_by(self.current_user),
-                    key=lambda x: x.origin,
-                )
-                source_list[-1]["last_detected"] = source.last_detected
-                source_list[-1]["gal_lon"] = source.gal_lon_deg
-                source_list[-1]["gal_lat"] = source.gal_lat_deg
-                source_list[-1]["luminosity_distance"] = source.luminosity_distance
-                source_list[-1]["dm"] = source.dm
-                source_list[-1][
-                    "angular_diameter_distance"
-                ] = source.angular_diameter_distance
-                if include_photometry:
-                    photometry = Obj.get_photometry_readable_by_user(
-                        source.id, self.current_user
-                    )
-                    source_list[-1]["photometry"] = [
-                        serialize(phot, 'ab', 'flux') for phot in photometry
-                    ]
-                if include_spectrum_exists:
-                    source_list[-1]["spectrum_exists"] = (
-                        len(Obj.get_spectra_readable_by(source.id, self.current_user))
-                        > 0
-                    )
-
-                groups_query = (
-                    DBSession()
-                    .query(Group)
-                    .join(Source)
-                    .filter(
-                        Source.obj_id == source_list[-1]["id"],
-                        Group.id.in_(user_accessible_group_ids),
-                    )
-                )
-                groups_query = apply_active_or_requested_filtering(
-                    groups_query, include_requested, requested_only
-                )
-                groups = groups_query.all()
-                source_list[-1]["groups"] = [g.to_dict() for g in groups]
-                for group in source_list[-1]["groups"]:
-                    source_table_row = Source.query.filter(
-                        Source.obj_id == source.id, Source.group_id == group["id"]
-                    ).first()
-                    group["active"] = source_table_row.active
-                    group["requested"] = source_table_row.requested
-                    group["saved_at"] = source_table_row.saved_at
-                    group["saved_by"] = (
-                        source_table_row.saved_by.to_dict()
-                        if source_table_row.saved_by is not None
-                        else None
-                    )
-
-                # add the date(s) this source was saved to each of these groups
-                for i, g in enumerate(source_list[-1]["groups"]):
-                    saved_at = (
-                        DBSession()
-                        .query(Source.saved_at)
-                        .filter(
-                            Source.obj_id == source_list[-1]["id"],
-                            Source.group_id == g["id"],
-                        )
-                        .first()
-                        .saved_at
-                    )
-                    source_list[-1]["groups"][i]['saved_at'] = saved_at
+            source_list = assemble_source_list(
+                query_results["sources"],
+                self.current_user,
+                include_comments=include_comments,
+                include_photometry=include_photometry,
+                include_spectrum_exists=include_spectrum_exists,
+                include_requested=include_requested,
+                requested_only=requested_only,
+            )
             query_results["sources"] = source_list
 
         return self.success(data=query_results)
@@ -849,7 +1047,7 @@ class SourceHandler(BaseHandler):
             return self.error("Dec must not be null for a new Obj")
 
         user_group_ids = [g.id for g in self.current_user.groups]
-        user_accessible_group_ids = [g.id for g in self.current_user.accessible_groups]
+        user_accessible_group_ids = list(self.current_user.accessible_group_ids)
         if not user_group_ids:
             return self.error(
                 "You must belong to one or more groups before " "you can add sources."
@@ -978,7 +1176,7 @@ class SourceHandler(BaseHandler):
               application/json:
                 schema: Success
         """
-        if group_id not in [g.id for g in self.current_user.accessible_groups]:
+        if group_id not in self.current_user.accessible_group_ids:
             return self.error("Inadequate permissions.")
         s = (
             DBSession()
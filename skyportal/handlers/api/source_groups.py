@@ -62,9 +62,7 @@ class SourceGroupsHandler(BaseHandler):
                 "Missing required parameter: one of either unsaveGroupIds or inviteGroupIds must be provided"
             )
         for save_or_invite_group_id in save_or_invite_group_ids:
-            if int(save_or_invite_group_id) in [
-                g.id for g in self.current_user.accessible_groups
-            ]:
+            if int(save_or_invite_group_id) in (self.current_user.accessible_group_ids):
                 active = True
                 requested = False
             else:
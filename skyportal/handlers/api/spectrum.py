@@ -182,7 +182,7 @@ class SpectrumHandler(BaseHandler):
             .filter(
                 Spectrum.id == spectrum_id,
                 GroupSpectrum.group_id.in_(
-                    [g.id for g in self.current_user.accessible_groups]
+                    list(self.current_user.accessible_group_ids)
                 ),
             )
             .options(joinedload(Spectrum.groups))
@@ -526,6 +526,16 @@ class ObjSpectraHandler(BaseHandler):
               If omitted, returns the original spectrum.
               Options for normalization are:
               - median: normalize the flux to have median==1
+          - in: query
+            name: metadataOnly
+            nullable: true
+            schema:
+              type: boolean
+            description: |
+              If true, return the spectra without their data arrays
+              (wavelengths, fluxes, errors) and original file, which can
+              be retrieved in bulk from /api/spectrum/data. Cannot be
+              combined with normalization. Defaults to false.
 
         responses:
           200:
@@ -555,8 +565,18 @@ class ObjSpectraHandler(BaseHandler):
         obj = Obj.query.get(obj_id)
         if obj is None:
             return self.error('Invalid object ID.')
+
+        normalization = self.get_query_argument('normalization', None)
+        metadata_only = self.get_query_argument('metadataOnly', False)
+        metadata_only = metadata_only in ['true', True]
+        if metadata_only and normalization is not None:
+            return self.error('Cannot normalize spectra without their data.')
+
         spectra = Obj.get_spectra_readable_by(
-            obj_id, self.current_user, options=[joinedload(Spectrum.groups)]
+            obj_id,
+            self.current_user,
+            options=[joinedload(Spectrum.groups)],
+            metadata_only=metadata_only,
         )
         return_values = []
         for spec in spectra:
@@ -568,8 +588,6 @@ class ObjSpectraHandler(BaseHandler):
             spec_dict["owner"] = spec.owner
             return_values.append(spec_dict)
 
-        normalization = self.get_query_argument('normalization', None)
-
         if normalization is not None:
             if normalization == "median":
                 for s in return_values:
@@ -623,6 +641,16 @@ class SpectrumRangeHandler(BaseHandler):
             description: |
               Maximum UTC date of range in ISOT format. If None,
               open ended range.
+          - in: query
+            name: metadataOnly
+            nullable: true
+            schema:
+              type: boolean
+            description: |
+              If true, return the spectra without their data arrays
+              (wavelengths, fluxes, errors) and original file, which can
+              be retrieved in bulk from /api/spectrum/data. Defaults to
+              false.
 
         responses:
           200:
@@ -652,8 +680,10 @@ class SpectrumRangeHandler(BaseHandler):
         instrument_ids = self.get_query_arguments('instrument_ids')
         min_date = self.get_query_argument('min_date', None)
         max_date = self.get_query_argument('max_date', None)
+        metadata_only = self.get_query_argument('metadataOnly', False)
+        metadata_only = metadata_only in ['true', True]
 
-        gids = [g.id for g in self.current_user.accessible_groups]
+        gids = list(self.current_user.accessible_group_ids)
 
         query = (
             DBSession()
@@ -670,5 +700,91 @@ class SpectrumRangeHandler(BaseHandler):
         if max_date is not None:
             utc = Time(max_date, format='isot', scale='utc')
             query = query.filter(Spectrum.observed_at <= utc.isot)
+        if metadata_only:
+            query = query.options(Spectrum.metadata_only())
 
         return self.success(data=query.all())
+
+
+class SpectrumDataHandler(BaseHandler):
+    @auth_or_token
+    def get(self):
+        """
+        ---
+        description: |
+          Retrieve the data arrays of several spectra at once, e.g. those
+          listed by /api/spectrum/range?metadataOnly=true
+        tags:
+          - spectra
+        parameters:
+          - in: query
+            name: ids
+            required: true
+            schema:
+              type: list of integers
+            description: |
+              IDs of the spectra to retrieve, either as repeated arguments
+              or comma-separated.
+        responses:
+          200:
+            content:
+              application/json:
+                schema:
+                  allOf:
+                    - $ref: '#/components/schemas/Success'
+                    - type: object
+                      properties:
+                        data:
+                          type: array
+                          items:
+                            type: object
+                            properties:
+                              id:
+                                type: integer
+                              wavelengths:
+                                type: array
+                                items:
+                                  type: number
+                              fluxes:
+                                type: array
+                                items:
+                                  type: number
+                              errors:
+                                type: array
+                                items:
+                                  type: number
+          400:
+            content:
+              application/json:
+                schema: Error
+        """
+
+        try:
+            spectrum_ids = {
+                int(spectrum_id)
+                for arg in self.get_query_arguments('ids')
+                for spectrum_id in arg.split(',')
+                if spectrum_id.strip()
+            }
+        except ValueError:
+            return self.error('Spectrum IDs must be integers.')
+        if not spectrum_ids:
+            return self.error('Please specify at least one spectrum ID.')
+
+        gids = list(self.current_user.accessible_group_ids)
+        spectra = (
+            DBSession()
+            .query(Spectrum.id, Spectrum.wavelengths, Spectrum.fluxes, Spectrum.errors)
+            .filter(
+                Spectrum.id.in_(spectrum_ids), Spectrum.groups.any(Group.id.in_(gids)),
+            )
+            .order_by(Spectrum.id)
+            .all()
+        )
+        missing = spectrum_ids - {spectrum.id for spectrum in spectra}
+        if missing:
+            return self.error(
+                f'Invalid spectrum IDs: {", ".join(map(str, sorted(missing)))}'
+            )
+
+        return self.success(data=[spectrum._asdict() for spectrum in spectra])
@@ -57,7 +57,7 @@ class TaxonomyHandler(BaseHandler):
 
         query = Taxonomy.query.filter(
             Taxonomy.groups.any(
-                Group.id.in_([g.id for g in self.current_user.accessible_groups])
+                Group.id.in_(list(self.current_user.accessible_group_ids))
             )
         )
         return self.success(data=query.all())
@@ -163,7 +163,7 @@ class TaxonomyHandler(BaseHandler):
 
         # establish the groups to use
         user_group_ids = [g.id for g in self.current_user.groups]
-        user_accessible_group_ids = [g.id for g in self.current_user.accessible_groups]
+        user_accessible_group_ids = list(self.current_user.accessible_group_ids)
         group_ids = data.pop("group_ids", user_group_ids)
         if group_ids == []:
             group_ids = user_group_ids
@@ -1,5 +1,6 @@
 import yaml
 import uuid
+import zlib
 import re
 import json
 import warnings
@@ -16,7 +17,7 @@ import sqlalchemy as sa
 from sqlalchemy import cast, event
 from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.dialects import postgresql as psql
-from sqlalchemy.orm import relationship, joinedload
+from sqlalchemy.orm import relationship, joinedload, selectinload, defer
 from sqlalchemy.schema import UniqueConstraint
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.hybrid import hybrid_property
@@ -33,6 +34,8 @@ from astropy.io import fits, ascii
 import healpix_alchemy as ha
 
 from .utils.cosmology import establish_cosmology
+from .utils.healpix import HEALPIX_ORDER, ang2pix, cone_ranges
+from .utils.derived_quantities import DERIVED_QUANTITIES, derived_quantities
 from baselayer.app.models import (  # noqa
     init_db,
     join_model,
@@ -112,9 +115,13 @@ def is_readable_by(self, user_or_token):
     if hasattr(self, 'tokens'):
         return user_or_token in self.tokens
     if hasattr(self, 'groups'):
-        return bool(set(self.groups) & set(user_or_token.accessible_groups))
+        accessible_group_ids = user_or_token.accessible_group_ids
+        return any(g.id in accessible_group_ids for g in self.groups)
     if hasattr(self, 'group'):
-        return self.group in user_or_token.accessible_groups
+        return (
+            self.group is not None
+            and self.group.id in user_or_token.accessible_group_ids
+        )
     if hasattr(self, 'users'):
         if hasattr(user_or_token, 'created_by'):
             if user_or_token.created_by in self.users:
@@ -163,6 +170,51 @@ class NumpyArray(sa.types.TypeDecorator):
         return np.array(value)
 
 
+class BinaryArray(sa.types.TypeDecorator):
+    """SQLAlchemy representation of a one-dimensional NumPy array, stored as
+    the raw bytes of its elements (`bytea`), optionally zlib-compressed.
+
+    Arrays are read back with `np.frombuffer`, without going through a Python
+    object per element; uncompressed arrays are not even copied, and are
+    therefore read-only.
+    """
+
+    impl = sa.LargeBinary
+
+    def __init__(self, dtype='<f8', compress=False):
+        """
+        Parameters
+        ----------
+        dtype : str or `numpy.dtype`, optional
+            Type of the stored elements, e.g. '<f4' or '<f8' (the default).
+        compress : bool, optional
+            Whether to compress the stored bytes.
+        """
+        super().__init__()
+        self.dtype = np.dtype(dtype)
+        self.compress = compress
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        data = np.ascontiguousarray(value, dtype=self.dtype).tobytes()
+        if self.compress:
+            data = zlib.compress(data, 1)
+        return data
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if self.compress:
+            value = zlib.decompress(value)
+        return np.frombuffer(value, dtype=self.dtype)
+
+    def compare_values(self, x, y):
+        if x is None or y is None:
+            return x is y
+        return np.array_equal(x, y)
+
+
 class Group(Base):
     """A user group. `Group`s controls `User` access to `Filter`s and serve as
     targets for data sharing requests. `Photometry` and `Spectra` shared with
@@ -388,34 +440,108 @@ User.single_user_group = property(
 )
 
 
+def _access_cache(user_or_token):
+    """Return the dict in which the access rights of a User or Token are
+    memoized. The cache lives on the instance and is dropped whenever the
+    instance is expired (e.g., on commit), so in practice it is resolved
+    once per request."""
+    return user_or_token.__dict__.setdefault('_access_cache', {})
+
+
+@event.listens_for(User, 'expire')
+@event.listens_for(Token, 'expire')
+def _clear_access_cache(target, attrs):
+    target.__dict__.pop('_access_cache', None)
+
+
 @property
 def user_or_token_accessible_groups(self):
     """Return the list of Groups a User or Token has access to. For non-admin
     Users or Token owners, this corresponds to the Groups they are a member of.
     For System Admins, this corresponds to all Groups."""
-    if "System admin" in self.permissions:
-        return Group.query.all()
-    return self.groups
+    cache = _access_cache(self)
+    if 'groups' not in cache:
+        if "System admin" in self.permissions:
+            cache['groups'] = Group.query.all()
+        else:
+            cache['groups'] = self.groups
+    return cache['groups']
 
 
 User.accessible_groups = user_or_token_accessible_groups
 Token.accessible_groups = user_or_token_accessible_groups
 
 
+@property
+def user_or_token_accessible_group_ids(self):
+    """Return the set of the IDs of the Groups a User or Token has access
+    to. Use this rather than `accessible_groups` for membership tests."""
+    cache = _access_cache(self)
+    if 'group_ids' not in cache:
+        if "System admin" in self.permissions:
+            cache['group_ids'] = frozenset(
+                group_id for group_id, in DBSession().query(Group.id)
+            )
+        else:
+            cache['group_ids'] = frozenset(g.id for g in self.accessible_groups)
+    return cache['group_ids']
+
+
+User.accessible_group_ids = user_or_token_accessible_group_ids
+Token.accessible_group_ids = user_or_token_accessible_group_ids
+
+
 @property
 def user_or_token_accessible_streams(self):
     """Return the list of Streams a User or Token has access to."""
-    if "System admin" in self.permissions:
-        return Stream.query.all()
-    if isinstance(self, Token):
-        return self.created_by.streams
-    return self.streams
+    cache = _access_cache(self)
+    if 'streams' not in cache:
+        if "System admin" in self.permissions:
+            cache['streams'] = Stream.query.all()
+        elif isinstance(self, Token):
+            cache['streams'] = self.created_by.streams
+        else:
+            cache['streams'] = self.streams
+    return cache['streams']
 
 
 User.accessible_streams = user_or_token_accessible_streams
 Token.accessible_streams = user_or_token_accessible_streams
 
 
+@property
+def user_or_token_accessible_stream_ids(self):
+    """Return the set of the IDs of the Streams a User or Token has access
+    to."""
+    cache = _access_cache(self)
+    if 'stream_ids' not in cache:
+        cache['stream_ids'] = frozenset(s.id for s in self.accessible_streams)
+    return cache['stream_ids']
+
+
+User.accessible_stream_ids = user_or_token_accessible_stream_ids
+Token.accessible_stream_ids = user_or_token_accessible_stream_ids
+
+
+@property
+def user_or_token_accessible_filter_ids(self):
+    """Return the set of the IDs of the Filters belonging to the Groups a
+    User or Token has access to."""
+    cache = _access_cache(self)
+    if 'filter_ids' not in cache:
+        cache['filter_ids'] = frozenset(
+            filter_id
+            for filter_id, in DBSession()
+            .query(Filter.id)
+            .filter(Filter.group_id.in_(list(self.accessible_group_ids)))
+        )
+    return cache['filter_ids']
+
+
+User.accessible_filter_ids = user_or_token_accessible_filter_ids
+Token.accessible_filter_ids = user_or_token_accessible_filter_ids
+
+
 @property
 def token_groups(self):
     """The groups the Token owner is a member of."""
@@ -434,6 +560,14 @@ class Obj(Base, ha.Point):
     id = sa.Column(sa.String, primary_key=True, doc="Name of the object.")
     # TODO should this column type be decimal? fixed-precison numeric
 
+    healpix = sa.Column(
+        sa.BigInteger,
+        nullable=True,
+        index=True,
+        doc=f"NESTED HEALPix pixel number of the object's position at order "
+        f"{HEALPIX_ORDER}, used to index cone searches.",
+    )
+
     ra_dis = sa.Column(sa.Float, doc="J2000 Right Ascension at discovery time [deg].")
     dec_dis = sa.Column(sa.Float, doc="J2000 Declination at discovery time [deg].")
 
@@ -464,6 +598,28 @@ class Obj(Base, ha.Point):
         "`{'gaia': {'info': {'Teff': 5780}}}`",
     )
 
+    # Quantities derived from the position, redshift and altdata, maintained
+    # as those change (see `update_derived_quantities`)
+    gal_lon = sa.Column(
+        sa.Float, nullable=True, index=True, doc="Galactic longitude [deg]."
+    )
+    gal_lat = sa.Column(
+        sa.Float, nullable=True, index=True, doc="Galactic latitude [deg]."
+    )
+    luminosity_distance = sa.Column(
+        sa.Float,
+        nullable=True,
+        index=True,
+        doc="Luminosity distance [Mpc], from the `dm`, `parallax` (arcsec), "
+        "`dist_kpc`, `dist_Mpc`, `dist_pc` or `dist_cm` given in `altdata` "
+        "(picked up in that order), or else from the redshift. Null if the "
+        "redshift puts the object outside of the Hubble flow.",
+    )
+    dm = sa.Column(sa.Float, nullable=True, index=True, doc="Distance modulus [mag].")
+    angular_diameter_distance = sa.Column(
+        sa.Float, nullable=True, index=True, doc="Angular diameter distance [Mpc]."
+    )
+
     dist_nearest_source = sa.Column(
         sa.Float, nullable=True, doc="Distance to the nearest Obj [arcsec]."
     )
@@ -492,6 +648,35 @@ class Obj(Base, ha.Point):
 
     score = sa.Column(sa.Float, nullable=True, doc="Machine learning score.")
 
+    # Detection summary, maintained as photometry is added or removed: by
+    # the Photometry ORM events for points inserted or deleted through the
+    # ORM, and by the photometry handlers for bulk inserts, updates and
+    # deletes. Any other bulk change to photometry must be followed by
+    # `refresh_detection_summaries`.
+    first_detected_mjd = sa.Column(
+        sa.Float,
+        nullable=True,
+        doc="MJD of the first detection of the object above a S/N of 5.",
+    )
+    last_detected_mjd = sa.Column(
+        sa.Float,
+        nullable=True,
+        doc="MJD of the last detection of the object above a S/N of 5.",
+    )
+    num_detections = sa.Column(
+        sa.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+        doc="Number of detections of the object above a S/N of 5.",
+    )
+    peak_detection_flux = sa.Column(
+        JSONB,
+        nullable=True,
+        doc="Peak flux [AB zeropoint 23.9] of the detections of the object "
+        "above a S/N of 5, keyed by filter.",
+    )
+
     origin = sa.Column(sa.String, nullable=True, doc="Origin of the object.")
 
     internal_key = sa.Column(
@@ -588,18 +773,28 @@ class Obj(Base, ha.Point):
     @hybrid_property
     def last_detected(self):
         """UTC ISO date at which the object was last detected above a S/N of 5."""
-        detections = [phot.iso for phot in self.photometry if phot.snr and phot.snr > 5]
-        return max(detections) if detections else None
+        if self.last_detected_mjd is None:
+            return None
+        return arrow.get((self.last_detected_mjd - 40_587) * 86400.0)
 
     @last_detected.expression
     def last_detected(cls):
         """UTC ISO date at which the object was last detected above a S/N of 5."""
-        return (
-            sa.select([sa.func.max(Photometry.iso)])
-            .where(Photometry.obj_id == cls.id)
-            .where(Photometry.snr > 5.0)
-            .group_by(Photometry.obj_id)
-            .label('last_detected')
+        return sa.func.to_timestamp((cls.last_detected_mjd - 40_587) * 86400.0)
+
+    @classmethod
+    def within_cone(cls, ra, dec, radius):
+        """Return a criterion matching the Objs within `radius` degrees of
+        (`ra`, `dec`). Candidates are looked up on the HEALPix index first,
+        then checked against the exact distance."""
+        return sa.and_(
+            sa.or_(
+                *[
+                    cls.healpix.between(lo, hi)
+                    for lo, hi in cone_ranges(ra, dec, radius)
+                ]
+            ),
+            cls.within(ha.Point(ra=ra, dec=dec), radius),
         )
 
     def add_linked_thumbnails(self):
@@ -656,82 +851,6 @@ class Obj(Base, ha.Point):
         coord = ap_coord.SkyCoord(self.ra, self.dec, unit='deg')
         return astroplan.FixedTarget(name=self.id, coord=coord)
 
-    @property
-    def gal_lat_deg(self):
-        """Get the galactic latitute of this object"""
-        coord = ap_coord.SkyCoord(self.ra, self.dec, unit="deg")
-        return coord.galactic.b.deg
-
-    @property
-    def gal_lon_deg(self):
-        """Get the galactic longitude of this object"""
-        coord = ap_coord.SkyCoord(self.ra, self.dec, unit="deg")
-        return coord.galactic.l.deg
-
-    @property
-    def luminosity_distance(self):
-        """
-        The luminosity distance in Mpc, using either DM or distance data
-        in the altdata fields or using the cosmology/redshift. Specifically
-        the user can add `dm` (mag), `parallax` (arcsec), `dist_kpc`,
-        `dist_Mpc`, `dist_pc` or `dist_cm` to `altdata` and
-        those will be picked up (in that order) as the distance
-        rather than the redshift.
-
-        Return None if the redshift puts the source not within the Hubble flow
-        """
-
-        # there may be a non-redshift based measurement of distance
-        # for nearby sources
-        if self.altdata:
-            if self.altdata.get("dm") is not None:
-                # see eq (24) of https://ned.ipac.caltech.edu/level5/Hogg/Hogg7.html
-                return (
-                    (10 ** (float(self.altdata.get("dm")) / 5.0)) * 1e-5 * u.Mpc
-                ).value
-            if self.altdata.get("parallax") is not None:
-                if float(self.altdata.get("parallax")) > 0:
-                    # assume parallax in arcsec
-                    return (1e-6 * u.Mpc / float(self.altdata.get("parallax"))).value
-
-            if self.altdata.get("dist_kpc") is not None:
-                return (float(self.altdata.get("dist_kpc")) * 1e-3 * u.Mpc).value
-            if self.altdata.get("dist_Mpc") is not None:
-                return (float(self.altdata.get("dist_Mpc")) * u.Mpc).value
-            if self.altdata.get("dist_pc") is not None:
-                return (float(self.altdata.get("dist_pc")) * 1e-6 * u.Mpc).value
-            if self.altdata.get("dist_cm") is not None:
-                return (float(self.altdata.get("dist_cm")) * u.Mpc / 3.085e18).value
-
-        if self.redshift:
-            if self.redshift * 2.99e5 * u.km / u.s < 350 * u.km / u.s:
-                # stubbornly refuse to give a distance if the source
-                # is not in the Hubble flow
-                # cf. https://www.aanda.org/articles/aa/full/2003/05/aa3077/aa3077.html
-                # within ~5 Mpc (cz ~ 350 km/s) a given galaxy velocty
-                # can be between between ~0-500 km/s
-                return None
-            return (cosmo.luminosity_distance(self.redshift)).to(u.Mpc).value
-        return None
-
-    @property
-    def dm(self):
-        """Distance modulus to the object"""
-        dl = self.luminosity_distance
-        if dl:
-            return 5.0 * np.log10((dl * u.Mpc) / (10 * u.pc)).value
-        return None
-
-    @property
-    def angular_diameter_distance(self):
-        dl = self.luminosity_distance
-        if dl:
-            if self.redshift and self.redshift * 2.99e5 * u.km / u.s > 350 * u.km / u.s:
-                # see eq (20) of https://ned.ipac.caltech.edu/level5/Hogg/Hogg7.html
-                return dl / (1 + self.redshift) ** 2
-            return dl
-        return None
-
     def airmass(self, telescope, time, below_horizon=np.inf):
         """Return the airmass of the object at a given time. Uses the Pickering
         (2002) interpolation of the Rayleigh (molecular atmosphere) airmass.
@@ -890,6 +1009,168 @@ Candidate.__table_args__ = (
 )
 
 
+Obj.__table_args__ = (
+    sa.Index("objs_last_detected_mjd_index", Obj.last_detected_mjd.desc().nullslast(),),
+)
+
+
+@event.listens_for(Obj, 'before_insert')
+@event.listens_for(Obj, 'before_update')
+def update_healpix(mapper, connection, target):
+    state = sa.inspect(target)
+    if state.persistent and not any(
+        state.attrs[attr].history.has_changes() for attr in ('ra', 'dec')
+    ):
+        return
+    if target.ra is None or target.dec is None:
+        target.healpix = None
+    else:
+        target.healpix = ang2pix(target.ra, target.dec)
+
+
+@event.listens_for(Obj, 'before_insert')
+@event.listens_for(Obj, 'before_update')
+def update_derived_quantities(mapper, connection, target):
+    # The derived columns are recomputed along with their inputs, and when
+    # they are set directly
+    state = sa.inspect(target)
+    if state.persistent and not any(
+        state.attrs[attr].history.has_changes()
+        for attr in ('ra', 'dec', 'redshift', 'altdata') + DERIVED_QUANTITIES
+    ):
+        return
+    (quantities,) = compute_derived_quantities([target], interpolate=False)
+    for key, value in quantities.items():
+        setattr(target, key, value)
+
+
+def compute_derived_quantities(objs, interpolate=True):
+    """Return the galactic coordinates and distances of many Objs at once,
+    from their position, redshift and altdata.
+
+    These are stored in the `gal_lon`, `gal_lat`, `luminosity_distance`,
+    `dm` and `angular_diameter_distance` columns of Obj, which are kept up
+    to date by `update_derived_quantities`.
+
+    Parameters
+    ----------
+    objs : list of `Obj`
+        The objects.
+    interpolate : bool, optional
+        Whether to look luminosity distances up in an interpolation table of
+        the cosmology rather than integrating them for every object (see
+        `skyportal.utils.derived_quantities.luminosity_distances`).
+
+    Returns
+    -------
+    quantities : list of dict
+        For each object, its `gal_lon`, `gal_lat`, `luminosity_distance`,
+        `dm` and `angular_diameter_distance`.
+    """
+    return derived_quantities(
+        [obj.ra for obj in objs],
+        [obj.dec for obj in objs],
+        [obj.redshift for obj in objs],
+        [obj.altdata for obj in objs],
+        cosmo,
+        interpolate=interpolate,
+    )
+
+
+def refresh_detection_summaries(obj_ids, connection=None):
+    """Recompute the detection summary columns of the Objs with IDs `obj_ids`
+    (first and last detection MJD, number of detections and peak flux per
+    filter) from their photometry. The caller is responsible for committing.
+
+    Use this when photometry is modified or deleted in bulk; photometry
+    inserted in bulk is folded into the summaries incrementally, and
+    photometry inserted or deleted through the ORM is accounted for on
+    flush.
+
+    Parameters
+    ----------
+    obj_ids : list of str
+        IDs of the Objs to refresh.
+    connection : `sqlalchemy.engine.Connection`, optional
+        Connection to run the updates on. Defaults to the connection of the
+        current DBSession.
+    """
+    if connection is None:
+        connection = DBSession().connection()
+    obj_ids = list(obj_ids)
+    objs = Obj.__table__
+    detections = (
+        sa.select(
+            [
+                Photometry.obj_id,
+                sa.cast(Photometry.filter, sa.String).label('filter'),
+                Photometry.mjd,
+                Photometry.flux,
+            ]
+        )
+        .where(Photometry.obj_id.in_(obj_ids))
+        .where(Photometry.snr > 5.0)
+        .alias('detections')
+    )
+    summaries = (
+        sa.select(
+            [
+                detections.c.obj_id,
+                sa.func.min(detections.c.mjd).label('first_detected_mjd'),
+                sa.func.max(detections.c.mjd).label('last_detected_mjd'),
+                sa.func.count().label('num_detections'),
+            ]
+        )
+        .group_by(detections.c.obj_id)
+        .alias('summaries')
+    )
+    band_peaks = (
+        sa.select(
+            [
+                detections.c.obj_id,
+                detections.c.filter,
+                sa.func.max(detections.c.flux).label('flux'),
+            ]
+        )
+        .group_by(detections.c.obj_id, detections.c.filter)
+        .alias('band_peaks')
+    )
+    peaks = (
+        sa.select(
+            [
+                band_peaks.c.obj_id,
+                sa.func.jsonb_object_agg(band_peaks.c.filter, band_peaks.c.flux).label(
+                    'peak_detection_flux'
+                ),
+            ]
+        )
+        .group_by(band_peaks.c.obj_id)
+        .alias('peaks')
+    )
+
+    connection.execute(
+        objs.update()
+        .where(objs.c.id.in_(obj_ids))
+        .values(
+            first_detected_mjd=None,
+            last_detected_mjd=None,
+            num_detections=0,
+            peak_detection_flux=None,
+        )
+    )
+    connection.execute(
+        objs.update()
+        .where(objs.c.id == summaries.c.obj_id)
+        .where(objs.c.id == peaks.c.obj_id)
+        .values(
+            first_detected_mjd=summaries.c.first_detected_mjd,
+            last_detected_mjd=summaries.c.last_detected_mjd,
+            num_detections=summaries.c.num_detections,
+            peak_detection_flux=peaks.c.peak_detection_flux,
+        )
+    )
+
+
 def get_candidate_if_readable_by(obj_id, user_or_token, options=[]):
     """Return an Obj from the database if the Obj is a Candidate in at least
     one of the requesting User or Token owner's accessible Groups. If the Obj is not a
@@ -913,7 +1194,7 @@ def get_candidate_if_readable_by(obj_id, user_or_token, options=[]):
 
     if Candidate.query.filter(Candidate.obj_id == obj_id).first() is None:
         return None
-    user_group_ids = [g.id for g in user_or_token.accessible_groups]
+    user_group_ids = list(user_or_token.accessible_group_ids)
     c = (
         Candidate.query.filter(Candidate.obj_id == obj_id)
         .filter(
@@ -944,7 +1225,7 @@ def candidate_is_readable_by(self, user_or_token):
     readable : bool
        Whether the Candidate is readable by the User or Token owner.
     """
-    return self.filter.group in user_or_token.accessible_groups
+    return self.filter.group_id in user_or_token.accessible_group_ids
 
 
 Candidate.get_obj_if_readable_by = get_candidate_if_readable_by
@@ -1038,7 +1319,7 @@ def source_is_readable_by(self, user_or_token):
         .filter(Source.obj_id == self.obj_id)
         .all()
     ]
-    return bool(set(source_group_ids) & {g.id for g in user_or_token.accessible_groups})
+    return bool(set(source_group_ids) & user_or_token.accessible_group_ids)
 
 
 def get_source_if_readable_by(obj_id, user_or_token, options=[]):
@@ -1064,7 +1345,7 @@ def get_source_if_readable_by(obj_id, user_or_token, options=[]):
 
     if Source.query.filter(Source.obj_id == obj_id).first() is None:
         return None
-    user_group_ids = [g.id for g in user_or_token.accessible_groups]
+    user_group_ids = list(user_or_token.accessible_group_ids)
     s = (
         Source.query.filter(Source.obj_id == obj_id)
         .filter(Source.group_id.in_(user_group_ids))
@@ -1134,23 +1415,67 @@ def get_obj_if_readable_by(obj_id, user_or_token, options=[]):
 Obj.get_if_readable_by = get_obj_if_readable_by
 
 
-def get_obj_comments_readable_by(self, user_or_token):
+def _get_obj_children_readable_by(
+    cls, group_id_column, child_id_column, obj_or_ids, user_or_token, options=()
+):
+    """Return the rows of `cls` attached to one or several Objs that are
+    shared with any of the User or Token owner's accessible Groups.
+
+    Readability is resolved in the database, by checking the Group join
+    table of `cls` against the accessible Group IDs, rather than by loading
+    every row and its Groups. The Groups of the returned rows are loaded
+    with a single additional query.
+    """
+    if isinstance(obj_or_ids, Obj):
+        obj_ids = [obj_or_ids.id]
+    elif isinstance(obj_or_ids, str):
+        obj_ids = [obj_or_ids]
+    else:
+        obj_ids = list(obj_or_ids)
+
+    shared = (
+        sa.exists()
+        .where(child_id_column == cls.id)
+        .where(group_id_column.in_(list(user_or_token.accessible_group_ids)))
+    )
+    return (
+        cls.query.filter(cls.obj_id.in_(obj_ids))
+        .filter(shared)
+        .options(selectinload(cls.groups), *options)
+        .order_by(cls.created_at, cls.id)
+        .all()
+    )
+
+
+def get_obj_comments_readable_by(self, user_or_token, options=()):
     """Query the database and return the Comments on this Obj that are accessible
     to any of the User or Token owner's accessible Groups.
 
+    Can also be called as `Obj.get_comments_readable_by(obj_ids, user_or_token)`
+    to fetch the accessible Comments of several Objs with one query.
+
     Parameters
     ----------
+    self : `skyportal.models.Obj`, str or list of str
+       The Obj, or the ID(s) of the Objs, to look up.
     user_or_token : `baselayer.app.models.User` or `baselayer.app.models.Token`
        The requesting `User` or `Token` object.
+    options : list of `sqlalchemy.orm.MapperOption`s
+       Options that wil be passed to `options()` in the loader query.
 
     Returns
     -------
     comment_list : list of `skyportal.models.Comment`
-       The accessible comments attached to this Obj.
+       The accessible comments attached to the Obj(s), by creation date.
     """
-    readable_comments = [
-        comment for comment in self.comments if comment.is_readable_by(user_or_token)
-    ]
+    readable_comments = _get_obj_children_readable_by(
+        Comment,
+        GroupComment.group_id,
+        GroupComment.comment_id,
+        self,
+        user_or_token,
+        options=[joinedload(Comment.author), *options],
+    )
 
     # Grab basic author info for the comments
     for comment in readable_comments:
@@ -1162,25 +1487,35 @@ def get_obj_comments_readable_by(self, user_or_token):
 Obj.get_comments_readable_by = get_obj_comments_readable_by
 
 
-def get_obj_annotations_readable_by(self, user_or_token):
+def get_obj_annotations_readable_by(self, user_or_token, options=()):
     """Query the database and return the Annotations on this Obj that are accessible
     to any of the User or Token owner's accessible Groups.
 
+    Can also be called as `Obj.get_annotations_readable_by(obj_ids, user_or_token)`
+    to fetch the accessible Annotations of several Objs with one query.
+
     Parameters
     ----------
+    self : `skyportal.models.Obj`, str or list of str
+       The Obj, or the ID(s) of the Objs, to look up.
     user_or_token : `baselayer.app.models.User` or `baselayer.app.models.Token`
        The requesting `User` or `Token` object.
+    options : list of `sqlalchemy.orm.MapperOption`s
+       Options that wil be passed to `options()` in the loader query.
 
     Returns
     -------
     annotation_list : list of `skyportal.models.Annotation`
-       The accessible annotations attached to this Obj.
+       The accessible annotations attached to the Obj(s), by creation date.
     """
-    readable_annotations = [
-        annotation
-        for annotation in self.annotations
-        if annotation.is_readable_by(user_or_token)
-    ]
+    readable_annotations = _get_obj_children_readable_by(
+        Annotation,
+        GroupAnnotation.group_id,
+        GroupAnnotation.annotation_id,
+        self,
+        user_or_token,
+        options=[joinedload(Annotation.author), *options],
+    )
 
     # Grab basic author info for the annotations
     for annotation in readable_annotations:
@@ -1192,61 +1527,88 @@ def get_obj_annotations_readable_by(self, user_or_token):
 Obj.get_annotations_readable_by = get_obj_annotations_readable_by
 
 
-def get_obj_classifications_readable_by(self, user_or_token):
+def get_obj_classifications_readable_by(self, user_or_token, options=()):
     """Query the database and return the Classifications on this Obj that are accessible
     to any of the User or Token owner's accessible Groups.
 
+    Can also be called as
+    `Obj.get_classifications_readable_by(obj_ids, user_or_token)` to fetch the
+    accessible Classifications of several Objs with one query.
+
     Parameters
     ----------
+    self : `skyportal.models.Obj`, str or list of str
+       The Obj, or the ID(s) of the Objs, to look up.
     user_or_token : `baselayer.app.models.User` or `baselayer.app.models.Token`
        The requesting `User` or `Token` object.
+    options : list of `sqlalchemy.orm.MapperOption`s
+       Options that wil be passed to `options()` in the loader query.
 
     Returns
     -------
     classification_list : list of `skyportal.models.Classification`
-       The accessible classifications attached to this Obj.
+       The accessible classifications attached to the Obj(s), by creation date.
     """
-    return [
-        classifications
-        for classifications in self.classifications
-        if classifications.is_readable_by(user_or_token)
-    ]
+    return _get_obj_children_readable_by(
+        Classification,
+        GroupClassifications.group_id,
+        GroupClassifications.classification_id,
+        self,
+        user_or_token,
+        options=options,
+    )
 
 
 Obj.get_classifications_readable_by = get_obj_classifications_readable_by
 
 
+def query_photometry_readable_by_user(obj_ids, user_or_token):
+    """Return a query selecting the Photometry of one or several Objs that is
+    shared with any of the User or Token owner's accessible Groups.
+
+    Parameters
+    ----------
+    obj_ids : string or list of string
+       The ID(s) of the Obj(s) to look up.
+    user_or_token : `baselayer.app.models.User` or `baselayer.app.models.Token`
+       The requesting `User` or `Token` object.
+
+    Returns
+    -------
+    query : `sqlalchemy.orm.Query`
+       Query selecting the accessible Photometry of the Obj(s).
+    """
+    if isinstance(obj_ids, str):
+        obj_ids = [obj_ids]
+    return Photometry.query.filter(Photometry.obj_id.in_(list(obj_ids))).filter(
+        Photometry.groups.any(Group.id.in_(list(user_or_token.accessible_group_ids)))
+    )
+
+
 def get_photometry_readable_by_user(obj_id, user_or_token):
     """Query the database and return the Photometry for this Obj that is shared
     with any of the User or Token owner's accessible Groups.
 
     Parameters
     ----------
-    obj_id : string
-       The ID of the Obj to look up.
+    obj_id : string or list of string
+       The ID(s) of the Obj(s) to look up.
     user_or_token : `baselayer.app.models.User` or `baselayer.app.models.Token`
        The requesting `User` or `Token` object.
 
     Returns
     -------
     photometry_list : list of `skyportal.models.Photometry`
-       The accessible Photometry of this Obj.
+       The accessible Photometry of the Obj(s).
     """
-    return (
-        Photometry.query.filter(Photometry.obj_id == obj_id)
-        .filter(
-            Photometry.groups.any(
-                Group.id.in_([g.id for g in user_or_token.accessible_groups])
-            )
-        )
-        .all()
-    )
+    return query_photometry_readable_by_user(obj_id, user_or_token).all()
 
 
+Obj.query_photometry_readable_by_user = query_photometry_readable_by_user
 Obj.get_photometry_readable_by_user = get_photometry_readable_by_user
 
 
-def get_spectra_readable_by(obj_id, user_or_token, options=()):
+def get_spectra_readable_by(obj_id, user_or_token, options=(), metadata_only=False):
     """Query the database and return the Spectra for this Obj that are shared
     with any of the User or Token owner's accessible Groups.
 
@@ -1258,6 +1620,9 @@ def get_spectra_readable_by(obj_id, user_or_token, options=()):
        The requesting `User` or `Token` object.
     options : list of `sqlalchemy.orm.MapperOption`s
        Options that wil be passed to `options()` in the loader query.
+    metadata_only : bool, optional
+       If True, do not load the data arrays and original files of the
+       Spectra (see `Spectrum.metadata_only`).
 
     Returns
     -------
@@ -1265,12 +1630,13 @@ def get_spectra_readable_by(obj_id, user_or_token, options=()):
        The accessible Spectra of this Obj.
     """
 
+    options = list(options)
+    if metadata_only:
+        options.extend(Spectrum.metadata_only())
     return (
         Spectrum.query.filter(Spectrum.obj_id == obj_id)
         .filter(
-            Spectrum.groups.any(
-                Group.id.in_([g.id for g in user_or_token.accessible_groups])
-            )
+            Spectrum.groups.any(Group.id.in_(list(user_or_token.accessible_group_ids)))
         )
         .options(options)
         .all()
@@ -1708,9 +2074,7 @@ def get_taxonomy_usable_by_user(taxonomy_id, user_or_token):
     return (
         Taxonomy.query.filter(Taxonomy.id == taxonomy_id)
         .filter(
-            Taxonomy.groups.any(
-                Group.id.in_([g.id for g in user_or_token.accessible_groups])
-            )
+            Taxonomy.groups.any(Group.id.in_(list(user_or_token.accessible_group_ids)))
         )
         .all()
     )
@@ -1861,6 +2225,162 @@ GroupAnnotation.__doc__ = "Join table mapping Groups to Annotation."
 User.annotations = relationship("Annotation", back_populates="author")
 
 
+# Text values longer than this are not copied into AnnotationValue, as they
+# would not fit in a B-tree index entry
+ANNOTATION_VALUE_MAX_TEXT_LENGTH = 1024
+
+
+class AnnotationValue(Base):
+    """A scalar value of an Annotation, stored in a typed column so that
+    annotations can be filtered and sorted on with an index. The rows of an
+    Annotation are regenerated from its data whenever it is saved."""
+
+    annotation_id = sa.Column(
+        sa.ForeignKey('annotations.id', ondelete='CASCADE'),
+        nullable=False,
+        index=True,
+        doc="ID of the Annotation the value belongs to.",
+    )
+    obj_id = sa.Column(
+        sa.ForeignKey('objs.id', ondelete='CASCADE'),
+        nullable=False,
+        index=True,
+        doc="ID of the Annotation's Obj.",
+    )
+    origin = sa.Column(sa.String, nullable=False, doc="Origin of the Annotation.")
+    key = sa.Column(sa.String, nullable=False, doc="Key of the value in the data.")
+    numeric_value = sa.Column(
+        sa.Float, nullable=True, doc="The value, if it is a number."
+    )
+    bool_value = sa.Column(
+        sa.Boolean, nullable=True, doc="The value, if it is a boolean."
+    )
+    text_value = sa.Column(
+        sa.String,
+        nullable=True,
+        doc="The value as text, as returned by the JSONB ->> operator.",
+    )
+
+
+AnnotationValue.__table_args__ = (
+    sa.Index(
+        'annotation_values_numeric_index',
+        AnnotationValue.origin,
+        AnnotationValue.key,
+        AnnotationValue.numeric_value,
+    ),
+    sa.Index(
+        'annotation_values_bool_index',
+        AnnotationValue.origin,
+        AnnotationValue.key,
+        AnnotationValue.bool_value,
+    ),
+    sa.Index(
+        'annotation_values_text_index',
+        AnnotationValue.origin,
+        AnnotationValue.key,
+        AnnotationValue.text_value,
+    ),
+)
+
+
+def annotation_value_rows(annotation):
+    """Return the AnnotationValue rows (as dicts) for the top-level scalar
+    values of an Annotation's data. Nested objects and arrays are kept as
+    their JSON text only, and null values are left out."""
+    rows = []
+    if not isinstance(annotation.data, dict):
+        return rows
+    for key, value in annotation.data.items():
+        if value is None:
+            continue
+        row = {
+            'annotation_id': annotation.id,
+            'obj_id': annotation.obj_id,
+            'origin': annotation.origin,
+            'key': key,
+            'numeric_value': None,
+            'bool_value': None,
+            'text_value': value if isinstance(value, str) else json.dumps(value),
+        }
+        if isinstance(value, bool):
+            row['bool_value'] = value
+        elif isinstance(value, (int, float)) and np.isfinite(value):
+            row['numeric_value'] = float(value)
+        if len(row['text_value']) > ANNOTATION_VALUE_MAX_TEXT_LENGTH:
+            row['text_value'] = None
+        rows.append(row)
+    return rows
+
+
+class AnnotationKey(Base):
+    """An (origin, key, value type) triple found in the data of an Annotation
+    shared with a Group. This catalogue of the annotation fields each Group
+    can see is maintained as Annotations are saved, and is used to build the
+    annotation filtering form of the scanning page."""
+
+    group_id = sa.Column(
+        sa.ForeignKey('groups.id', ondelete='CASCADE'),
+        nullable=False,
+        index=True,
+        doc="ID of the Group the Annotation is shared with.",
+    )
+    origin = sa.Column(sa.String, nullable=False, doc="Origin of the Annotation.")
+    key = sa.Column(sa.String, nullable=False, doc="Key in the Annotation's data.")
+    type = sa.Column(
+        sa.String,
+        nullable=False,
+        doc="JSON type of the value, as returned by jsonb_typeof.",
+    )
+
+    __table_args__ = (UniqueConstraint('group_id', 'origin', 'key', 'type'),)
+
+
+def json_type(value):
+    """Return the name of the JSON type of a deserialized value, as given by
+    PostgreSQL's jsonb_typeof."""
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'boolean'
+    if isinstance(value, (int, float)):
+        return 'number'
+    if isinstance(value, str):
+        return 'string'
+    if isinstance(value, dict):
+        return 'object'
+    return 'array'
+
+
+@event.listens_for(Annotation, 'after_insert')
+@event.listens_for(Annotation, 'after_update')
+def index_annotation_values(mapper, connection, target):
+    state = sa.inspect(target)
+    data_changed = any(
+        state.attrs[attr].history.has_changes() for attr in ('data', 'origin', 'obj_id')
+    )
+
+    if data_changed:
+        values = AnnotationValue.__table__
+        connection.execute(values.delete().where(values.c.annotation_id == target.id))
+        rows = annotation_value_rows(target)
+        if rows:
+            connection.execute(values.insert(), rows)
+
+    if (data_changed or state.attrs.groups.history.has_changes()) and isinstance(
+        target.data, dict
+    ):
+        keys = [
+            {'group_id': group.id, 'origin': target.origin, 'key': key, 'type': t}
+            for key, t in {(k, json_type(v)) for k, v in target.data.items()}
+            for group in target.groups
+        ]
+        if keys:
+            connection.execute(
+                psql.insert(AnnotationKey.__table__).on_conflict_do_nothing(), keys
+            )
+
+
 class Classification(Base):
     """Classification of an Obj."""
 
@@ -2093,6 +2613,36 @@ class Photometry(Base, ha.Point):
 
 Photometry.is_modifiable_by = is_modifiable_by
 
+
+@event.listens_for(Photometry, 'after_insert')
+@event.listens_for(Photometry, 'after_delete')
+def queue_detection_summary_refresh(mapper, connection, target):
+    # Refresh the detection summaries of all the Objs whose photometry was
+    # changed once the whole flush is done, rather than once per point, on
+    # the session being flushed (which need not be the thread's DBSession)
+    session = sa.orm.object_session(target)
+    obj_ids = session.info.setdefault('detection_summary_obj_ids', set())
+    if not obj_ids:
+
+        @event.listens_for(session, "after_flush_postexec", once=True)
+        def receive_after_flush(session, context):
+            obj_ids = session.info.pop('detection_summary_obj_ids')
+            refresh_detection_summaries(obj_ids, session.connection())
+            for obj in session.identity_map.values():
+                if isinstance(obj, Obj) and obj.id in obj_ids:
+                    session.expire(
+                        obj,
+                        [
+                            'first_detected_mjd',
+                            'last_detected_mjd',
+                            'num_detections',
+                            'peak_detection_flux',
+                        ],
+                    )
+
+    obj_ids.add(target.obj_id)
+
+
 # Deduplication index. This is a unique index that prevents any photometry
 # point that has the same obj_id, instrument_id, origin, mjd, flux error,
 # and flux as a photometry point that already exists within the table from
@@ -2121,22 +2671,125 @@ GroupPhotometry = join_model("group_photometry", Group, Photometry)
 GroupPhotometry.__doc__ = "Join table mapping Groups to Photometry."
 
 
+class PhotometryIngestJob(Base):
+    """A batch of Photometry accepted by the API for asynchronous ingestion.
+    The uploaded payload is spooled to disk on the app server that accepted
+    it, and ingested in the background in transactions of bounded size,
+    resolving duplicates as in PhotometryHandler.PUT."""
+
+    owner_id = sa.Column(
+        sa.ForeignKey('users.id', ondelete='CASCADE'),
+        nullable=False,
+        index=True,
+        doc="ID of the User who uploaded the photometry.",
+    )
+    owner = relationship(
+        'User',
+        back_populates='photometry_ingest_jobs',
+        foreign_keys=[owner_id],
+        doc="The User who uploaded the photometry.",
+    )
+    status = sa.Column(
+        sa.Enum(
+            'pending',
+            'running',
+            'complete',
+            'failed',
+            name='photometry_ingest_job_status',
+            validate_strings=True,
+        ),
+        nullable=False,
+        default='pending',
+        index=True,
+        doc="Job status. Can be one of 'pending', 'running', 'complete', "
+        "or 'failed'.",
+    )
+    group_ids = sa.Column(
+        psql.ARRAY(sa.Integer),
+        nullable=False,
+        doc="IDs of the Groups to share the photometry with.",
+    )
+    upload_id = sa.Column(
+        sa.String,
+        nullable=False,
+        default=lambda: str(uuid.uuid4()),
+        doc="Upload ID assigned to all Photometry ingested by this job.",
+    )
+    spool_path = sa.Column(
+        sa.String,
+        nullable=False,
+        doc="Path of the spooled payload on the machine that accepted it.",
+    )
+    claimed_by = sa.Column(
+        sa.String, nullable=True, doc="host:pid of the worker processing the job.",
+    )
+    n_rows = sa.Column(
+        sa.Integer, nullable=True, doc="Number of photometry points in the payload."
+    )
+    n_accepted = sa.Column(
+        sa.Integer,
+        nullable=False,
+        default=0,
+        doc="Number of photometry points inserted.",
+    )
+    n_duplicated = sa.Column(
+        sa.Integer,
+        nullable=False,
+        default=0,
+        doc="Number of photometry points that already existed.",
+    )
+    n_rejected = sa.Column(
+        sa.Integer,
+        nullable=False,
+        default=0,
+        doc="Number of photometry points that failed validation.",
+    )
+    photometry_ids = sa.Column(
+        psql.ARRAY(sa.Integer),
+        nullable=True,
+        doc="IDs of the new or existing Photometry, in the order of the "
+        "payload. Null for rejected points.",
+    )
+    errors = sa.Column(
+        JSONB, nullable=True, doc="Error messages raised during ingestion."
+    )
+    completed_at = sa.Column(
+        sa.DateTime, nullable=True, doc="UTC time the job finished."
+    )
+
+    def is_readable_by(self, user_or_token):
+        """Return a boolean indicating whether the job was submitted by the
+        given User or Token owner, or the requester is a System admin."""
+        if "System admin" in user_or_token.permissions:
+            return True
+        if hasattr(user_or_token, 'created_by'):
+            return self.owner_id == user_or_token.created_by.id
+        return self.owner_id == user_or_token.id
+
+
+User.photometry_ingest_jobs = relationship(
+    'PhotometryIngestJob',
+    back_populates='owner',
+    passive_deletes=True,
+    doc="Asynchronous photometry uploads submitted by this User.",
+)
+
+
 class Spectrum(Base):
     """Wavelength-dependent measurement of the flux of an object through a
     dispersive element."""
 
     __tablename__ = 'spectra'
-    # TODO better numpy integration
     wavelengths = sa.Column(
-        NumpyArray, nullable=False, doc="Wavelengths of the spectrum [Angstrom]."
+        BinaryArray, nullable=False, doc="Wavelengths of the spectrum [Angstrom]."
     )
     fluxes = sa.Column(
-        NumpyArray,
+        BinaryArray,
         nullable=False,
         doc="Flux of the Spectrum [F_lambda, arbitrary units].",
     )
     errors = sa.Column(
-        NumpyArray,
+        BinaryArray,
         doc="Errors on the fluxes of the spectrum [F_lambda, same units as `fluxes`.]",
     )
 
@@ -2213,6 +2866,21 @@ class Spectrum(Base):
         doc="The User who uploaded the spectrum.",
     )
 
+    DATA_COLUMNS = ('wavelengths', 'fluxes', 'errors', 'original_file_string')
+
+    @classmethod
+    def metadata_only(cls):
+        """Loader options deferring the data arrays and the original file of
+        Spectra, which make up nearly all of their size. The deferred columns
+        are left out of `to_dict()` unless they are accessed.
+
+        Returns
+        -------
+        options : list of `sqlalchemy.orm.MapperOption`s
+            Options to pass to `Query.options()`.
+        """
+        return [defer(getattr(cls, column)) for column in cls.DATA_COLUMNS]
+
     @classmethod
     def from_ascii(
         cls,
@@ -2505,7 +3173,7 @@ class FollowupRequest(Base):
            accessible to the given user or token.
         """
 
-        user_or_token_group_ids = [g.id for g in user_or_token.accessible_groups]
+        user_or_token_group_ids = user_or_token.accessible_group_ids
         return self.allocation.group_id in user_or_token_group_ids
 
 
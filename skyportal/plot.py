@@ -1,7 +1,10 @@
+import hashlib
 import itertools
 
 import numpy as np
 import pandas as pd
+from sqlalchemy import event, func
+from sqlalchemy.orm import defer
 
 from bokeh.core.properties import List, String
 from bokeh.layouts import row, column
@@ -18,6 +21,7 @@ from matplotlib import cm
 from matplotlib.colors import rgb2hex
 
 import os
+from baselayer.app.env import load_env
 from skyportal.models import (
     DBSession,
     Obj,
@@ -30,8 +34,10 @@ from skyportal.models import (
     GroupSpectrum,
 )
 
-import sncosmo
+from skyportal.utils.plot_cache import PlotCache
+from skyportal.utils.zeropoints import get_bandpass_color
 
+_, cfg = load_env()
 
 DETECT_THRESH = 3  # sigma
 
@@ -104,6 +110,63 @@ SPEC_LINES = {
 # 'S II': 6717, 6731'
 
 
+plot_cache = PlotCache(
+    cache_dir='./cache/plots/',
+    max_items=cfg['misc'].get('plot_cache_max_items', 1000),
+    max_memory_items=cfg['misc'].get('plot_cache_max_memory_items', 100),
+)
+
+
+def plot_cache_key(kind, obj_id, user, *params):
+    """Return the key under which a plot is stored in `plot_cache`.
+
+    Besides the plot parameters, the key holds a fingerprint of the groups
+    accessible to `user` and a version of the plotted data: the number and
+    latest modification time of the object's photometry or spectra readable
+    by `user`, and the modification time of the object itself.
+
+    Parameters
+    ----------
+    kind : str
+        Either 'photometry' or 'spectroscopy'.
+    obj_id : str
+        ID of the plotted Obj.
+    user : `skyportal.models.User` or `skyportal.models.Token`
+        The user the plot is made for.
+    *params
+        The other parameters of the plot, such as its width and height.
+
+    Returns
+    -------
+    key : tuple
+    """
+    group_ids = sorted(user.accessible_group_ids)
+    fingerprint = hashlib.md5(','.join(map(str, group_ids)).encode()).hexdigest()
+    model = Photometry if kind == 'photometry' else Spectrum
+    count, last_modified = (
+        DBSession()
+        .query(func.count(model.id), func.max(model.modified))
+        .filter(model.obj_id == obj_id, model.groups.any(Group.id.in_(group_ids)))
+        .one()
+    )
+    obj_modified = DBSession().query(Obj.modified).filter(Obj.id == obj_id).scalar()
+    key = (obj_id, kind, fingerprint, *params, count, last_modified, obj_modified)
+    if kind == 'photometry':
+        # The "Days Ago" axis is relative to the day of plotting
+        key += (int(Time.now().mjd),)
+    return key
+
+
+@event.listens_for(Photometry, 'after_insert')
+@event.listens_for(Photometry, 'after_update')
+@event.listens_for(Photometry, 'after_delete')
+@event.listens_for(Spectrum, 'after_insert')
+@event.listens_for(Spectrum, 'after_update')
+@event.listens_for(Spectrum, 'after_delete')
+def invalidate_plots(mapper, connection, target):
+    plot_cache.invalidate(target.obj_id)
+
+
 class CheckboxWithLegendGroup(CheckboxGroup):
     colors = List(String, help="List of legend colors")
 
@@ -121,43 +184,182 @@ tooltip_format = [
     ('instrument', '@instrument'),
     ('stacked', '@stacked'),
 ]
-cmap_opt = cm.get_cmap('nipy_spectral')
-cmap_uv = cm.get_cmap('cool')
-cmap_ir = cm.get_cmap('autumn')
-
-
-def get_color(bandpass_name):
-    if bandpass_name.startswith('ztf'):
-        return {'ztfg': 'green', 'ztfi': 'orange', 'ztfr': 'red'}[bandpass_name]
-    else:
-        bandpass = sncosmo.get_bandpass(bandpass_name)
-        wave = bandpass.wave_eff
-
-        if 0 < wave < 3000:
-            cmap = cmap_uv
-            cmap_limits = (0, 3000)
-        elif 3000 <= wave <= 10000:
-            cmap = cmap_opt
-            cmap_limits = (3000, 10000)
-        elif 10000 < wave < 1e5:
-            wave = np.log10(wave)
-            cmap = cmap_ir
-            cmap_limits = (4, 5)
-        else:
-            raise ValueError('wavelength out of range for color maps')
-
-        rgb = cmap((cmap_limits[1] - wave) / (cmap_limits[1] - cmap_limits[0]))[:3]
-        bandcolor = rgb2hex(rgb)
-
-        return bandcolor
-
-
-def photometry_plot(obj_id, user, width=600, height=300):
+
+
+def error_bars(x, y, err):
+    """Return the `xs` and `ys` of vertical error bars at (`x`, `y`), for a
+    `multi_line` glyph."""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    err = np.asarray(err, dtype=float)
+    return (
+        np.column_stack((x, x)).tolist(),
+        np.column_stack((y - err, y + err)).tolist(),
+    )
+
+
+def bin_photometry(data, max_points):
+    """Bin the photometry of each label (instrument/filter) with more than
+    `max_points` points into `max_points` bins of equal width in MJD.
+
+    The points with a flux in each bin are replaced by their inverse-variance
+    weighted mean, and the points without a flux (upper limits) by a single
+    limit with the combined flux error, so that each bin holds at most one
+    of each, and a label can be left with up to `2 * max_points` points.
+    Binned points are marked as stacked. Points whose flux error is not
+    positive and finite cannot be weighted, so they are never binned.
+
+    Parameters
+    ----------
+    data : `pandas.DataFrame`
+        Photometry with `label`, `mjd`, `flux`, `fluxerr` and `stacked`
+        columns.
+    max_points : int
+        Number of bins per label.
+
+    Returns
+    -------
+    `pandas.DataFrame`
+    """
+    fluxerr = data['fluxerr'].to_numpy(dtype=float)
+    weighted = np.isfinite(fluxerr) & (fluxerr > 0)
+    counts = data.loc[weighted, 'label'].value_counts()
+    dense = weighted & data['label'].isin(counts.index[counts > max_points])
+    if not dense.any():
+        return data
+
+    binned = [data[~dense]]
+    for label, sdf in data[dense].groupby('label', sort=False):
+        mjd = sdf['mjd'].to_numpy(dtype=float)
+        edges = np.linspace(mjd.min(), mjd.max(), max_points + 1)
+        index = np.clip(
+            np.searchsorted(edges, mjd, side='right') - 1, 0, max_points - 1
+        )
+        hasflux = sdf['flux'].notna().to_numpy()
+        weight = 1.0 / sdf['fluxerr'].to_numpy(dtype=float) ** 2
+        sums = pd.DataFrame(
+            {
+                'weight': weight,
+                'weighted_mjd': weight * mjd,
+                'weighted_flux': weight * np.where(hasflux, sdf['flux'], 0.0),
+                'count': 1,
+            }
+        ).groupby([index, hasflux])
+        groups = sdf.groupby([index, hasflux])
+        totals = sums.sum()
+        bins = groups.first()
+        bins['mjd'] = totals['weighted_mjd'] / totals['weight']
+        bins['flux'] = (totals['weighted_flux'] / totals['weight']).where(
+            bins.index.get_level_values(1)
+        )
+        bins['fluxerr'] = 1.0 / np.sqrt(totals['weight'])
+        bins['stacked'] = totals['count'] > 1
+        binned.append(bins.reset_index(drop=True))
+
+    return pd.concat(binned, ignore_index=True).sort_values(
+        'mjd', kind='stable', ignore_index=True
+    )
+
+
+def photometry_light_curve(obj_id, user, max_points=None):
+    """Return the photometry of an object as typed columns, for clients that
+    render light curves themselves.
+
+    Parameters
+    ----------
+    obj_id : str
+        ID of the Obj.
+    user : `skyportal.models.User` or `skyportal.models.Token`
+        Only the photometry readable by this user is returned.
+    max_points : int, optional
+        If given, the photometry of each instrument/filter is binned in time
+        into this many bins, each holding at most one detection and one
+        upper limit, i.e. up to twice this many points (see `bin_photometry`).
+
+    Returns
+    -------
+    columns : dict of `numpy.ndarray`
+        The `id`, `mjd`, `flux`, `fluxerr` (μJy), `mag`, `magerr` and
+        `lim_mag` (AB) of the points, sorted by MJD, with NaN for missing
+        values, the `filter` and `instrument` of each point as indices into
+        the lookup tables, and whether it is `stacked` (binned points have
+        the `id` of one of the points in their bin).
+    tables : dict
+        The lookup tables: `filters` and their `filter_colors`, and
+        `instruments`, each with its `id`, `name` and `telescope`.
+    """
+    data = pd.DataFrame(
+        Obj.query_photometry_readable_by_user(obj_id, user)
+        .with_entities(
+            Photometry.id,
+            Photometry.mjd,
+            Photometry.flux,
+            Photometry.fluxerr,
+            Photometry.filter,
+            Photometry.instrument_id,
+        )
+        .order_by(Photometry.mjd, Photometry.id)
+        .all(),
+        columns=['id', 'mjd', 'flux', 'fluxerr', 'filter', 'instrument_id'],
+    )
+    data['flux'] = data['flux'].astype(float)
+    data['stacked'] = False
+    if max_points and len(data) > 0:
+        data['label'] = data['instrument_id'].astype(str) + '/' + data['filter']
+        data = bin_photometry(data, max_points)
+
+    filters, filter_codes = np.unique(
+        data['filter'].to_numpy(dtype=str), return_inverse=True
+    )
+    instrument_ids, instrument_codes = np.unique(
+        data['instrument_id'].to_numpy(dtype=np.int64), return_inverse=True
+    )
+    instruments = {
+        instrument_id: {'id': instrument_id, 'name': name, 'telescope': telescope}
+        for instrument_id, name, telescope in DBSession()
+        .query(Instrument.id, Instrument.name, Telescope.nickname)
+        .join(Telescope, Telescope.id == Instrument.telescope_id)
+        .filter(Instrument.id.in_(instrument_ids.tolist()))
+    }
+
+    flux = data['flux'].to_numpy(dtype=float)
+    fluxerr = data['fluxerr'].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        detected = np.nan_to_num(flux) / fluxerr >= DETECT_THRESH
+        mag = np.where(detected, -2.5 * np.log10(flux) + PHOT_ZP, np.nan)
+        magerr = np.where(detected, np.abs(2.5 / np.log(10) * fluxerr / flux), np.nan)
+        lim_mag = -2.5 * np.log10(fluxerr * DETECT_THRESH) + PHOT_ZP
+
+    columns = {
+        'id': data['id'].to_numpy(dtype=np.int64),
+        'mjd': data['mjd'].to_numpy(dtype=float),
+        'flux': flux,
+        'fluxerr': fluxerr,
+        'mag': mag,
+        'magerr': magerr,
+        'lim_mag': lim_mag,
+        'filter': filter_codes.astype(np.int16),
+        'instrument': instrument_codes.astype(np.int16),
+        'stacked': data['stacked'].to_numpy(dtype=bool),
+    }
+    tables = {
+        'filters': filters.tolist(),
+        'filter_colors': [get_bandpass_color(f) for f in filters],
+        'instruments': [instruments[i] for i in instrument_ids.tolist()],
+    }
+    return columns, tables
+
+
+def photometry_plot(obj_id, user, width=600, height=300, max_points=None):
     """Create scatter plot of photometry for object.
     Parameters
     ----------
     obj_id : str
         ID of Obj to be plotted.
+    max_points : int, optional
+        If given, the photometry of each instrument/filter is binned in time
+        into this many bins, each holding at most one detection and one
+        upper limit, i.e. up to twice this many points (see `bin_photometry`).
     Returns
     -------
     (str, str)
@@ -165,18 +367,14 @@ def photometry_plot(obj_id, user, width=600, height=300):
     """
 
     data = pd.read_sql(
-        DBSession()
-        .query(
+        Obj.query_photometry_readable_by_user(obj_id, user)
+        .with_entities(
             Photometry,
             Telescope.nickname.label("telescope"),
             Instrument.name.label("instrument"),
         )
         .join(Instrument, Instrument.id == Photometry.instrument_id)
         .join(Telescope, Telescope.id == Instrument.telescope_id)
-        .filter(Photometry.obj_id == obj_id)
-        .filter(
-            Photometry.groups.any(Group.id.in_([g.id for g in user.accessible_groups]))
-        )
         .statement,
         DBSession().bind,
     )
@@ -184,8 +382,13 @@ def photometry_plot(obj_id, user, width=600, height=300):
     if data.empty:
         return None, None, None
 
-    data['color'] = [get_color(f) for f in data['filter']]
-    data['label'] = [f'{i}/{f}' for i, f in zip(data['instrument'], data['filter'])]
+    data['color'] = data['filter'].map(
+        {f: get_bandpass_color(f) for f in data['filter'].unique()}
+    )
+    data['label'] = data['instrument'] + '/' + data['filter']
+    data['stacked'] = False
+    if max_points:
+        data = bin_photometry(data, max_points)
     data['zp'] = PHOT_ZP
     data['magsys'] = 'ab'
     data['alpha'] = 1.0
@@ -214,7 +417,6 @@ def photometry_plot(obj_id, user, width=600, height=300):
     magerrs = np.abs(coeff * data[obsind]['fluxerr'] / data[obsind]['flux'])
     data.loc[obsind, 'magerr'] = magerrs
     data['obs'] = obsind
-    data['stacked'] = False
 
     split = data.groupby('label', sort=False)
 
@@ -280,17 +482,7 @@ def photometry_plot(obj_id, user, width=600, height=300):
         imhover.renderers.append(model_dict[key])
 
         key = 'obserr' + str(i)
-        y_err_x = []
-        y_err_y = []
-
-        for d, ro in df.iterrows():
-            px = ro['mjd']
-            py = ro['flux']
-            err = ro['fluxerr']
-
-            y_err_x.append((px, px))
-            y_err_y.append((py - err, py + err))
-
+        y_err_x, y_err_y = error_bars(df['mjd'], df['flux'], df['fluxerr'])
         model_dict[key] = plot.multi_line(
             xs='xs',
             ys='ys',
@@ -298,7 +490,7 @@ def photometry_plot(obj_id, user, width=600, height=300):
             alpha='alpha',
             source=ColumnDataSource(
                 data=dict(
-                    xs=y_err_x, ys=y_err_y, color=df['color'], alpha=[1.0] * len(df)
+                    xs=y_err_x, ys=y_err_y, color=df['color'], alpha=np.ones(len(df))
                 )
             ),
         )
@@ -522,17 +714,8 @@ def photometry_plot(obj_id, user, width=600, height=300):
         imhover.renderers.append(model_dict[key])
 
         key = 'obserr' + str(i)
-        y_err_x = []
-        y_err_y = []
-
-        for d, ro in df[df['obs']].iterrows():
-            px = ro['mjd']
-            py = ro['mag']
-            err = ro['magerr']
-
-            y_err_x.append((px, px))
-            y_err_y.append((py - err, py + err))
-
+        obs = df[df['obs']]
+        y_err_x, y_err_y = error_bars(obs['mjd'], obs['mag'], obs['magerr'])
         model_dict[key] = plot.multi_line(
             xs='xs',
             ys='ys',
@@ -540,10 +723,7 @@ def photometry_plot(obj_id, user, width=600, height=300):
             alpha='alpha',
             source=ColumnDataSource(
                 data=dict(
-                    xs=y_err_x,
-                    ys=y_err_y,
-                    color=df[df['obs']]['color'],
-                    alpha=[1.0] * len(df[df['obs']]),
+                    xs=y_err_x, ys=y_err_y, color=obs['color'], alpha=np.ones(len(obs)),
                 )
             ),
         )
@@ -688,12 +868,14 @@ def spectroscopy_plot(obj_id, user, spec_id=None, width=600, height=300):
         .join(GroupSpectrum)
         .filter(
             Spectrum.obj_id == obj_id,
-            GroupSpectrum.group_id.in_([g.id for g in user.accessible_groups]),
+            GroupSpectrum.group_id.in_(list(user.accessible_group_ids)),
         )
-    ).all()
-
+        .options(defer(Spectrum.original_file_string))
+    )
     if spec_id is not None:
-        spectra = [spec for spec in spectra if spec.id == int(spec_id)]
+        spectra = spectra.filter(Spectrum.id == int(spec_id))
+    spectra = spectra.all()
+
     if len(spectra) == 0:
         return None, None, None
 
@@ -277,3 +277,36 @@ def test_delete_annotation(annotation_token, public_source):
 
     status, data = api('GET', f'annotation/{annotation_id}', token=annotation_token)
     assert status == 400
+
+
+def test_annotations_info_lists_keys_by_group(
+    annotation_token_two_groups,
+    view_only_token,
+    view_only_token_group2,
+    public_source_two_groups,
+    public_group2,
+):
+    origin = str(uuid.uuid4())
+    status, data = api(
+        'POST',
+        'annotation',
+        data={
+            'obj_id': public_source_two_groups.id,
+            'origin': origin,
+            'data': {'offset_from_host_galaxy': 1.5, 'host_name': 'NGC 1234'},
+            'group_ids': [public_group2.id],
+        },
+        token=annotation_token_two_groups,
+    )
+    assert status == 200
+
+    status, data = api('GET', 'internal/annotations_info', token=view_only_token_group2)
+    assert status == 200
+    assert sorted(data['data'][origin], key=lambda d: list(d)[0]) == [
+        {'host_name': 'string'},
+        {'offset_from_host_galaxy': 'number'},
+    ]
+
+    status, data = api('GET', 'internal/annotations_info', token=view_only_token)
+    assert status == 200
+    assert origin not in data['data']
@@ -75,6 +75,92 @@ def test_token_user_post_delete_new_candidate(
     assert status == 200
 
 
+def test_post_candidates_in_bulk(
+    upload_data_token, view_only_token, public_filter, public_candidate
+):
+    obj_id = str(uuid.uuid4())
+    passed_at = str(datetime.datetime.utcnow())
+    new_candidate = {
+        "id": obj_id,
+        "ra": 234.22,
+        "dec": -22.33,
+        "redshift": 3,
+        "filter_ids": [public_filter.id],
+        "passed_at": passed_at,
+    }
+    status, data = api(
+        "POST",
+        "candidates/bulk",
+        data={
+            "candidates": [
+                new_candidate,
+                {
+                    "id": public_candidate.id,
+                    "redshift": 0.5,
+                    "filter_ids": [public_filter.id],
+                    "passed_at": passed_at,
+                },
+                {"id": str(uuid.uuid4()), "ra": 10.0, "dec": 10.0},
+            ]
+        },
+        token=upload_data_token,
+    )
+    assert status == 200
+    new_result, existing_result, invalid_result = data["data"]["results"]
+    assert new_result["status"] == "success"
+    assert new_result["obj_created"]
+    assert len(new_result["ids"]) == 1
+    assert existing_result["status"] == "success"
+    assert not existing_result["obj_created"]
+    assert len(existing_result["ids"]) == 1
+    assert invalid_result["status"] == "error"
+    assert "passed_at" in invalid_result["message"]
+
+    status, data = api("GET", f"candidates/{obj_id}", token=view_only_token)
+    assert status == 200
+    npt.assert_almost_equal(data["data"]["ra"], 234.22)
+    assert {t["type"] for t in data["data"]["thumbnails"]} >= {"sdss", "dr8"}
+
+    status, data = api(
+        "GET", f"candidates/{public_candidate.id}", token=view_only_token
+    )
+    assert status == 200
+    npt.assert_almost_equal(data["data"]["redshift"], 0.5)
+
+    # Posting the same candidate again does not duplicate it
+    status, data = api(
+        "POST",
+        "candidates/bulk",
+        data={"candidates": [new_candidate]},
+        token=upload_data_token,
+    )
+    assert status == 200
+    assert data["data"]["results"][0]["ids"] == []
+
+
+def test_cannot_post_candidates_in_bulk_to_inaccessible_filter(
+    upload_data_token, public_filter2
+):
+    status, data = api(
+        "POST",
+        "candidates/bulk",
+        data={
+            "candidates": [
+                {
+                    "id": str(uuid.uuid4()),
+                    "ra": 234.22,
+                    "dec": -22.33,
+                    "filter_ids": [public_filter2.id],
+                    "passed_at": str(datetime.datetime.utcnow()),
+                }
+            ]
+        },
+        token=upload_data_token,
+    )
+    assert status == 400
+    assert "Insufficient permissions" in data["message"]
+
+
 def test_cannot_add_candidate_without_filter_id(upload_data_token):
     obj_id = str(uuid.uuid4())
     status, data = api(
@@ -632,3 +718,136 @@ def test_candidate_list_redshift_range(
     assert status == 200
     assert len(data["data"]["candidates"]) == 1
     assert data["data"]["candidates"][0]["id"] == obj_id1
+
+
+def test_candidate_list_cursor_pagination(
+    upload_data_token, view_only_token, public_filter
+):
+    obj_ids = [str(uuid.uuid4()) for _ in range(3)]
+    passed_at = datetime.datetime(2020, 1, 1)
+    for i, obj_id in enumerate(obj_ids + obj_ids[:1]):
+        status, data = api(
+            "POST",
+            "candidates",
+            data={
+                "id": obj_id,
+                "ra": 234.22,
+                "dec": -22.33,
+                "redshift": 3,
+                "transient": False,
+                "ra_dis": 2.3,
+                "filter_ids": [public_filter.id],
+                "passed_at": str(passed_at + datetime.timedelta(days=i)),
+            },
+            token=upload_data_token,
+        )
+        assert status == 200
+
+    # The first object passed the filter again last, so it comes first
+    params = {"filterIDs": f"{public_filter.id}", "numPerPage": 2, "useCursor": "true"}
+    status, data = api("GET", "candidates", params=params, token=view_only_token)
+    assert status == 200
+    assert [c["id"] for c in data["data"]["candidates"]] == [obj_ids[0], obj_ids[2]]
+    assert data["data"]["nextCursor"] is not None
+
+    params["cursor"] = data["data"]["nextCursor"]
+    status, data = api("GET", "candidates", params=params, token=view_only_token)
+    assert status == 200
+    assert [c["id"] for c in data["data"]["candidates"]] == [obj_ids[1]]
+    assert data["data"]["nextCursor"] is None
+
+    params["cursor"] = "not-a-cursor"
+    status, data = api("GET", "candidates", params=params, token=view_only_token)
+    assert status == 400
+    assert data["message"] == "Invalid cursor."
+
+    # useCursor=false keeps page-number pagination
+    params = {"filterIDs": f"{public_filter.id}", "numPerPage": 2, "useCursor": "false"}
+    status, data = api("GET", "candidates", params=params, token=view_only_token)
+    assert status == 200
+    assert "nextCursor" not in data["data"]
+    assert "totalMatches" in data["data"]
+
+
+def test_candidate_list_saved_and_passing_groups(
+    upload_data_token,
+    view_only_token,
+    public_filter,
+    public_group,
+    public_candidate,
+    public_candidate2,
+):
+    status, data = api(
+        "POST",
+        "sources",
+        data={"id": public_candidate.id, "group_ids": [public_group.id]},
+        token=upload_data_token,
+    )
+    assert status == 200
+
+    status, data = api(
+        "GET",
+        "candidates",
+        params={"filterIDs": f"{public_filter.id}", "numPerPage": 100},
+        token=view_only_token,
+    )
+    assert status == 200
+    candidates = {c["id"]: c for c in data["data"]["candidates"]}
+
+    saved = candidates[public_candidate.id]
+    assert saved["is_source"]
+    assert [g["id"] for g in saved["saved_groups"]] == [public_group.id]
+    assert saved["passing_group_ids"] == [public_group.id]
+
+    unsaved = candidates[public_candidate2.id]
+    assert not unsaved["is_source"]
+    assert "saved_groups" not in unsaved
+    assert unsaved["passing_group_ids"] == [public_group.id]
+
+
+def test_candidate_list_filtering_updated_annotation(
+    annotation_token, view_only_token, public_candidate
+):
+    origin = str(uuid.uuid4())
+    status, data = api(
+        "POST",
+        "annotation",
+        data={
+            "obj_id": public_candidate.id,
+            "origin": origin,
+            "data": {"numeric_field": 1},
+        },
+        token=annotation_token,
+    )
+    assert status == 200
+    annotation_id = data["data"]["annotation_id"]
+
+    annotation_filter = (
+        f'{{"origin":"{origin}","key":"numeric_field","min":1.5, "max":2.5}}'
+    )
+    status, data = api(
+        "GET",
+        "candidates",
+        params={"annotationFilterList": annotation_filter},
+        token=view_only_token,
+    )
+    assert status == 200
+    assert len(data["data"]["candidates"]) == 0
+
+    # The filtered on values follow updates of the annotation
+    status, data = api(
+        "PUT",
+        f"annotation/{annotation_id}",
+        data={"data": {"numeric_field": 2}},
+        token=annotation_token,
+    )
+    assert status == 200
+
+    status, data = api(
+        "GET",
+        "candidates",
+        params={"annotationFilterList": annotation_filter},
+        token=view_only_token,
+    )
+    assert status == 200
+    assert [c["id"] for c in data["data"]["candidates"]] == [public_candidate.id]
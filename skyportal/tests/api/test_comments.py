@@ -247,3 +247,60 @@ def test_problematic_post_comment_attachment_1275(
     )
     assert status == 200
     assert data['status'] == 'success'
+
+
+def test_source_comments_filtered_by_group_access(
+    comment_token_two_groups, public_source_two_groups, public_group2, comment_token,
+):
+    status, data = api(
+        'POST',
+        'comment',
+        data={
+            'obj_id': public_source_two_groups.id,
+            'text': 'Group 2 only',
+            'group_ids': [public_group2.id],
+        },
+        token=comment_token_two_groups,
+    )
+    assert status == 200
+    comment_id = data['data']['comment_id']
+
+    # This token belongs to public_group2
+    status, data = api(
+        'GET',
+        f'sources/{public_source_two_groups.id}',
+        params={'includeComments': True},
+        token=comment_token_two_groups,
+    )
+    assert status == 200
+    comment = next(c for c in data['data']['comments'] if c['id'] == comment_id)
+    assert comment['author_info']['username'] is not None
+    assert public_group2.id in [g['id'] for g in comment['groups']]
+
+    status, data = api(
+        'GET',
+        'sources',
+        params={'includeComments': True, 'sourceID': public_source_two_groups.id},
+        token=comment_token_two_groups,
+    )
+    assert status == 200
+    assert comment_id in [c['id'] for c in data['data']['sources'][0]['comments']]
+
+    # This token does not belong to public_group2
+    status, data = api(
+        'GET',
+        f'sources/{public_source_two_groups.id}',
+        params={'includeComments': True},
+        token=comment_token,
+    )
+    assert status == 200
+    assert comment_id not in [c['id'] for c in data['data']['comments']]
+
+    status, data = api(
+        'GET',
+        'sources',
+        params={'includeComments': True, 'sourceID': public_source_two_groups.id},
+        token=comment_token,
+    )
+    assert status == 200
+    assert comment_id not in [c['id'] for c in data['data']['sources'][0]['comments']]
@@ -1,5 +1,6 @@
 import uuid
 from skyportal.tests import api
+from skyportal.models import DBSession
 from skyportal.model_util import create_token
 from baselayer.app.env import load_env
 
@@ -351,3 +352,16 @@ def test_obj_groups(public_source, public_group, super_admin_token):
     )
     assert status == 200
     assert data["data"][0]["id"] == public_group.id
+
+
+def test_accessible_group_ids_follow_membership_changes(
+    user_two_groups, public_group, public_group2
+):
+    assert user_two_groups.accessible_group_ids == {public_group.id, public_group2.id}
+    assert user_two_groups.accessible_group_ids == {
+        g.id for g in user_two_groups.accessible_groups
+    }
+
+    user_two_groups.groups.remove(public_group2)
+    DBSession().commit()
+    assert user_two_groups.accessible_group_ids == {public_group.id}
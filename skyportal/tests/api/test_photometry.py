@@ -1,9 +1,19 @@
 from baselayer.app.env import load_env
 from skyportal.tests import api
 import numpy as np
+import pandas as pd
 import sncosmo
+import io
+import json
 import math
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 
+import pytest
+import sqlalchemy as sa
+
+from skyportal.handlers.api import photometry as photometry_handlers
 from skyportal.models import DBSession, Token
 
 
@@ -1300,6 +1310,59 @@ def test_token_user_retrieving_source_photometry_and_convert(
     assert np.allclose(magerrlast_ab, magerrlast_vega)
 
 
+def test_obj_photometry_matches_single_point_serialization(
+    upload_data_token, public_source, ztf_camera, public_group
+):
+    status, data = api(
+        'POST',
+        'photometry',
+        data={
+            'obj_id': str(public_source.id),
+            'mjd': [59100.0, 59101.0],
+            'instrument_id': ztf_camera.id,
+            'mag': [18.2, None],
+            'magerr': [0.1, None],
+            'limiting_mag': [21.0, 20.5],
+            'magsys': 'vega',
+            'filter': ['ztfg', 'ztfr'],
+            'group_ids': [public_group.id],
+        },
+        token=upload_data_token,
+    )
+    assert status == 200
+    assert data['status'] == 'success'
+    ids = data['data']['ids']
+
+    for format in ['mag', 'flux']:
+        status, data = api(
+            'GET',
+            f'sources/{public_source.id}/photometry?format={format}&magsys=ab',
+            token=upload_data_token,
+        )
+        assert status == 200
+        assert data['status'] == 'success'
+        batch = {p['id']: p for p in data['data']}
+
+        for photometry_id in ids:
+            status, data = api(
+                'GET',
+                f'photometry/{photometry_id}?format={format}&magsys=ab',
+                token=upload_data_token,
+            )
+            assert status == 200
+            single = data['data']
+            assert set(batch[photometry_id]) == set(single)
+            for key, value in single.items():
+                if key == 'groups':
+                    assert {g['id'] for g in batch[photometry_id][key]} == {
+                        g['id'] for g in value
+                    }
+                elif isinstance(value, float):
+                    np.testing.assert_allclose(batch[photometry_id][key], value)
+                else:
+                    assert batch[photometry_id][key] == value
+
+
 def test_token_user_retrieve_null_photometry(
     upload_data_token, public_source, ztf_camera, public_group
 ):
@@ -1368,6 +1431,122 @@ def test_token_user_big_post(
     assert data['status'] == 'success'
 
 
+def test_token_user_big_post_copy_preserves_groups_and_upload_id(
+    upload_data_token, public_source, ztf_camera, public_group
+):
+    npoints = cfg['photometry.copy_threshold'] + 10
+    status, data = api(
+        'POST',
+        'photometry',
+        data={
+            'obj_id': str(public_source.id),
+            'mjd': [57000 + i for i in range(npoints)],
+            'instrument_id': ztf_camera.id,
+            'flux': np.random.uniform(low=10, high=20, size=npoints).tolist(),
+            'fluxerr': 0.5,
+            'zp': 25.0,
+            'magsys': 'ab',
+            'filter': 'ztfr',
+            'origin': 'copy_test',
+            'altdata': {'note': 'tab\tand\nnewline'},
+            'group_ids': [public_group.id],
+        },
+        token=upload_data_token,
+    )
+    assert status == 200
+    assert data['status'] == 'success'
+    ids = data['data']['ids']
+    upload_id = data['data']['upload_id']
+    assert len(ids) == npoints
+
+    status, data = api(
+        'GET', f'photometry/{ids[-1]}?format=flux', token=upload_data_token
+    )
+    assert status == 200
+    assert data['status'] == 'success'
+    assert data['data']['origin'] == 'copy_test'
+    assert public_group.id in [g['id'] for g in data['data']['groups']]
+
+    status, data = api(
+        'DELETE', f'photometry/bulk_delete/{upload_id}', token=upload_data_token
+    )
+    assert status == 200
+    assert data['data'] == f'Deleted {npoints} photometry points.'
+
+
+def test_token_user_async_post_photometry(
+    upload_data_token, public_source, ztf_camera, public_group
+):
+    npoints = 20
+    status, data = api(
+        'POST',
+        'photometry?async=true',
+        data={
+            'obj_id': str(public_source.id),
+            'mjd': [56000 + i for i in range(npoints)],
+            'instrument_id': ztf_camera.id,
+            'flux': np.random.uniform(low=10, high=20, size=npoints).tolist(),
+            'fluxerr': 0.5,
+            'zp': 25.0,
+            'magsys': 'ab',
+            'filter': 'ztfr',
+            'group_ids': [public_group.id],
+        },
+        token=upload_data_token,
+    )
+    assert status == 200
+    assert data['status'] == 'success'
+    job_id = data['data']['job_id']
+    upload_id = data['data']['upload_id']
+
+    for _ in range(30):
+        status, data = api('GET', f'photometry/jobs/{job_id}', token=upload_data_token)
+        assert status == 200
+        assert data['status'] == 'success'
+        if data['data']['status'] in ('complete', 'failed'):
+            break
+        time.sleep(1)
+
+    job = data['data']
+    assert job['status'] == 'complete'
+    assert job['upload_id'] == upload_id
+    assert job['n_rows'] == npoints
+    assert job['n_accepted'] == npoints
+    assert job['n_rejected'] == 0
+    assert len(job['photometry_ids']) == npoints
+
+    status, data = api(
+        'GET', f'photometry/{job["photometry_ids"][0]}', token=upload_data_token
+    )
+    assert status == 200
+    assert public_group.id in [g['id'] for g in data['data']['groups']]
+
+
+def test_token_user_post_photometry_async_false_is_synchronous(
+    upload_data_token, public_source, ztf_camera, public_group
+):
+    status, data = api(
+        'POST',
+        'photometry?async=false',
+        data={
+            'obj_id': str(public_source.id),
+            'mjd': [56100.0, 56101.0],
+            'instrument_id': ztf_camera.id,
+            'flux': [12.24, 13.1],
+            'fluxerr': 0.031,
+            'zp': 25.0,
+            'magsys': 'ab',
+            'filter': 'ztfg',
+            'group_ids': [public_group.id],
+        },
+        token=upload_data_token,
+    )
+    assert status == 200
+    assert data['status'] == 'success'
+    assert 'job_id' not in data['data']
+    assert len(data['data']['ids']) == 2
+
+
 def test_token_user_get_range_photometry(
     upload_data_token, public_source, public_group, ztf_camera
 ):
@@ -1411,6 +1590,92 @@ def test_token_user_get_range_photometry(
     assert len(data['data']) == 2
 
 
+def test_token_user_page_and_export_range_photometry(
+    upload_data_token, public_source, public_group, ztf_camera
+):
+    mjds = [55000.0, 55000.0, 55001.0, 55002.0, 55003.0]
+    status, data = api(
+        'POST',
+        'photometry',
+        data={
+            'obj_id': str(public_source.id),
+            'mjd': mjds,
+            'instrument_id': ztf_camera.id,
+            'flux': [12.24, 13.1, 14.0, 15.5, 16.0],
+            'fluxerr': 0.031,
+            'zp': 25.0,
+            'magsys': 'ab',
+            'filter': 'ztfg',
+            'group_ids': [public_group.id],
+        },
+        token=upload_data_token,
+    )
+    assert status == 200
+    assert data['status'] == 'success'
+    ids = data['data']['ids']
+
+    body = {
+        'instrument_ids': [ztf_camera.id],
+        'min_date': '2009-06-18T00:00:00',
+        'max_date': '2009-06-22T00:00:00',
+    }
+
+    pages = []
+    params = {'format': 'flux', 'numPerPage': 2}
+    while True:
+        status, data = api(
+            'GET', 'photometry/range', params=params, data=body, token=upload_data_token
+        )
+        assert status == 200
+        assert data['status'] == 'success'
+        if len(data['data']) == 0:
+            break
+        pages.append(data['data'])
+        params['afterMjd'] = data['data'][-1]['mjd']
+        params['afterId'] = data['data'][-1]['id']
+
+    assert [len(p) for p in pages] == [2, 2, 1]
+    points = [point for p in pages for point in p]
+    assert [p['id'] for p in points] == sorted(
+        ids, key=lambda i: (mjds[ids.index(i)], i)
+    )
+
+    response = api(
+        'GET',
+        'photometry/range?format=flux&export=ndjson',
+        data=body,
+        token=upload_data_token,
+        raw_response=True,
+    )
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line['id'] for line in lines] == [p['id'] for p in points]
+
+    response = api(
+        'GET',
+        'photometry/range?format=mag&export=csv',
+        data=body,
+        token=upload_data_token,
+        raw_response=True,
+    )
+    assert response.status_code == 200
+    df = pd.read_csv(io.StringIO(response.text))
+    assert df['id'].tolist() == [p['id'] for p in points]
+    assert 'limiting_mag' in df.columns
+
+    response = api(
+        'GET',
+        'photometry/range?format=flux&export=parquet',
+        data=body,
+        token=upload_data_token,
+        raw_response=True,
+    )
+    assert response.status_code == 200
+    df = pd.read_parquet(io.BytesIO(response.content))
+    assert df['id'].tolist() == [p['id'] for p in points]
+    assert all(public_group.id in groups for groups in df['groups'])
+
+
 def test_reject_photometry_inf(
     upload_data_token, public_source, public_group, ztf_camera
 ):
@@ -2163,3 +2428,269 @@ def test_problematic_photometry_1276(
     status, data = api('PUT', 'photometry', data=payload, token=super_admin_token,)
     assert status == 400
     assert data['status'] == 'error'
+
+
+def test_detection_summary_follows_photometry(
+    upload_data_token, public_group, ztf_camera
+):
+    obj_id = str(uuid.uuid4())
+    status, data = api(
+        'POST',
+        'sources',
+        data={
+            'id': obj_id,
+            'ra': 234.22,
+            'dec': -22.33,
+            'group_ids': [public_group.id],
+        },
+        token=upload_data_token,
+    )
+    assert status == 200
+
+    def post_photometry(mjd, flux, filter):
+        status, data = api(
+            'POST',
+            'photometry',
+            data={
+                'obj_id': obj_id,
+                'mjd': mjd,
+                'instrument_id': ztf_camera.id,
+                'flux': flux,
+                'fluxerr': [1.0] * len(mjd),
+                'zp': [23.9] * len(mjd),
+                'magsys': ['ab'] * len(mjd),
+                'filter': filter,
+                'group_ids': [public_group.id],
+            },
+            token=upload_data_token,
+        )
+        assert status == 200
+        return data['data']['ids']
+
+    def get_summary():
+        status, data = api('GET', f'sources/{obj_id}', token=upload_data_token)
+        assert status == 200
+        return data['data']
+
+    # Only the points with a S/N above 5 are detections
+    ids = post_photometry(
+        [59000.0, 59001.0, 59002.0], [10.0, 50.0, 1.0], ['ztfg', 'ztfg', 'ztfr']
+    )
+    summary = get_summary()
+    assert summary['num_detections'] == 2
+    np.testing.assert_allclose(summary['first_detected_mjd'], 59000.0)
+    np.testing.assert_allclose(summary['last_detected_mjd'], 59001.0)
+    np.testing.assert_allclose(summary['peak_detection_flux']['ztfg'], 50.0)
+    assert 'ztfr' not in summary['peak_detection_flux']
+
+    post_photometry([59003.0], [20.0], ['ztfr'])
+    summary = get_summary()
+    assert summary['num_detections'] == 3
+    np.testing.assert_allclose(summary['last_detected_mjd'], 59003.0)
+    np.testing.assert_allclose(summary['peak_detection_flux']['ztfr'], 20.0)
+
+    status, data = api('DELETE', f'photometry/{ids[1]}', token=upload_data_token)
+    assert status == 200
+    summary = get_summary()
+    assert summary['num_detections'] == 2
+    np.testing.assert_allclose(summary['peak_detection_flux']['ztfg'], 10.0)
+
+
+def test_detection_summary_of_orm_photometry(upload_data_token, public_source):
+    # The fixture photometry is inserted through the ORM, with 10 points
+    # above a S/N of 5
+    status, data = api('GET', f'sources/{public_source.id}', token=upload_data_token)
+    assert status == 200
+    assert data['data']['num_detections'] == 10
+    assert data['data']['last_detected_mjd'] is not None
+
+
+def test_detection_summary_follows_photometry_moved_to_other_obj(
+    upload_data_token, public_group, ztf_camera
+):
+    obj_ids = [str(uuid.uuid4()), str(uuid.uuid4())]
+    for obj_id in obj_ids:
+        status, data = api(
+            'POST',
+            'sources',
+            data={
+                'id': obj_id,
+                'ra': 234.22,
+                'dec': -22.33,
+                'group_ids': [public_group.id],
+            },
+            token=upload_data_token,
+        )
+        assert status == 200
+
+    point = {
+        'mjd': 59000.0,
+        'instrument_id': ztf_camera.id,
+        'flux': 50.0,
+        'fluxerr': 1.0,
+        'zp': 23.9,
+        'magsys': 'ab',
+        'filter': 'ztfg',
+    }
+    status, data = api(
+        'POST',
+        'photometry',
+        data={**point, 'obj_id': obj_ids[0], 'group_ids': [public_group.id]},
+        token=upload_data_token,
+    )
+    assert status == 200
+    photometry_id = data['data']['ids'][0]
+
+    status, data = api(
+        'PATCH',
+        f'photometry/{photometry_id}',
+        data={**point, 'obj_id': obj_ids[1]},
+        token=upload_data_token,
+    )
+    assert status == 200
+
+    status, data = api('GET', f'sources/{obj_ids[0]}', token=upload_data_token)
+    assert status == 200
+    assert data['data']['num_detections'] == 0
+    assert data['data']['last_detected_mjd'] is None
+
+    status, data = api('GET', f'sources/{obj_ids[1]}', token=upload_data_token)
+    assert status == 200
+    assert data['data']['num_detections'] == 1
+    np.testing.assert_allclose(data['data']['last_detected_mjd'], 59000.0)
+
+
+def test_light_curve_columns(
+    upload_data_token, view_only_token, public_group, ztf_camera
+):
+    obj_id = str(uuid.uuid4())
+    status, data = api(
+        'POST',
+        'sources',
+        data={
+            'id': obj_id,
+            'ra': 234.22,
+            'dec': -22.33,
+            'group_ids': [public_group.id],
+        },
+        token=upload_data_token,
+    )
+    assert status == 200
+
+    status, data = api(
+        'POST',
+        'photometry',
+        data={
+            'obj_id': obj_id,
+            'mjd': [58001.0, 58000.0, 58002.0],
+            'instrument_id': ztf_camera.id,
+            'flux': [100.0, 12.0, None],
+            'fluxerr': [1.0, 1.0, 2.0],
+            'zp': 23.9,
+            'magsys': 'ab',
+            'filter': ['ztfr', 'ztfg', 'ztfg'],
+            'group_ids': [public_group.id],
+        },
+        token=upload_data_token,
+    )
+    assert status == 200
+
+    status, data = api(
+        'GET', f'internal/plot/lightcurve/{obj_id}', token=view_only_token
+    )
+    assert status == 200
+    data = data['data']
+    assert data['filters'] == ['ztfg', 'ztfr']
+    assert [i['id'] for i in data['instruments']] == [ztf_camera.id]
+
+    columns = data['columns']
+    assert columns['mjd'] == [58000.0, 58001.0, 58002.0]
+    assert [data['filters'][f] for f in columns['filter']] == ['ztfg', 'ztfr', 'ztfg']
+    assert columns['instrument'] == [0, 0, 0]
+    np.testing.assert_allclose(
+        columns['mag'][:2], -2.5 * np.log10([12.0, 100.0]) + 23.9
+    )
+    assert columns['flux'][2] is None
+    assert columns['mag'][2] is None
+    np.testing.assert_allclose(columns['lim_mag'][2], -2.5 * np.log10(2.0 * 3) + 23.9)
+
+    status, data = api(
+        'GET',
+        f'internal/plot/lightcurve/{obj_id}',
+        params={'format': 'csv'},
+        token=view_only_token,
+    )
+    assert status == 400
+
+    for max_points in ['-1', '1.5', 'all']:
+        for endpoint in ['lightcurve', 'photometry']:
+            status, data = api(
+                'GET',
+                f'internal/plot/{endpoint}/{obj_id}',
+                params={'maxPoints': max_points},
+                token=view_only_token,
+            )
+            assert status == 400
+            assert 'maxPoints' in data['message']
+
+
+@pytest.mark.parametrize('lock_mode', ['object', 'table'])
+def test_upsert_photometry_lock_modes(
+    lock_mode, monkeypatch, public_source, public_group, ztf_camera, user
+):
+    monkeypatch.setitem(photometry_handlers.cfg['photometry'], 'lock_mode', lock_mode)
+
+    ids = []
+    n_duplicated = []
+    for _ in range(2):
+        df, instrument_cache = photometry_handlers.standardize_photometry_data(
+            {
+                'obj_id': str(public_source.id),
+                'mjd': [57000.0, 57001.0, 57002.0],
+                'instrument_id': ztf_camera.id,
+                'flux': [12.24, 13.1, 14.0],
+                'fluxerr': 0.031,
+                'zp': 25.0,
+                'magsys': 'ab',
+                'filter': 'ztfg',
+            }
+        )
+        upload_ids, upload_n_duplicated = photometry_handlers.upsert_photometry_data(
+            df, instrument_cache, [public_group.id], user.id
+        )
+        DBSession().commit()
+        ids.append(upload_ids)
+        n_duplicated.append(upload_n_duplicated)
+
+    assert n_duplicated == [0, 3]
+    assert ids[0] == ids[1]
+
+
+@pytest.mark.parametrize('lock_mode', ['object', 'table'])
+def test_photometry_lock_serializes_uploads(lock_mode, monkeypatch):
+    monkeypatch.setitem(photometry_handlers.cfg['photometry'], 'lock_mode', lock_mode)
+    obj_ids = [str(uuid.uuid4()), str(uuid.uuid4())]
+
+    def try_lock(obj_id):
+        # Runs in another thread, hence with another session and transaction
+        try:
+            DBSession().execute("SET LOCAL lock_timeout = '2s'")
+            photometry_handlers.lock_photometry([obj_id])
+            return True
+        except sa.exc.OperationalError:
+            return False
+        finally:
+            DBSession().rollback()
+            DBSession.remove()
+
+    photometry_handlers.lock_photometry([obj_ids[0]])
+    try:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            # Uploads for the same object always wait for each other
+            assert not executor.submit(try_lock, obj_ids[0]).result()
+            # Uploads for different objects only do with a table lock
+            assert executor.submit(try_lock, obj_ids[1]).result() == (
+                lock_mode == 'object'
+            )
+    finally:
+        DBSession().rollback()
@@ -51,6 +51,93 @@ def test_token_user_retrieving_source_with_phot(view_only_token, public_source):
     )
 
 
+def test_source_list_matches_single_source(view_only_token, public_source):
+    params = {
+        "includePhotometry": "true",
+        "includeComments": "true",
+        "includeSpectrumExists": "true",
+    }
+    status, data = api(
+        "GET", f"sources/{public_source.id}", params=params, token=view_only_token
+    )
+    assert status == 200
+    single = data["data"]
+
+    status, data = api(
+        "GET",
+        "sources",
+        params={**params, "sourceID": public_source.id},
+        token=view_only_token,
+    )
+    assert status == 200
+    listed = [s for s in data["data"]["sources"] if s["id"] == public_source.id]
+    assert len(listed) == 1
+    listed = listed[0]
+
+    assert listed["last_detected"] == single["last_detected"]
+    assert listed["spectrum_exists"] == single["spectrum_exists"]
+    assert sorted(p["id"] for p in listed["photometry"]) == sorted(
+        p["id"] for p in single["photometry"]
+    )
+    assert [c["id"] for c in listed["comments"]] == [
+        c["id"] for c in single["comments"]
+    ]
+    assert [a["id"] for a in listed["annotations"]] == [
+        a["id"] for a in single["annotations"]
+    ]
+    assert {c["id"] for c in listed["classifications"]} == {
+        c["id"] for c in single["classifications"]
+    }
+    listed_groups = {g["id"]: g for g in listed["groups"]}
+    assert set(listed_groups) == {g["id"] for g in single["groups"]}
+    for group in single["groups"]:
+        for key in ["active", "requested", "saved_at", "saved_by"]:
+            assert listed_groups[group["id"]][key] == group[key]
+
+
+def test_source_list_cursor_pagination(
+    upload_data_token, view_only_token, public_group
+):
+    obj_ids = [str(uuid.uuid4()) for _ in range(3)]
+    for obj_id in obj_ids:
+        status, data = api(
+            "POST",
+            "sources",
+            data={
+                "id": obj_id,
+                "ra": 234.22,
+                "dec": -22.33,
+                "redshift": 3,
+                "transient": False,
+                "ra_dis": 2.3,
+                "group_ids": [public_group.id],
+            },
+            token=upload_data_token,
+        )
+        assert status == 200
+
+    # Sources come back by descending save time
+    listed = []
+    params = {"group_ids": f"{public_group.id}", "numPerPage": 2, "useCursor": "true"}
+    while True:
+        status, data = api("GET", "sources", params=params, token=view_only_token)
+        assert status == 200
+        assert len(data["data"]["sources"]) <= 2
+        listed.extend(s["id"] for s in data["data"]["sources"])
+        if data["data"]["nextCursor"] is None:
+            break
+        params["cursor"] = data["data"]["nextCursor"]
+    assert listed[:3] == obj_ids[::-1]
+    assert len(listed) == len(set(listed))
+
+    # useCursor=false keeps page-number pagination
+    params = {"group_ids": f"{public_group.id}", "numPerPage": 2, "useCursor": "false"}
+    status, data = api("GET", "sources", params=params, token=view_only_token)
+    assert status == 200
+    assert "nextCursor" not in data["data"]
+    assert "totalMatches" in data["data"]
+
+
 def test_token_user_update_source(upload_data_token, public_source):
     status, data = api(
         "PATCH",
@@ -103,6 +190,29 @@ def test_distance_modulus(upload_data_token, public_source):
     )
 
 
+def test_non_numeric_distance_modulus(upload_data_token, public_group):
+    obj_id = str(uuid.uuid4())
+    status, data = api(
+        "POST",
+        "sources",
+        data={
+            "id": obj_id,
+            "ra": 234.22,
+            "dec": -22.33,
+            "altdata": {"dm": "n/a"},
+            "group_ids": [public_group.id],
+        },
+        token=upload_data_token,
+    )
+    assert status == 200
+    assert data["status"] == "success"
+
+    status, data = api("GET", f"sources/{obj_id}", token=upload_data_token)
+    assert status == 200
+    assert data["data"]["dm"] is None
+    assert data["data"]["luminosity_distance"] is None
+
+
 def test_parallax(upload_data_token, public_source):
     parallax = 0.001  # in arcsec = 1 kpc
     d_pc = 1 / parallax
@@ -170,6 +280,56 @@ def test_cannot_update_source_without_permission(view_only_token, public_source)
     assert data["status"] == "error"
 
 
+def test_cone_search_and_crossmatch(upload_data_token, view_only_token, public_group):
+    obj_id = str(uuid.uuid4())
+    ra, dec = np.random.uniform(10, 350), np.random.uniform(-60, 60)
+    status, data = api(
+        "POST",
+        "sources",
+        data={"id": obj_id, "ra": ra, "dec": dec, "group_ids": [public_group.id]},
+        token=upload_data_token,
+    )
+    assert status == 200
+
+    status, data = api(
+        "GET",
+        "sources",
+        params={"ra": ra, "dec": dec + 0.5 / 3600, "radius": 1 / 3600},
+        token=view_only_token,
+    )
+    assert status == 200
+    assert [s["id"] for s in data["data"]["sources"]] == [obj_id]
+
+    positions = [
+        {"ra": ra, "dec": dec + 0.5 / 3600, "radius": 1 / 3600},
+        {"ra": ra, "dec": dec + 2 / 3600, "radius": 1 / 3600},
+    ]
+    status, data = api(
+        "POST", "crossmatch", data={"positions": positions}, token=view_only_token
+    )
+    assert status == 200
+    first, second = data["data"]["matches"]
+    assert [m["id"] for m in first] == [obj_id]
+    npt.assert_allclose(first[0]["separation"], 0.5 / 3600, rtol=1e-6)
+    assert second == []
+
+    # The index follows changes to the position
+    status, data = api(
+        "PATCH",
+        f"sources/{obj_id}",
+        data={"dec": dec + 2 / 3600},
+        token=upload_data_token,
+    )
+    assert status == 200
+    status, data = api(
+        "POST", "crossmatch", data={"positions": positions}, token=view_only_token
+    )
+    assert status == 200
+    first, second = data["data"]["matches"]
+    assert first == []
+    assert [m["id"] for m in second] == [obj_id]
+
+
 def test_token_user_post_new_source(upload_data_token, view_only_token, public_group):
     obj_id = str(uuid.uuid4())
     t0 = datetime.now(timezone.utc)
@@ -496,6 +656,75 @@ def test_sources_sorting(upload_data_token, view_only_token, public_group):
     npt.assert_almost_equal(data["data"]["sources"][1]["ra"], ra1)
 
 
+def test_sources_sort_and_filter_by_derived_quantities(
+    upload_data_token, view_only_token, public_group
+):
+    obj_id = str(uuid.uuid4())
+    obj_id2 = str(uuid.uuid4())
+    for source_id, dm in [(obj_id, 30.0), (obj_id2, 35.0)]:
+        status, data = api(
+            "POST",
+            "sources",
+            data={
+                "id": source_id,
+                "ra": 230,
+                "dec": -22.33,
+                "altdata": {"dm": dm},
+                "group_ids": [public_group.id],
+            },
+            token=upload_data_token,
+        )
+        assert status == 200
+
+    status, data = api(
+        "GET",
+        "sources",
+        params={"sortBy": "dm", "sortOrder": "desc", "group_ids": f"{public_group.id}"},
+        token=view_only_token,
+    )
+    assert status == 200
+    assert [s["id"] for s in data["data"]["sources"]] == [obj_id2, obj_id]
+    npt.assert_almost_equal(data["data"]["sources"][0]["dm"], 35.0)
+    npt.assert_almost_equal(
+        data["data"]["sources"][1]["luminosity_distance"], 10 ** ((30.0 / 5) - 5)
+    )
+
+    status, data = api(
+        "GET",
+        "sources",
+        params={"minDM": 32, "group_ids": f"{public_group.id}"},
+        token=view_only_token,
+    )
+    assert status == 200
+    assert [s["id"] for s in data["data"]["sources"]] == [obj_id2]
+
+    # The derived quantities follow changes to the altdata
+    status, data = api(
+        "PATCH",
+        f"sources/{obj_id2}",
+        data={"ra": 230, "dec": -22.33, "altdata": {"dm": 25.0}},
+        token=upload_data_token,
+    )
+    assert status == 200
+
+    status, data = api(
+        "GET",
+        "sources",
+        params={"maxDM": 32, "sortBy": "dm", "group_ids": f"{public_group.id}"},
+        token=view_only_token,
+    )
+    assert status == 200
+    assert [s["id"] for s in data["data"]["sources"]] == [obj_id2, obj_id]
+
+    status, data = api(
+        "GET",
+        "sources",
+        params={"minGalLat": "north", "group_ids": f"{public_group.id}"},
+        token=view_only_token,
+    )
+    assert status == 400
+
+
 def test_sources_filter_by_classifications(
     upload_data_token,
     taxonomy_token,
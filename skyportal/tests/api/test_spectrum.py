@@ -127,6 +127,83 @@ def test_token_user_get_range_spectrum(
     assert data['data'][0]['obj_id'] == public_source.id
 
 
+def test_get_range_spectrum_metadata_only_and_bulk_data(
+    upload_data_token, view_only_token, public_source, public_group, lris
+):
+    spectrum_ids = []
+    for day, fluxes in [(10, [234.2, 232.1, 235.3]), (11, [434.2, 432.1, 435.3])]:
+        status, data = api(
+            'POST',
+            'spectrum',
+            data={
+                'obj_id': str(public_source.id),
+                'observed_at': f'2019-03-{day}T00:00:00',
+                'instrument_id': lris.id,
+                'wavelengths': [664, 665, 666],
+                'fluxes': fluxes,
+                'group_ids': [public_group.id],
+            },
+            token=upload_data_token,
+        )
+        assert status == 200
+        assert data['status'] == 'success'
+        spectrum_ids.append(data['data']['id'])
+
+    status, data = api(
+        'GET',
+        'spectrum/range',
+        params={
+            'instrument_ids': lris.id,
+            'min_date': '2019-03-01T00:00:00',
+            'max_date': '2019-04-01T00:00:00',
+            'metadataOnly': 'true',
+        },
+        token=upload_data_token,
+    )
+    assert status == 200
+    assert data['status'] == 'success'
+    assert sorted(spec['id'] for spec in data['data']) == spectrum_ids
+    for spec in data['data']:
+        assert spec['obj_id'] == public_source.id
+        for column in ['wavelengths', 'fluxes', 'errors', 'original_file_string']:
+            assert column not in spec
+
+    status, data = api(
+        'GET',
+        f'sources/{public_source.id}/spectra',
+        params={'metadataOnly': 'true'},
+        token=upload_data_token,
+    )
+    assert status == 200
+    assert data['status'] == 'success'
+    assert set(spectrum_ids) <= {spec['id'] for spec in data['data']['spectra']}
+    for spec in data['data']['spectra']:
+        assert spec['obj_id'] == public_source.id
+        for column in ['wavelengths', 'fluxes', 'errors', 'original_file_string']:
+            assert column not in spec
+
+    status, data = api(
+        'GET',
+        'spectrum/data',
+        params={'ids': ','.join(map(str, spectrum_ids))},
+        token=view_only_token,
+    )
+    assert status == 200
+    assert data['status'] == 'success'
+    assert [spec['id'] for spec in data['data']] == spectrum_ids
+    assert data['data'][0]['wavelengths'] == [664, 665, 666]
+    assert data['data'][1]['fluxes'] == [434.2, 432.1, 435.3]
+
+    status, data = api(
+        'GET',
+        'spectrum/data',
+        params={'ids': f'{spectrum_ids[0]},{max(spectrum_ids) + 1000}'},
+        token=view_only_token,
+    )
+    assert status == 400
+    assert 'Invalid spectrum IDs' in data['message']
+
+
 def test_token_user_post_get_spectrum_data(
     upload_data_token, public_source, public_group, lris
 ):
@@ -0,0 +1,23 @@
+import numpy as np
+import numpy.testing as npt
+
+from skyportal.models import BinaryArray
+
+
+def test_binary_array_roundtrip():
+    values = [6640.5, 6641.25, np.nan, 1e-30]
+    for array_type in [BinaryArray(), BinaryArray('<f4', compress=True)]:
+        stored = array_type.process_bind_param(values, None)
+        assert isinstance(stored, bytes)
+        loaded = array_type.process_result_value(memoryview(stored), None)
+        assert loaded.dtype == array_type.dtype
+        npt.assert_allclose(loaded, np.array(values, dtype=array_type.dtype))
+
+    assert BinaryArray().process_bind_param(None, None) is None
+    assert BinaryArray().process_result_value(None, None) is None
+
+
+def test_binary_array_size():
+    values = np.linspace(3000, 10000, 10000)
+    assert len(BinaryArray().process_bind_param(values, None)) == 8 * len(values)
+    assert len(BinaryArray('<f4').process_bind_param(values, None)) == 4 * len(values)
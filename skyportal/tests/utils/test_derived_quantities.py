@@ -0,0 +1,75 @@
+import numpy as np
+import numpy.testing as npt
+from astropy import cosmology
+from astropy import coordinates as ap_coord
+
+from skyportal.utils.derived_quantities import (
+    derived_quantities,
+    luminosity_distances,
+)
+
+cosmo = cosmology.Planck18_arXiv_v2
+
+
+def test_interpolated_luminosity_distances():
+    z = np.array([0.0012, 0.01, 0.1, 0.5, 1.0, 3.0, 15.0, 25.0])
+    npt.assert_allclose(
+        luminosity_distances(z, cosmo), cosmo.luminosity_distance(z).value, rtol=1e-9
+    )
+    npt.assert_allclose(
+        luminosity_distances(z, cosmo, interpolate=False),
+        cosmo.luminosity_distance(z).value,
+    )
+
+
+def test_derived_quantities():
+    quantities = derived_quantities(
+        ra=[234.22, 10.0, None, 0.0],
+        dec=[-22.33, 20.0, None, 0.0],
+        redshift=[3.0, 0.5, None, 0.00001],
+        altdata=[None, {"dm": 28.5}, {"parallax": 0.001}, {}],
+        cosmo=cosmo,
+    )
+
+    coord = ap_coord.SkyCoord([234.22, 10.0], [-22.33, 20.0], unit="deg").galactic
+    npt.assert_allclose([q["gal_lon"] for q in quantities[:2]], coord.l.deg)
+    npt.assert_allclose([q["gal_lat"] for q in quantities[:2]], coord.b.deg)
+    assert quantities[2]["gal_lon"] is None
+
+    d_l = cosmo.luminosity_distance(3.0).value
+    npt.assert_allclose(quantities[0]["luminosity_distance"], d_l, rtol=1e-9)
+    npt.assert_allclose(quantities[0]["dm"], 5 * np.log10(d_l * 1e5), rtol=1e-9)
+    npt.assert_allclose(quantities[0]["angular_diameter_distance"], d_l / 16, rtol=1e-9)
+
+    # Distances in altdata take precedence over the redshift
+    npt.assert_allclose(quantities[1]["dm"], 28.5)
+    npt.assert_allclose(
+        quantities[1]["angular_diameter_distance"], 10 ** (28.5 / 5 - 5) / 1.5 ** 2,
+    )
+    npt.assert_allclose(quantities[2]["dm"], 5 * np.log10(1000 / 10))
+    npt.assert_allclose(
+        quantities[2]["angular_diameter_distance"], 1e-3,
+    )
+
+    # No distance outside of the Hubble flow
+    assert quantities[3]["luminosity_distance"] is None
+    assert quantities[3]["dm"] is None
+    assert quantities[3]["angular_diameter_distance"] is None
+
+
+def test_derived_quantities_ignore_non_numeric_altdata_distances():
+    quantities = derived_quantities(
+        ra=[10.0, 10.0],
+        dec=[20.0, 20.0],
+        redshift=[None, 0.5],
+        altdata=[{"dm": "n/a"}, {"dist_Mpc": [1, 2]}],
+        cosmo=cosmo,
+    )
+    assert quantities[0]["luminosity_distance"] is None
+    assert quantities[0]["dm"] is None
+    # The redshift is used instead
+    npt.assert_allclose(
+        quantities[1]["luminosity_distance"],
+        cosmo.luminosity_distance(0.5).value,
+        rtol=1e-9,
+    )
@@ -0,0 +1,54 @@
+import numpy as np
+import numpy.testing as npt
+
+from skyportal.utils.healpix import (
+    HEALPIX_ORDER,
+    ang2pix,
+    pix2ang,
+    angular_distance,
+    cone_ranges,
+)
+
+
+def test_ang2pix_matches_reference_values():
+    # Values computed with healpy.ang2pix(nside, ra, dec, nest=True, lonlat=True)
+    assert ang2pix(10.0, 20.0) == 1397760956975030485
+    assert ang2pix(275.5, -89.9) == 3170536341708602637
+    assert ang2pix(0.0, 90.0, order=10) == 1048575
+    assert ang2pix(123.4, 45.6, order=12) == 27051095
+    npt.assert_array_equal(
+        ang2pix([359.99, 10.0], [-30.0, 20.0], order=5),
+        [4133, 1397760956975030485 >> (2 * (HEALPIX_ORDER - 5))],
+    )
+
+
+def test_pix2ang_matches_reference_values():
+    ra, dec = pix2ang([0, 100, 767], order=3)
+    npt.assert_allclose(ra, [45.0, 123.75, 315.0])
+    npt.assert_allclose(dec, [4.78019185, 35.68533471, -4.78019185])
+    npt.assert_array_equal(ang2pix(ra, dec, order=3), [0, 100, 767])
+
+
+def test_cone_ranges_cover_cone():
+    rng = np.random.RandomState(8675309)
+    for radius in [1 / 3600, 0.1, 5.0]:
+        for ra, dec in [(10.0, 20.0), (200.0, -89.99), (359.999, 0.0)]:
+            ranges = cone_ranges(ra, dec, radius)
+            lo, hi = np.array(ranges).T
+            assert (lo[1:] > hi[:-1]).all()
+
+            # Random points around the center of the cone
+            n = 5000
+            point_ra = ra + rng.uniform(-1.5, 1.5, n) * radius / np.cos(
+                np.deg2rad(min(abs(dec) + 1.5 * radius, 89.999))
+            )
+            point_dec = np.clip(dec + rng.uniform(-1.5, 1.5, n) * radius, -90, 90)
+            inside = angular_distance(ra, dec, point_ra, point_dec) <= np.deg2rad(
+                radius
+            )
+            assert inside.any()
+
+            pix = ang2pix(point_ra, point_dec)
+            index = np.searchsorted(lo, pix, side='right') - 1
+            covered = (index >= 0) & (pix <= hi[np.maximum(index, 0)])
+            assert covered[inside].all()
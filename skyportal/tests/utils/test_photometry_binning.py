@@ -0,0 +1,66 @@
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+
+from skyportal.plot import bin_photometry, error_bars
+
+
+def test_error_bars():
+    xs, ys = error_bars([1.0, 2.0], [3.0, 4.0], [0.5, 1.0])
+    assert xs == [[1.0, 1.0], [2.0, 2.0]]
+    assert ys == [[2.5, 3.5], [3.0, 5.0]]
+
+
+def test_bin_photometry():
+    n = 1000
+    mjd = np.linspace(58000, 58100, n)
+    flux = np.where(np.arange(n) % 10 == 0, np.nan, 100.0)
+    data = pd.DataFrame(
+        {
+            'mjd': np.concatenate([mjd, [58050.0]]),
+            'flux': np.concatenate([flux, [10.0]]),
+            'fluxerr': np.concatenate([np.full(n, 5.0), [1.0]]),
+            'label': ['ztf/ztfg'] * n + ['p60/sdssi'],
+            'stacked': False,
+        }
+    )
+
+    binned = bin_photometry(data, 50)
+    dense = binned[binned['label'] == 'ztf/ztfg']
+    # Each bin holds one mean flux and one upper limit
+    assert len(dense) == 100
+    assert dense['stacked'].all()
+    npt.assert_allclose(dense['flux'].dropna(), 100.0)
+    detections = dense[dense['flux'].notna()]
+    npt.assert_allclose(detections['fluxerr'], 5.0 / np.sqrt(18))
+    assert np.all(np.diff(binned['mjd']) >= 0)
+
+    # Sparse labels are left alone
+    sparse = binned[binned['label'] == 'p60/sdssi']
+    assert len(sparse) == 1
+    assert not sparse['stacked'].any()
+    assert bin_photometry(data, 2000) is data
+
+
+def test_bin_photometry_zero_fluxerr():
+    n = 100
+    fluxerr = np.full(n, 5.0)
+    fluxerr[[10, 20]] = 0.0
+    fluxerr[30] = np.inf
+    data = pd.DataFrame(
+        {
+            'mjd': np.linspace(58000, 58100, n),
+            'flux': 100.0,
+            'fluxerr': fluxerr,
+            'label': 'ztf/ztfg',
+            'stacked': False,
+        }
+    )
+
+    binned = bin_photometry(data, 10)
+    assert np.isfinite(binned['flux']).all()
+    assert np.isfinite(binned['mjd']).all()
+    # Points that cannot be weighted are kept as they are
+    unbinned = binned[~binned['stacked']]
+    assert sorted(unbinned['fluxerr']) == [0.0, 0.0, np.inf]
+    assert binned['stacked'].sum() == 10
@@ -0,0 +1,35 @@
+import shutil
+
+import pytest
+
+from skyportal.utils.plot_cache import PlotCache
+
+
+@pytest.fixture()
+def plot_cache(tmpdir):
+    cache_path = str(tmpdir / 'plots')
+    yield PlotCache(cache_path, max_items=3, max_memory_items=2)
+    shutil.rmtree(cache_path)
+
+
+def test_plot_cache_hit(plot_cache):
+    key = ('ZTF20aaaaaaa', 'photometry', 600, 300)
+    assert plot_cache[key] is None
+    plot_cache[key] = '{"doc": {}}'
+    assert plot_cache[key] == '{"doc": {}}'
+
+
+def test_plot_cache_memory_is_backed_by_disk(plot_cache):
+    for i in range(3):
+        plot_cache[(f'obj{i}', 'photometry')] = str(i)
+    # Only the two most recent plots are held in memory
+    assert len(plot_cache) == 2
+    assert plot_cache[('obj0', 'photometry')] == '0'
+
+
+def test_plot_cache_invalidate(plot_cache):
+    plot_cache[('obj0', 'photometry')] = '0'
+    plot_cache[('obj1', 'spectroscopy')] = '1'
+    plot_cache.invalidate('obj0')
+    assert len(plot_cache) == 1
+    assert plot_cache[('obj1', 'spectroscopy')] == '1'
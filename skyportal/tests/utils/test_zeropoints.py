@@ -0,0 +1,39 @@
+import numpy as np
+import sncosmo
+
+from skyportal.utils.zeropoints import (
+    get_zeropoint_offset,
+    get_zeropoint_offsets,
+    get_bandpass_color,
+    get_effective_wavelength,
+)
+
+
+def test_zeropoint_offset_matches_sncosmo():
+    ab = sncosmo.get_magsystem('ab')
+    vega = sncosmo.get_magsystem('vega')
+    for band in ['ztfg', 'ztfr', 'ztfi']:
+        expected = 2.5 * np.log10(vega.zpbandflux(band) / ab.zpbandflux(band))
+        np.testing.assert_allclose(get_zeropoint_offset('vega', band), expected)
+        assert get_zeropoint_offset('ab', band) == 0
+
+
+def test_vectorized_zeropoint_offsets():
+    magsys = ['ab', 'vega', 'vega', 'ab']
+    bands = ['ztfg', 'ztfg', 'ztfr', 'ztfr']
+    offsets = get_zeropoint_offsets(magsys, bands)
+    expected = [get_zeropoint_offset(m, b) for m, b in zip(magsys, bands)]
+    np.testing.assert_allclose(offsets, expected)
+
+    np.testing.assert_allclose(
+        get_zeropoint_offsets('vega', bands),
+        [get_zeropoint_offset('vega', b) for b in bands],
+    )
+
+
+def test_bandpass_properties():
+    assert get_bandpass_color('ztfg') == 'green'
+    np.testing.assert_allclose(
+        get_effective_wavelength('sdssg'), sncosmo.get_bandpass('sdssg').wave_eff
+    )
+    assert get_bandpass_color('sdssg').startswith('#')
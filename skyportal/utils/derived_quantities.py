@@ -0,0 +1,183 @@
+"""Quantities derived from the position, redshift and `altdata` of objects,
+computed for many objects at once.
+
+Transforming coordinates and integrating the cosmological distance one
+object at a time dominates the serialization of long source and candidate
+lists, so these functions do a single vectorized galactic transform per
+batch, and look luminosity distances up in a table of the cosmology.
+"""
+
+import numpy as np
+from astropy import coordinates as ap_coord
+from astropy import units as u
+from scipy.interpolate import CubicSpline
+
+# Redshifts below this correspond to recession velocities smaller than
+# peculiar velocities (cz < 350 km/s), for which no distance is given.
+# cf. https://www.aanda.org/articles/aa/full/2003/05/aa3077/aa3077.html
+HUBBLE_FLOW_MIN_REDSHIFT = 350 / 2.99e5
+
+# Range and size of the redshift grid of the luminosity distance tables
+TABLE_MAX_REDSHIFT = 20.0
+TABLE_SIZE = 2000
+
+DERIVED_QUANTITIES = (
+    'gal_lon',
+    'gal_lat',
+    'luminosity_distance',
+    'dm',
+    'angular_diameter_distance',
+)
+
+
+def altdata_luminosity_distance(altdata):
+    """Return the luminosity distance in Mpc given in `altdata` as one of
+    `dm` (mag), `parallax` (arcsec), `dist_kpc`, `dist_Mpc`, `dist_pc` or
+    `dist_cm` (picked up in that order), or None if there is none or it is
+    not a number."""
+    if not altdata:
+        return None
+    try:
+        if altdata.get("dm") is not None:
+            # see eq (24) of https://ned.ipac.caltech.edu/level5/Hogg/Hogg7.html
+            return ((10 ** (float(altdata.get("dm")) / 5.0)) * 1e-5 * u.Mpc).value
+        if altdata.get("parallax") is not None:
+            if float(altdata.get("parallax")) > 0:
+                # assume parallax in arcsec
+                return (1e-6 * u.Mpc / float(altdata.get("parallax"))).value
+
+        if altdata.get("dist_kpc") is not None:
+            return (float(altdata.get("dist_kpc")) * 1e-3 * u.Mpc).value
+        if altdata.get("dist_Mpc") is not None:
+            return (float(altdata.get("dist_Mpc")) * u.Mpc).value
+        if altdata.get("dist_pc") is not None:
+            return (float(altdata.get("dist_pc")) * 1e-6 * u.Mpc).value
+        if altdata.get("dist_cm") is not None:
+            return (float(altdata.get("dist_cm")) * u.Mpc / 3.085e18).value
+    except (TypeError, ValueError):
+        # Treat distances that are not numbers as missing, rather than
+        # failing to save the object
+        return None
+    return None
+
+
+_splines = {}
+
+
+def _luminosity_distance_spline(cosmo):
+    """Cubic spline of log luminosity distance against log redshift in
+    `cosmo`, over the redshifts of the Hubble flow up to
+    `TABLE_MAX_REDSHIFT`. Its relative error is below 1e-10."""
+    # Cosmologies are identified by their parameters
+    key = repr(cosmo)
+    if key not in _splines:
+        z = np.geomspace(HUBBLE_FLOW_MIN_REDSHIFT, TABLE_MAX_REDSHIFT, TABLE_SIZE)
+        d_l = cosmo.luminosity_distance(z).to(u.Mpc).value
+        _splines[key] = CubicSpline(np.log(z), np.log(d_l))
+    return _splines[key]
+
+
+def luminosity_distances(redshift, cosmo, interpolate=True):
+    """Return the luminosity distances in Mpc at `redshift` in `cosmo`.
+
+    Parameters
+    ----------
+    redshift : array-like of float
+        Redshifts, at least `HUBBLE_FLOW_MIN_REDSHIFT`.
+    cosmo : `astropy.cosmology.FLRW`
+        The cosmology.
+    interpolate : bool, optional
+        Whether to interpolate in a table of the cosmology, computed on
+        first use, rather than integrating for every redshift. Redshifts
+        beyond the table are always integrated.
+
+    Returns
+    -------
+    `numpy.ndarray`
+    """
+    redshift = np.asarray(redshift, dtype=float)
+    d_l = np.empty_like(redshift)
+    if interpolate:
+        in_table = redshift <= TABLE_MAX_REDSHIFT
+    else:
+        in_table = np.zeros(redshift.shape, dtype=bool)
+    if in_table.any():
+        spline = _luminosity_distance_spline(cosmo)
+        d_l[in_table] = np.exp(spline(np.log(redshift[in_table])))
+    if (~in_table).any():
+        d_l[~in_table] = cosmo.luminosity_distance(redshift[~in_table]).to(u.Mpc).value
+    return d_l
+
+
+def derived_quantities(ra, dec, redshift, altdata, cosmo, interpolate=True):
+    """Compute the derived quantities of many objects at once.
+
+    Parameters
+    ----------
+    ra, dec : array-like of float or None
+        Positions of the objects, in degrees.
+    redshift : array-like of float or None
+        Redshifts of the objects.
+    altdata : list of dict or None
+        The `altdata` of the objects, which may give their distance.
+    cosmo : `astropy.cosmology.FLRW`
+        The cosmology in which to compute distances from redshifts.
+    interpolate : bool, optional
+        Whether to look luminosity distances up in a table of the cosmology
+        (see `luminosity_distances`).
+
+    Returns
+    -------
+    quantities : list of dict
+        For each object, its galactic longitude and latitude (`gal_lon` and
+        `gal_lat`, in degrees), `luminosity_distance` (Mpc), distance modulus
+        `dm` and `angular_diameter_distance` (Mpc). Quantities that cannot be
+        computed are None.
+    """
+    n = len(altdata)
+    ra = np.array([np.nan if v is None else v for v in ra], dtype=float)
+    dec = np.array([np.nan if v is None else v for v in dec], dtype=float)
+    redshift = np.array([np.nan if v is None else v for v in redshift], dtype=float)
+
+    gal_lon = np.full(n, np.nan)
+    gal_lat = np.full(n, np.nan)
+    has_position = np.isfinite(ra) & np.isfinite(dec)
+    if has_position.any():
+        galactic = ap_coord.SkyCoord(
+            ra[has_position], dec[has_position], unit="deg"
+        ).galactic
+        gal_lon[has_position] = galactic.l.deg
+        gal_lat[has_position] = galactic.b.deg
+
+    # Distances given in altdata take precedence over the redshift
+    d_l = np.array(
+        [altdata_luminosity_distance(a) for a in altdata], dtype=float
+    ).reshape(n)
+    in_hubble_flow = np.isfinite(redshift) & (redshift >= HUBBLE_FLOW_MIN_REDSHIFT)
+    from_redshift = np.isnan(d_l) & in_hubble_flow
+    if from_redshift.any():
+        d_l[from_redshift] = luminosity_distances(
+            redshift[from_redshift], cosmo, interpolate=interpolate
+        )
+
+    has_distance = np.isfinite(d_l) & (d_l > 0)
+    dm = np.full(n, np.nan)
+    dm[has_distance] = 5.0 * np.log10(d_l[has_distance] * 1e5)
+    d_a = np.where(
+        in_hubble_flow, d_l / (1 + np.where(in_hubble_flow, redshift, 0)) ** 2, d_l,
+    )
+    d_a[~has_distance] = np.nan
+
+    columns = {
+        'gal_lon': gal_lon,
+        'gal_lat': gal_lat,
+        'luminosity_distance': d_l,
+        'dm': dm,
+        'angular_diameter_distance': d_a,
+    }
+    # Return None rather than NaN for missing values, and Python floats
+    columns = {
+        key: [None if np.isnan(v) else v for v in values.tolist()]
+        for key, values in columns.items()
+    }
+    return [{key: columns[key][i] for key in DERIVED_QUANTITIES} for i in range(n)]
@@ -0,0 +1,198 @@
+"""HEALPix indexing of sky positions, for cone searches on an index.
+
+Positions are stored as their pixel number in the NESTED scheme at order
+`HEALPIX_ORDER`. In that scheme, the pixels of order `HEALPIX_ORDER`
+contained in a pixel `p` of a coarser order `k` form the contiguous range
+`[p << 2 * (HEALPIX_ORDER - k), (p + 1) << 2 * (HEALPIX_ORDER - k))`, so a
+cone can be looked up on a B-tree index as a union of a few ranges of pixel
+numbers, which is then refined with an exact distance check.
+
+See Górski et al. (2005), ApJ 622, 759 for the definition of the pixelization.
+"""
+
+import numpy as np
+
+# Pixels of order 29 are about 0.4 milliarcseconds across, and their numbers
+# still fit in a 64-bit integer
+HEALPIX_ORDER = 29
+
+# Upper bound on the angular distance between the center of a pixel and any
+# of its points, in radians, times nside (the exact value tends to 1.069)
+_PIXEL_RADIUS = 1.2
+
+# Position and orientation of the 12 base pixels
+_JRLL = np.array([2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4, 4])
+_JPLL = np.array([1, 3, 5, 7, 0, 2, 4, 6, 1, 3, 5, 7])
+
+
+def _spread_bits(x):
+    x = x.astype(np.uint64)
+    x = (x | (x << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    x = (x | (x << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    x = (x | (x << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    x = (x | (x << np.uint64(2))) & np.uint64(0x3333333333333333)
+    x = (x | (x << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return x
+
+
+def _compress_bits(x):
+    x = x.astype(np.uint64) & np.uint64(0x5555555555555555)
+    x = (x | (x >> np.uint64(1))) & np.uint64(0x3333333333333333)
+    x = (x | (x >> np.uint64(2))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    x = (x | (x >> np.uint64(4))) & np.uint64(0x00FF00FF00FF00FF)
+    x = (x | (x >> np.uint64(8))) & np.uint64(0x0000FFFF0000FFFF)
+    x = (x | (x >> np.uint64(16))) & np.uint64(0x00000000FFFFFFFF)
+    return x.astype(np.int64)
+
+
+def ang2pix(ra, dec, order=HEALPIX_ORDER):
+    """Return the NESTED HEALPix pixel numbers of sky positions.
+
+    Parameters
+    ----------
+    ra, dec : float or array-like
+        Right ascension and declination, in degrees.
+    order : int, optional
+        HEALPix order; nside is 2 ** order.
+
+    Returns
+    -------
+    pix : int or `numpy.ndarray` of int64
+    """
+    scalar = np.isscalar(ra) and np.isscalar(dec)
+    ra, dec = np.broadcast_arrays(
+        np.asarray(ra, dtype=float), np.asarray(dec, dtype=float)
+    )
+    nside = 1 << order
+    z = np.sin(np.deg2rad(dec))
+    za = np.abs(z)
+    tt = np.mod(ra, 360.0) / 90.0  # in [0, 4)
+    tt = np.where(tt >= 4.0, 0.0, tt)
+
+    # Equatorial region
+    temp1 = nside * (0.5 + tt)
+    temp2 = nside * z * 0.75
+    jp = (temp1 - temp2).astype(np.int64)
+    jm = (temp1 + temp2).astype(np.int64)
+    ifp = jp >> order
+    ifm = jm >> order
+    face_eq = np.where(ifp == ifm, ifp | 4, np.where(ifp < ifm, ifp, ifm + 8))
+    ix_eq = jm & (nside - 1)
+    iy_eq = nside - (jp & (nside - 1)) - 1
+
+    # Polar caps. nside * sqrt(3 * (1 - |z|)) is computed from cos(dec) to
+    # keep its precision close to the poles.
+    ntt = np.minimum(tt.astype(np.int64), 3)
+    tp = tt - ntt
+    tmp = nside * np.cos(np.deg2rad(dec)) * np.sqrt(3.0 / (1.0 + za))
+    jp_pol = np.minimum((tp * tmp).astype(np.int64), nside - 1)
+    jm_pol = np.minimum(((1.0 - tp) * tmp).astype(np.int64), nside - 1)
+    north = z >= 0
+    face_pol = np.where(north, ntt, ntt + 8)
+    ix_pol = np.where(north, nside - jm_pol - 1, jp_pol)
+    iy_pol = np.where(north, nside - jp_pol - 1, jm_pol)
+
+    equatorial = za <= 2.0 / 3.0
+    face = np.where(equatorial, face_eq, face_pol)
+    ix = np.where(equatorial, ix_eq, ix_pol)
+    iy = np.where(equatorial, iy_eq, iy_pol)
+
+    pix = (face.astype(np.int64) << (2 * order)) + (
+        _spread_bits(ix) | (_spread_bits(iy) << np.uint64(1))
+    ).astype(np.int64)
+    return int(pix) if scalar else pix
+
+
+def pix2ang(pix, order):
+    """Return the right ascensions and declinations, in degrees, of the
+    centers of NESTED HEALPix pixels of order `order`."""
+    pix = np.asarray(pix, dtype=np.int64)
+    nside = 1 << order
+    face = pix >> (2 * order)
+    ipf = pix & ((1 << (2 * order)) - 1)
+    ix = _compress_bits(ipf)
+    iy = _compress_bits(ipf >> 1)
+
+    jr = _JRLL[face] * nside - ix - iy - 1
+    north = jr < nside
+    south = jr > 3 * nside
+    nr = np.where(north, jr, np.where(south, 4 * nside - jr, nside))
+    z = np.where(
+        north,
+        1.0 - nr ** 2 / (3.0 * nside ** 2),
+        np.where(
+            south,
+            nr ** 2 / (3.0 * nside ** 2) - 1.0,
+            (2 * nside - jr) * 2.0 / (3.0 * nside),
+        ),
+    )
+    kshift = np.where(north | south, 0, (jr - nside) & 1)
+    jp = (_JPLL[face] * nr + ix - iy + 1 + kshift) // 2
+    jp = np.where(jp > 4 * nside, jp - 4 * nside, jp)
+    jp = np.where(jp < 1, jp + 4 * nside, jp)
+    ra = (jp - (kshift + 1) * 0.5) * (90.0 / nr)
+    dec = np.rad2deg(np.arcsin(np.clip(z, -1.0, 1.0)))
+    return ra, dec
+
+
+def angular_distance(ra1, dec1, ra2, dec2):
+    """Great-circle distance in radians between positions given in degrees."""
+    ra1, dec1, ra2, dec2 = map(np.deg2rad, (ra1, dec1, ra2, dec2))
+    sin_ddec = np.sin((dec2 - dec1) / 2)
+    sin_dra = np.sin((ra2 - ra1) / 2)
+    a = sin_ddec ** 2 + np.cos(dec1) * np.cos(dec2) * sin_dra ** 2
+    return 2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def cone_ranges(ra, dec, radius, order=HEALPIX_ORDER):
+    """Return ranges of NESTED pixel numbers of order `order` covering a cone.
+
+    Every position within the cone has a pixel number in one of the
+    ranges; positions outside of it may too, so matches need to be checked
+    against the exact distance.
+
+    Parameters
+    ----------
+    ra, dec : float
+        Center of the cone, in degrees.
+    radius : float
+        Radius of the cone, in degrees.
+    order : int, optional
+        HEALPix order of the indexed pixel numbers.
+
+    Returns
+    -------
+    ranges : list of (int, int)
+        Sorted, disjoint, inclusive ranges of pixel numbers.
+    """
+    radius = max(np.deg2rad(radius), 0.0)
+    # Refine down to pixels about a quarter of the radius across, so that
+    # the cover is tight without producing too many ranges
+    if radius > 0:
+        max_order = int(np.clip(np.ceil(np.log2(4 * _PIXEL_RADIUS / radius)), 0, order))
+    else:
+        max_order = order
+
+    ranges = []
+    pix = np.arange(12, dtype=np.int64)
+    for k in range(max_order + 1):
+        pixel_radius = _PIXEL_RADIUS / (1 << k)
+        distance = angular_distance(ra, dec, *pix2ang(pix, k))
+        pix = pix[distance <= radius + pixel_radius]
+        distance = distance[distance <= radius + pixel_radius]
+        done = (distance + pixel_radius <= radius) | (k == max_order)
+        shift = 2 * (order - k)
+        ranges.extend(
+            zip(
+                (pix[done] << shift).tolist(), (((pix[done] + 1) << shift) - 1).tolist()
+            )
+        )
+        pix = (pix[~done][:, None] * 4 + np.arange(4)).ravel()
+
+    merged = []
+    for lo, hi in sorted(ranges):
+        if merged and lo <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], hi)
+        else:
+            merged.append([lo, hi])
+    return [tuple(r) for r in merged]
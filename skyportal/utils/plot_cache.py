@@ -0,0 +1,73 @@
+import collections
+import threading
+
+from .cache import Cache
+
+
+class PlotCache:
+    """Cache of rendered plots, as JSON strings.
+
+    Recently used plots are kept in memory, in front of an on-disk `Cache`
+    shared by the app processes. Entries are keyed by tuples whose first
+    element is the ID of the plotted Obj, and which should include a version
+    of the plotted data, so that plots of modified data are never served
+    from the cache; `invalidate` merely frees the memory of such entries.
+    """
+
+    def __init__(self, cache_dir, max_items=1000, max_memory_items=100):
+        """
+        Parameters
+        ----------
+        cache_dir : Path or str
+            Path to the on-disk cache. Will be created if necessary.
+        max_items : int, optional
+            Maximum number of plots held on disk.
+        max_memory_items : int, optional
+            Maximum number of plots held in memory.
+        """
+        self._disk = Cache(cache_dir=cache_dir, max_items=max_items)
+        self._memory = collections.OrderedDict()
+        self._max_memory_items = max_memory_items
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _name(key):
+        return '/'.join(str(k) for k in key)
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self._max_memory_items:
+                self._memory.popitem(last=False)
+
+    def __getitem__(self, key):
+        """Return the plot cached under `key`, or None."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+        cache_file = self._disk[self._name(key)]
+        if cache_file is None:
+            return None
+        try:
+            value = cache_file.read_text()
+        except FileNotFoundError:
+            # Cleaned up by another process in the meantime
+            return None
+        self._remember(key, value)
+        return value
+
+    def __setitem__(self, key, value):
+        self._remember(key, value)
+        self._disk[self._name(key)] = value.encode('utf-8')
+
+    def invalidate(self, obj_id):
+        """Drop the plots of the Obj with ID `obj_id` from memory."""
+        with self._lock:
+            for key in [key for key in self._memory if key[0] == obj_id]:
+                del self._memory[key]
+
+    def __len__(self):
+        return len(self._memory)
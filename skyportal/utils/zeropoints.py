@@ -0,0 +1,165 @@
+"""Precomputed magnitude system and bandpass properties.
+
+Looking zeropoints up in sncosmo is slow enough to dominate the
+serialization and plotting of large light curves, so the values needed for
+every (magsys, bandpass) pair are computed once and kept in a process-wide
+table. Entries are computed on first use, as some sncosmo bandpasses and
+magnitude systems are downloaded on demand, and the table is persisted to
+disk so that other processes and later runs start with it filled in.
+"""
+
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+import sncosmo
+from matplotlib import cm
+from matplotlib.colors import rgb2hex
+
+from baselayer.log import make_log
+
+from .cache import Cache
+
+log = make_log('zeropoints')
+
+REFERENCE_MAGSYS = 'ab'
+
+cmap_opt = cm.get_cmap('nipy_spectral')
+cmap_uv = cm.get_cmap('cool')
+cmap_ir = cm.get_cmap('autumn')
+
+_cache = Cache(cache_dir='./cache/zeropoints/', max_items=1)
+_cache_key = f'zeropoints-sncosmo-{sncosmo.__version__}'
+_lock = threading.RLock()
+_table = None
+
+
+def _load_table():
+    global _table
+    if _table is None:
+        table = {'zeropoint_offset': {}, 'wave_eff': {}, 'color': {}}
+        cache_file = _cache[_cache_key]
+        if cache_file is not None:
+            try:
+                with open(cache_file) as f:
+                    cached = json.load(f)
+                for key in table:
+                    table[key].update(cached.get(key, {}))
+            except (OSError, ValueError) as e:
+                log(f'Ignoring unreadable zeropoint cache: {e}')
+        _table = table
+    return _table
+
+
+def _save_table(table):
+    try:
+        _cache[_cache_key] = json.dumps(table).encode('utf-8')
+    except OSError as e:
+        log(f'Could not write zeropoint cache: {e}')
+
+
+def _compute_color(bandpass):
+    if bandpass.startswith('ztf'):
+        return {'ztfg': 'green', 'ztfi': 'orange', 'ztfr': 'red'}[bandpass]
+
+    wave = get_effective_wavelength(bandpass)
+    if 0 < wave < 3000:
+        cmap = cmap_uv
+        cmap_limits = (0, 3000)
+    elif 3000 <= wave <= 10000:
+        cmap = cmap_opt
+        cmap_limits = (3000, 10000)
+    elif 10000 < wave < 1e5:
+        wave = np.log10(wave)
+        cmap = cmap_ir
+        cmap_limits = (4, 5)
+    else:
+        raise ValueError('wavelength out of range for color maps')
+
+    rgb = cmap((cmap_limits[1] - wave) / (cmap_limits[1] - cmap_limits[0]))[:3]
+    return rgb2hex(rgb)
+
+
+def _lookup(kind, key, compute):
+    table = _load_table()
+    value = table[kind].get(key)
+    if value is None:
+        with _lock:
+            value = table[kind].get(key)
+            if value is None:
+                value = compute()
+                table[kind][key] = value
+                _save_table(table)
+    return value
+
+
+def get_zeropoint_offset(magsys, bandpass):
+    """Return the offset between the zeropoints of `magsys` and AB in
+    `bandpass`, in magnitudes.
+
+    A flux `f` with zeropoint `zp` in `magsys` corresponds to the flux
+    `f * 10 ** (0.4 * (zp_ab - zp + offset))` with zeropoint `zp_ab` in the
+    AB system, and a magnitude in AB corresponds to that magnitude plus
+    the offset in `magsys`.
+
+    Parameters
+    ----------
+    magsys : str
+        Name of an sncosmo magnitude system.
+    bandpass : str
+        Name of an sncosmo bandpass.
+
+    Returns
+    -------
+    offset : float
+        2.5 * log10 of the ratio of the zeropoint bandfluxes of `magsys`
+        and AB in `bandpass`.
+    """
+
+    def compute():
+        ms = sncosmo.get_magsystem(magsys)
+        reference = sncosmo.get_magsystem(REFERENCE_MAGSYS)
+        return float(
+            2.5 * np.log10(ms.zpbandflux(bandpass) / reference.zpbandflux(bandpass))
+        )
+
+    return _lookup('zeropoint_offset', f'{magsys}/{bandpass}', compute)
+
+
+def get_zeropoint_offsets(magsys, bandpass):
+    """Vectorized version of `get_zeropoint_offset`.
+
+    Parameters
+    ----------
+    magsys : str or array-like of str
+        Magnitude system(s), broadcast against `bandpass`.
+    bandpass : array-like of str
+        Bandpass of each point.
+
+    Returns
+    -------
+    offsets : `numpy.ndarray`
+        The zeropoint offset of each point, computed once per distinct
+        (magsys, bandpass) pair.
+    """
+    magsys, bandpass = np.broadcast_arrays(
+        np.asarray(magsys, dtype=object), np.asarray(bandpass, dtype=object)
+    )
+    keys = pd.DataFrame({'magsys': magsys.ravel(), 'bandpass': bandpass.ravel()})
+    offsets = np.empty(len(keys), dtype=float)
+    for (ms, band), index in keys.groupby(['magsys', 'bandpass']).indices.items():
+        offsets[index] = get_zeropoint_offset(ms, band)
+    return offsets.reshape(bandpass.shape)
+
+
+def get_effective_wavelength(bandpass):
+    """Return the effective wavelength of `bandpass`, in Angstroms."""
+    return _lookup(
+        'wave_eff', bandpass, lambda: float(sncosmo.get_bandpass(bandpass).wave_eff),
+    )
+
+
+def get_bandpass_color(bandpass):
+    """Return the hex color used to plot photometry in `bandpass`."""
+    return _lookup('color', bandpass, lambda: _compute_color(bandpass))
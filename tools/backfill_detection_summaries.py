@@ -0,0 +1,51 @@
+"""Recompute the detection summary columns of all Objs (first and last
+detection MJD, number of detections and peak flux per filter) from their
+photometry, e.g. after photometry was modified in bulk outside of the app.
+Objects are processed in chunks, in order of ID, with a commit per chunk,
+so the backfill can be interrupted and resumed with --after.
+"""
+
+import argparse
+import time
+
+from baselayer.app.env import load_env
+from skyportal.models import init_db, DBSession, Obj, refresh_detection_summaries
+
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument(
+    '--chunk-size', type=int, default=1000, help='Number of objects per chunk'
+)
+parser.add_argument(
+    '--after', default=None, help='Only process objects with an ID after this one'
+)
+
+
+if __name__ == "__main__":
+    args, _ = parser.parse_known_args()
+
+    env, cfg = load_env()
+    init_db(**cfg["database"])
+
+    last_id = args.after
+    n_done = 0
+    start = time.time()
+    while True:
+        q = DBSession().query(Obj.id).order_by(Obj.id)
+        if last_id is not None:
+            q = q.filter(Obj.id > last_id)
+        obj_ids = [obj_id for obj_id, in q.limit(args.chunk_size)]
+        if not obj_ids:
+            break
+
+        refresh_detection_summaries(obj_ids)
+        DBSession().commit()
+
+        n_done += len(obj_ids)
+        last_id = obj_ids[-1]
+        print(
+            f"Refreshed {n_done} objects ({n_done / (time.time() - start):.0f}/s), "
+            f"last ID: {last_id}"
+        )
+
+    print(f"Backfilled the detection summaries of {n_done} objects.")